@@ -1,26 +1,28 @@
 # app/auth.py
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from .config import GOOGLE_CLIENT_ID, JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRES_MINUTES
+from .google_verifier import get_google_verifier
+from .config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRES_MINUTES, JWT_ACCESS_MINUTES, JWT_REFRESH_MINUTES
 import jwt
 import datetime
+import uuid
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .db import supabase_client
-from .crud import get_user_by_email, _normalize_user_row
+from .crud_async import get_user_by_email, get_user_by_id
+from .cache import cached_user, cache_user
+from .revocation import revocations
 
 def verify_google_token(token: str):
     try:
-        idinfo = id_token.verify_oauth2_token(token, google_requests.Request(), GOOGLE_CLIENT_ID)
+        # certs are cached and the signature is checked locally (app/google_verifier.py)
+        idinfo = get_google_verifier().verify(token)
         # idinfo includes email, name, sub (google unique id), picture, ...
         return idinfo
     except Exception as e:
         print("Google verify failed:", e)
         return None
 
-def create_jwt(payload: dict):
+def create_jwt(payload: dict, expires_minutes: int = None):
     now = datetime.datetime.utcnow()
-    exp = now + datetime.timedelta(minutes=int(JWT_EXPIRES_MINUTES))
+    exp = now + datetime.timedelta(minutes=int(JWT_EXPIRES_MINUTES if expires_minutes is None else expires_minutes))
     body = payload.copy()
     body.update({"iat": now, "exp": exp})
     token = jwt.encode(body, JWT_SECRET, algorithm=JWT_ALGORITHM)
@@ -28,38 +30,96 @@ def create_jwt(payload: dict):
         token = token.decode()
     return token
 
-security = HTTPBearer()
+def issue_tokens(user: dict) -> dict:
+    """Self-contained access token (normalized user in the claims) plus a refresh token.
+
+    Access tokens live JWT_ACCESS_MINUTES and are accepted without a user lookup;
+    access tokens carry the user's revocation epoch (app/revocation.py).
+    """
+    user_id = user.get("User_id") or user.get("id")
+    email = user.get("email")
+    epoch = revocations.epoch(user_id)
+    access = create_jwt({
+        "typ": "access",
+        "jti": uuid.uuid4().hex,
+        "ep": epoch,
+        "user_id": user_id,
+        "email": email,
+        "name": user.get("displayName") or user.get("name"),
+        "role": user.get("role") or "student",
+    }, JWT_ACCESS_MINUTES)
+    refresh = create_jwt({"typ": "refresh", "jti": uuid.uuid4().hex, "user_id": user_id, "email": email}, JWT_REFRESH_MINUTES)
+    return {"access_token": access, "refresh_token": refresh, "expires_in": int(JWT_ACCESS_MINUTES) * 60}
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+def decode_jwt(token: str, expected_type: str = None) -> dict:
+    """Verified claims; raises HTTPException(401) if invalid, revoked or of another token type."""
     try:
         data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if expected_type and data.get("typ") != expected_type:
+        raise HTTPException(status_code=401, detail="Wrong token type")
+    if data.get("typ") and revocations.is_revoked(data, check_epoch=data.get("typ") == "access"):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return data
+
+def _user_from_claims(data: dict) -> dict:
+    return {
+        "User_id": data.get("user_id"),
+        "id": data.get("user_id"),
+        "email": data.get("email"),
+        "displayName": data.get("name"),
+        "name": data.get("name"),
+        "role": data.get("role") or "student",
+    }
+
+security = HTTPBearer()
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_user(credentials.credentials)
+
+async def resolve_user(token: str):
+    """Normalized user for a bearer token; raises HTTPException(401/503) like the dependency."""
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    data = decode_jwt(token)
+    if data.get("typ") == "refresh":
+        raise HTTPException(status_code=401, detail="Wrong token type")
+    if data.get("typ") == "access":
+        # self-contained token: the signed claims are the user, no lookup needed
+        return _user_from_claims(data)
     user_id = data.get("user_id")
     email = data.get("email")
     if not user_id and not email:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    # Try multiple table and column name variants to locate the user row.
-    table_names = ("User", "users", "users_table")
-    id_columns = ("User_id", "user_id", "id", "UserId")
-    # If we have a user_id, try to find by id across tables/columns
+    # Serve from the resolved-user cache when possible; entries are evicted by
+    # crud.upsert_user / crud.update_user_role and otherwise expire after a short TTL.
+    if user_id:
+        cached = cached_user(("id", str(user_id)))
+        if cached:
+            return cached
+    elif email:
+        cached = cached_user(("email", str(email).lower()))
+        if cached:
+            return cached
+
+    # One query against the user table/id column resolved at startup (app/schema.py)
     if user_id:
-        for table in table_names:
-            for col in id_columns:
-                try:
-                    res = supabase_client.table(table).select("*").eq(col, user_id).execute()
-                except Exception:
-                    res = None
-                if res and getattr(res, 'data', None):
-                    return _normalize_user_row(res.data[0])
+        try:
+            user = await get_user_by_id(user_id)
+        except Exception:
+            user = None
+        if user:
+            cache_user(user, ("id", str(user_id)))
+            return user
 
-    # Fallback: try by email using existing helper which itself checks multiple tables
+    # Fallback: tokens issued before an id column change still carry the email
     if email:
         try:
-            user = get_user_by_email(email)
+            user = await get_user_by_email(email)
             if user:
+                cache_user(user, ("id", str(user_id)) if user_id else None)
                 return user
         except Exception:
             # If lookup failed due to Supabase, surface as 503
@@ -68,7 +128,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     # Not found
     raise HTTPException(status_code=401, detail="User not found")
 
-def require_admin(user=Depends(get_current_user)):
+async def require_admin(user=Depends(get_current_user)):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return user
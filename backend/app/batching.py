@@ -0,0 +1,236 @@
+# app/batching.py
+"""Write-behind buffering for high-volume, append-only writes.
+
+Callers enqueue rows and return immediately; a background thread coalesces them
+per key (e.g. per attempt) and writes them with one bulk insert once `max_batch`
+rows are pending or `max_delay` seconds have passed. `stop()` performs a final
+flush, and is called from the app shutdown hook.
+
+A failed write keeps its rows at the head of the queue and is retried with
+exponential backoff (max_delay doubling up to max_backoff), so a database outage
+delays rows rather than losing them. The only loss is when more than `max_queue`
+rows are waiting: the oldest are shed, counted in `dropped` (the
+orivon_buffer_dropped_rows_total metric) and logged.
+"""
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, List
+
+from .config import PROCTOR_BUFFER_MAX_BATCH, PROCTOR_BUFFER_MAX_DELAY_SECONDS, PROCTOR_BUFFER_MAX_QUEUE
+from .crud import add_proctor_events
+
+logger = logging.getLogger(__name__)
+
+_registry = []
+
+
+class WriteBehindBuffer:
+    def __init__(self, name: str, flush_fn: Callable[[List[Any]], Any], key_fn: Callable[[Any], Hashable] = None,
+                 max_batch: int = 500, max_delay: float = 1.0, max_queue: int = 100_000, max_backoff: float = 60.0):
+        self.name = name
+        self.flush_fn = flush_fn
+        # recovers an item's key when a failed batch is put back in the queue
+        self.key_fn = key_fn or (lambda item: None)
+        self.max_batch = max(int(max_batch), 1)
+        self.max_delay = float(max_delay)
+        self.max_queue = max(int(max_queue), self.max_batch)
+        self.max_backoff = max(float(max_backoff), self.max_delay)
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        self._shed_logged_at = 0.0
+        self._pending: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        _registry.append(self)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=f"flush-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flusher thread and write out everything still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        self.flush(force=True)
+
+    def add(self, key: Hashable, item: Any) -> None:
+        self.add_many(key, (item,))
+
+    def add_many(self, key: Hashable, items: Iterable[Any]) -> int:
+        items = list(items)
+        if not items:
+            return 0
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            self._pending.setdefault(key, []).extend(items)
+            self._depth += len(items)
+            self.enqueued += len(items)
+            self._trim_locked()
+            full = self._depth >= self.max_batch
+        if full:
+            self._wakeup.set()
+        return len(items)
+
+    def _trim_locked(self) -> None:
+        # Bound memory if the database is unreachable for a long time: shed the oldest rows.
+        shed = 0
+        while self._depth > self.max_queue and self._pending:
+            key, rows = next(iter(self._pending.items()))
+            excess = min(len(rows), self._depth - self.max_queue)
+            del rows[:excess]
+            self._depth -= excess
+            shed += excess
+            if not rows:
+                del self._pending[key]
+        if shed:
+            self.dropped += shed
+            now = time.monotonic()
+            if now - self._shed_logged_at >= 10:
+                self._shed_logged_at = now
+                logger.error("%s: queue over %d rows, shed the oldest (%d dropped so far)", self.name, self.max_queue, self.dropped)
+
+    def _take(self) -> List[Any]:
+        """Pop up to max_batch rows, keeping each key's rows together and in order."""
+        batch: List[Any] = []
+        with self._lock:
+            while self._pending and len(batch) < self.max_batch:
+                key, rows = next(iter(self._pending.items()))
+                room = self.max_batch - len(batch)
+                batch.extend(rows[:room])
+                if len(rows) > room:
+                    del rows[:room]
+                else:
+                    del self._pending[key]
+            self._depth -= len(batch)
+        return batch
+
+    def _requeue(self, batch: List[Any]) -> None:
+        with self._lock:
+            restored: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+            for item in batch:
+                restored.setdefault(self.key_fn(item), []).append(item)
+            for key, rows in self._pending.items():
+                restored.setdefault(key, []).extend(rows)
+            self._pending = restored
+            self._depth += len(batch)
+            self._trim_locked()
+
+    def flush(self, force: bool = False) -> int:
+        """Write out all pending rows now, unless backing off after a failure. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            if not force and time.monotonic() < self._retry_at:
+                return written
+            while True:
+                batch = self._take()
+                if not batch:
+                    return written
+                t0 = time.perf_counter()
+                try:
+                    self.flush_fn(batch)
+                except Exception as e:
+                    self.failures += 1
+                    self._consecutive_failures += 1
+                    backoff = min(self.max_delay * 2 ** (self._consecutive_failures - 1), self.max_backoff)
+                    self._retry_at = time.monotonic() + backoff
+                    logger.warning("%s: bulk write of %d rows failed (%d in a row), retrying in %.1fs: %s",
+                                   self.name, len(batch), self._consecutive_failures, backoff, e)
+                    self._requeue(batch)
+                    return written
+                self._consecutive_failures = 0
+                self._retry_at = 0.0
+                elapsed = (time.perf_counter() - t0) * 1000
+                self.flushes += 1
+                self.flushed += len(batch)
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+                self._total_flush_ms += elapsed
+                written += len(batch)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("%s: flusher error: %s", self.name, e)
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "queue_depth": self._depth,
+            "pending_keys": len(self._pending),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "consecutive_failures": self._consecutive_failures,
+            "retry_in_seconds": round(max(self._retry_at - time.monotonic(), 0.0), 3),
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+def buffer_stats() -> list:
+    return [b.stats() for b in _registry]
+
+
+def start_buffers() -> None:
+    for b in _registry:
+        b.start()
+
+
+def stop_buffers() -> None:
+    for b in _registry:
+        b.stop()
+
+
+proctor_event_buffer = WriteBehindBuffer(
+    "proctor_events",
+    add_proctor_events,
+    key_fn=lambda row: row["attempt_id"],
+    max_batch=PROCTOR_BUFFER_MAX_BATCH,
+    max_delay=PROCTOR_BUFFER_MAX_DELAY_SECONDS,
+    max_queue=PROCTOR_BUFFER_MAX_QUEUE,
+)
+
+
+def enqueue_proctor_events(attempt_id, events: Iterable[tuple]) -> int:
+    """Queue (event_type, metadata) pairs for an attempt; timestamps are taken at enqueue time."""
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    rows = [
+        {"attempt_id": attempt_id, "event_type": event_type, "metadata": metadata or {}, "created_at": now}
+        for event_type, metadata in events
+    ]
+    return proctor_event_buffer.add_many(attempt_id, rows)
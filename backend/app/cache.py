@@ -0,0 +1,365 @@
+# app/cache.py
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import logging
+from .config import (
+    USER_CACHE_TTL_SECONDS,
+    USER_CACHE_MAX_ENTRIES,
+    CERT_CACHE_TTL_SECONDS,
+    CERT_CACHE_MAX_ENTRIES,
+    CACHE_BACKEND,
+    SHARED_CACHE_LOCAL_MAX_ENTRIES,
+)
+from .shared_cache import SharedStore, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_registry = []
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Keeps hit/miss/eviction counters so the cache can be sized from real traffic.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60.0, register: bool = True):
+        self.name = name
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if register:
+            _registry.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like get(), but does not touch LRU order or the hit/miss counters."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class SharedCache:
+    """TTLCache-compatible cache whose entries live in a SharedStore (app/shared_cache.py).
+
+    Every worker on the host reads and writes the same entries; decoded values are
+    also kept in a small per-worker TTLCache in front of the store, which the
+    store's invalidation feed keeps in step with deletes made by other workers.
+    A hit on that copy does no I/O, and writes only queue work for the store's
+    background thread, so async handlers can call the cache directly.
+    Keys are JSON-encoded and values pickled. If the store cannot be reached the
+    cache degrades to the per-worker copy instead of failing the request.
+    """
+
+    def __init__(self, name: str, store: SharedStore, maxsize: int = 1024, ttl: float = 60.0,
+                 local_maxsize: int = SHARED_CACHE_LOCAL_MAX_ENTRIES):
+        self.name = name
+        self.store = store
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = float(ttl)
+        self._local = TTLCache(name, maxsize=min(max(int(local_maxsize), 1), self.maxsize), ttl=ttl, register=False)
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        store.register(name, self._on_invalidate, self.maxsize)
+        _registry.append(self)
+
+    @staticmethod
+    def _encode(key: Hashable) -> str:
+        return json.dumps(key, separators=(",", ":"), default=str)
+
+    def _on_invalidate(self, key: Optional[str]) -> None:
+        if key is None:
+            self._local.clear()
+        else:
+            self._local.delete(key)
+
+    def _load(self, k: str) -> Any:
+        try:
+            found = self.store.get(self.name, k)
+            if found is None:
+                return _MISSING
+            blob, ttl_left = found
+            value = pickle.loads(blob)
+        except Exception as e:
+            logger.warning("shared cache %s: read failed: %s", self.name, e)
+            return _MISSING
+        # the local copy must not outlive the shared entry
+        self._local.set(k, value, ttl=ttl_left)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        k = self._encode(key)
+        value = self._local.get(k, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            self.local_hits += 1
+            return value
+        value = self._load(k)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        k = self._encode(key)
+        value = self._local.peek(k, _MISSING)
+        if value is _MISSING:
+            value = self._load(k)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else float(ttl)
+        k = self._encode(key)
+        self._local.set(k, value, ttl=ttl)
+        try:
+            self.store.set(self.name, k, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+        except Exception as e:
+            logger.warning("shared cache %s: write failed, kept in this worker only: %s", self.name, e)
+
+    def delete(self, *keys: Hashable) -> None:
+        encoded = [self._encode(key) for key in keys]
+        self._local.delete(*encoded)
+        try:
+            self.store.delete(self.name, encoded)
+        except Exception as e:
+            logger.warning("shared cache %s: delete failed, other workers keep their copy until the TTL: %s", self.name, e)
+
+    def clear(self) -> None:
+        self._local.clear()
+        try:
+            self.store.clear(self.name)
+        except Exception as e:
+            logger.warning("shared cache %s: clear failed: %s", self.name, e)
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "backend": "sqlite",
+            "size": len(self._local),
+            "shared_size": self.store.count(self.name),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "evictions": self._local.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            **self.store.stats(),
+        }
+
+
+def make_cache(name: str, maxsize: int = 1024, ttl: float = 60.0):
+    """Cache for data every worker looks up: per process, or host-wide with CACHE_BACKEND=sqlite."""
+    if CACHE_BACKEND == "sqlite":
+        return SharedCache(name, get_shared_store(), maxsize=maxsize, ttl=ttl)
+    if CACHE_BACKEND != "memory":
+        logger.warning("Unknown CACHE_BACKEND %r, using the in-process cache", CACHE_BACKEND)
+    return TTLCache(name, maxsize=maxsize, ttl=ttl)
+
+
+class RefreshingSnapshot:
+    """A single cached value rebuilt by `loader`.
+
+    Reads never wait once a value exists: after `ttl` seconds the stale value is still
+    returned while one background thread reloads it. Only a missing value, or one older
+    than `max_stale`, is loaded synchronously.
+    """
+
+    def __init__(self, name: str, loader, ttl: float = 30.0, max_stale: float = 300.0):
+        self.name = name
+        self.loader = loader
+        self.ttl = float(ttl)
+        self.max_stale = max(float(max_stale), self.ttl)
+        self._value: Any = _MISSING
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        _registry.append(self)
+
+    def _load(self) -> Any:
+        value = self.loader()
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+        return value
+
+    def _refresh_in_background(self) -> None:
+        def run():
+            try:
+                self._load()
+            except Exception as e:
+                logger.warning("Background refresh of %s failed: %s", self.name, e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name=f"refresh-{self.name}", daemon=True).start()
+
+    def get(self) -> Any:
+        age = time.monotonic() - self._loaded_at
+        if self._value is _MISSING or age > self.max_stale:
+            self.misses += 1
+            return self._load()
+        self.hits += 1
+        if age > self.ttl:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                self._refresh_in_background()
+        return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = _MISSING
+            self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "age_seconds": (time.monotonic() - self._loaded_at) if self._value is not _MISSING else None,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+# Normalized user rows keyed by ("id", user_id) and ("email", email).
+user_cache = make_cache("users", maxsize=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS)
+
+# crud.get_cert results (the matching rows) keyed by certification id.
+cert_cache = make_cache("certifications", maxsize=CERT_CACHE_MAX_ENTRIES, ttl=CERT_CACHE_TTL_SECONDS)
+
+
+def cached_user(key: tuple) -> Optional[dict]:
+    """Copy of the user row cached under ("id", user_id) or ("email", email), or None.
+
+    Callers get their own dict, so route code may modify it without touching the cache.
+    """
+    cached = user_cache.get(key)
+    return dict(cached) if cached else None
+
+
+def cache_user(user: dict, *extra_keys: Optional[tuple]) -> None:
+    """Store (a copy of) a normalized user row under its id, its email and any non-None `extra_keys`."""
+    if not user:
+        return
+    user = dict(user)
+    for key in extra_keys:
+        if key:
+            user_cache.set(key, user)
+    user_id = user.get("User_id") or user.get("id")
+    email = user.get("email")
+    if user_id:
+        user_cache.set(("id", str(user_id)), user)
+    if email:
+        user_cache.set(("email", str(email).lower()), user)
+
+
+def invalidate_user(user_id: str = None, email: str = None) -> None:
+    """Drop a user from the cache. Either key is enough; the sibling key is dropped too."""
+    keys = []
+    for key in ((("id", str(user_id)) if user_id else None), (("email", str(email).lower()) if email else None)):
+        if key is None:
+            continue
+        keys.append(key)
+        cached = user_cache.peek(key)
+        if cached:
+            other_id = cached.get("User_id") or cached.get("id")
+            other_email = cached.get("email")
+            if other_id:
+                keys.append(("id", str(other_id)))
+            if other_email:
+                keys.append(("email", str(other_email).lower()))
+    user_cache.delete(*keys)
+
+
+def cached_cert(cert_id: str) -> Optional[list]:
+    """Copies of the certification rows cached for `cert_id`, or None."""
+    cached = cert_cache.get(str(cert_id))
+    return [dict(row) for row in cached] if cached else None
+
+
+def cache_cert(cert_id: str, rows: list) -> None:
+    cert_cache.set(str(cert_id), [dict(row) for row in rows])
+
+
+def invalidate_cert(cert_id: str) -> None:
+    cert_cache.delete(str(cert_id))
+
+
+def cache_stats() -> list:
+    return [c.stats() for c in _registry]
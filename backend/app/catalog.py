@@ -0,0 +1,76 @@
+# app/catalog.py
+"""Cached course and certification catalog with HTTP validators.
+
+Catalog responses are serialized once per (section, key, version) and kept for
+CATALOG_CACHE_TTL_SECONDS together with a strong ETag (hash of the exact body), so
+a page view is a dict lookup and browsers/CDNs revalidate with If-None-Match and
+get a bodiless 304. Admin writes call `bump()` so the next request rebuilds;
+other workers pick the change up when their TTL expires.
+"""
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+
+from .cache import TTLCache
+from .config import CATALOG_CACHE_TTL_SECONDS, CATALOG_HTTP_MAX_AGE_SECONDS
+
+COURSES = "courses"
+CERTIFICATIONS = "certifications"
+
+
+class CatalogEntry:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+class Catalog:
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL_SECONDS):
+        self._cache = TTLCache("catalog", maxsize=2048, ttl=ttl)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, section: str) -> int:
+        return self._versions.get(section, 0)
+
+    def bump(self, section: str) -> None:
+        with self._lock:
+            self._versions[section] = self.version(section) + 1
+
+    def get(self, section: str, key: Hashable, loader: Callable[[], object]) -> Optional[CatalogEntry]:
+        """Cached entry for `loader()`'s result; a None result (not found) is returned as None and not cached."""
+        version = self.version(section)
+        cache_key = (section, key, version)
+        entry = self._cache.get(cache_key)
+        if entry is not None:
+            return entry
+        data = loader()
+        if data is None:
+            return None
+        entry = CatalogEntry(json.dumps(data, separators=(",", ":"), default=str).encode())
+        if version == self.version(section):
+            self._cache.set(cache_key, entry)
+        return entry
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (t.strip() for t in header.split(","))
+
+
+def catalog_response(request: Request, entry: CatalogEntry) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={CATALOG_HTTP_MAX_AGE_SECONDS}"}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+catalog = Catalog()
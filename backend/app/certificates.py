@@ -0,0 +1,238 @@
+# app/certificates.py
+"""Server-side certificate rendering.
+
+The template image, the resolved font file and the per-size font objects are
+loaded once per process; text is fitted by binary search over the allowed font
+sizes instead of reloading fonts in a shrink loop, and finished PNGs are cached
+by (template hash, certificate name, user name). Pillow itself is imported by the
+first renderer built, not at startup.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from .cache import TTLCache
+from .config import CERT_RENDER_CACHE_SIZE, CERT_RENDER_CACHE_TTL_SECONDS, CERT_PNG_COMPRESS_LEVEL, CERT_RENDER_WORKERS
+from .lazy import optional_import
+
+# Pillow modules, bound by pil_available() on first use
+Image = ImageDraw = ImageFont = None
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'certificate.png')
+
+FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+    'arial.ttf',
+)
+
+TEXT_COLOR = (15, 23, 42, 255)
+OUTLINE_COLOR = (255, 255, 255, 230)
+
+# Layout matching the frontend certificate: (centre y, max width margin, sizes largest -> smallest, outline offset)
+TITLE_LAYOUT = (460, 300, tuple(range(56, 18, -2)), 2)
+NAME_LAYOUT = (670, 320, tuple(range(40, 12, -1)), 1)
+
+
+def pil_available() -> bool:
+    """Import Pillow if it has not been yet; False when it is not installed."""
+    global Image, ImageDraw, ImageFont
+    if Image is None:
+        modules = [optional_import(name) for name in ("PIL.ImageDraw", "PIL.ImageFont", "PIL.Image")]
+        if None in modules:
+            return False
+        # Image last: it is the flag other threads check
+        ImageDraw, ImageFont, Image = modules
+    return True
+
+
+class CertificateRenderer:
+    def __init__(self, template_path: str = TEMPLATE_PATH, font_candidates: Sequence[str] = FONT_CANDIDATES,
+                 cache_size: int = CERT_RENDER_CACHE_SIZE, cache_ttl: float = CERT_RENDER_CACHE_TTL_SECONDS):
+        if not pil_available():
+            raise RuntimeError("Pillow is not installed on the server")
+        with open(template_path, 'rb') as f:
+            raw = f.read()
+        self.template_hash = hashlib.sha256(raw).hexdigest()[:16]
+        self.template = Image.open(io.BytesIO(raw)).convert('RGBA')
+        self.template.load()
+        self.font_path = self._resolve_font_path(font_candidates)
+        self._fonts: Dict[int, object] = {}
+        self._fonts_lock = threading.Lock()
+        self.cache = TTLCache("certificates", maxsize=cache_size, ttl=cache_ttl)
+
+    @staticmethod
+    def _resolve_font_path(candidates: Sequence[str]) -> Optional[str]:
+        for c in candidates:
+            try:
+                ImageFont.truetype(c, 12)
+                return c
+            except Exception:
+                continue
+        return None
+
+    def font(self, size: int):
+        """Font object for `size`, built once and kept in the font-size table."""
+        font = self._fonts.get(size)
+        if font is None:
+            with self._fonts_lock:
+                font = self._fonts.get(size)
+                if font is None:
+                    font = ImageFont.truetype(self.font_path, size) if self.font_path else ImageFont.load_default()
+                    self._fonts[size] = font
+        return font
+
+    @staticmethod
+    def _measure(draw, text: str, font) -> Tuple[int, int]:
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        return right - left, bottom - top
+
+    def fit(self, draw, text: str, sizes: Sequence[int], max_width: int):
+        """Largest size in `sizes` (sorted descending) whose rendered width fits, by binary search.
+
+        Falls back to the smallest size when nothing fits. Returns (font, width, height).
+        """
+        lo, hi = 0, len(sizes) - 1
+        best = hi
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            w, _ = self._measure(draw, text, self.font(sizes[mid]))
+            if w <= max_width:
+                best = mid
+                hi = mid - 1
+            else:
+                lo = mid + 1
+        font = self.font(sizes[best])
+        w, h = self._measure(draw, text, font)
+        return font, w, h
+
+    def _draw_centered(self, draw, text: str, layout, width: int) -> None:
+        center_y, margin, sizes, offset = layout
+        font, w, h = self.fit(draw, text, sizes, width - margin)
+        x = (width - w) / 2
+        y = center_y - (h / 2)
+        # outline by drawing slightly offset white copies underneath
+        for ox, oy in ((-offset, -offset), (-offset, offset), (offset, -offset), (offset, offset)):
+            draw.text((x + ox, y + oy), text, font=font, fill=OUTLINE_COLOR)
+        draw.text((x, y), text, font=font, fill=TEXT_COLOR)
+
+    def _render(self, cert_name: str, user_name: str) -> bytes:
+        img = self.template.copy()
+        draw = ImageDraw.Draw(img)
+        width = img.size[0]
+        self._draw_centered(draw, cert_name, TITLE_LAYOUT, width)
+        self._draw_centered(draw, user_name, NAME_LAYOUT, width)
+        bio = io.BytesIO()
+        img.convert('RGB').save(bio, format='PNG', compress_level=CERT_PNG_COMPRESS_LEVEL)
+        return bio.getvalue()
+
+    def render(self, cert_name: str, user_name: str) -> bytes:
+        """PNG bytes for the certificate, served from the render cache when possible."""
+        key = (self.template_hash, cert_name, user_name)
+        png = self.cache.get(key)
+        if png is None:
+            png = self._render(cert_name, user_name)
+            self.cache.set(key, png)
+        return png
+
+
+_renderer: Optional[CertificateRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> CertificateRenderer:
+    """Process-wide renderer; the template and fonts are loaded on first use."""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = CertificateRenderer()
+    return _renderer
+
+
+def render_certificate_png(cert_name: str, user_name: str) -> bytes:
+    """Picklable entry point for pool workers; each worker process keeps its own renderer."""
+    return get_renderer().render(cert_name, user_name)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Process pool for bulk rendering, sized to the cores unless CERT_RENDER_WORKERS is set.
+
+    Rendering is CPU-bound Pillow work that holds the GIL, so batches run in worker
+    processes rather than on request threads. The pool is created on first use, when
+    the server already runs threads (event loop, DB pool, outbox, buffers), so workers
+    are started by forkserver (spawn where that is unavailable) instead of forking this
+    process with locks that may be held.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(max_workers=CERT_RENDER_WORKERS or os.cpu_count() or 1, initializer=get_renderer,
+                                            mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only sink that hands back whatever has been written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _entry_name(index: int, user_email: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._@-]+", "_", user_email or "certificate")
+    return f"{index + 1:04d}_{safe}.png"
+
+
+def iter_certificate_zip(grants: Iterable[Tuple[str, str, str]], chunksize: int = 4) -> Iterator[bytes]:
+    """Render (user_email, user_name, cert_name) grants in the process pool and yield a ZIP stream.
+
+    Each PNG is added to the archive as soon as its render completes (in input order),
+    so the client starts receiving bytes before the whole batch is done.
+    """
+    grants = list(grants)
+    results = get_render_pool().map(
+        render_certificate_png,
+        [g[2] for g in grants],
+        [g[1] for g in grants],
+        chunksize=max(1, chunksize),
+    )
+    sink = _ChunkBuffer()
+    # PNGs are already deflated, so store them as-is
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for index, png in enumerate(results):
+            zf.writestr(_entry_name(index, grants[index][0]), png)
+            yield sink.drain()
+    yield sink.drain()
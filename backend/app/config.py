@@ -34,3 +34,118 @@ SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "true").lower() in ("1", "true", "
 SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY")
 # Optional 'from' address to use when sending via SendGrid. If not set, code will attempt to use SMTP_USER or admin email.
 SENDGRID_FROM = os.environ.get("SENDGRID_FROM")
+
+# Cache of resolved user rows used by auth.get_current_user
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+# Certification rows behind crud.get_cert (create_order, certification pages); evicted on update/delete
+CERT_CACHE_TTL_SECONDS = float(os.environ.get("CERT_CACHE_TTL_SECONDS", "300"))
+CERT_CACHE_MAX_ENTRIES = int(os.environ.get("CERT_CACHE_MAX_ENTRIES", "1000"))
+
+# Backend of the user, certification and question caches (app/cache.py:make_cache). "memory" keeps them per
+# process; "sqlite" shares them between the uvicorn workers of a host through one WAL-mode file, so each row is
+# loaded once per host, and an eviction in one worker reaches the others within SHARED_CACHE_SYNC_SECONDS.
+# Each worker keeps up to SHARED_CACHE_LOCAL_MAX_ENTRIES decoded entries per cache in front of the file.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache.sqlite3"))
+SHARED_CACHE_SYNC_SECONDS = float(os.environ.get("SHARED_CACHE_SYNC_SECONDS", "0.25"))
+SHARED_CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get("SHARED_CACHE_LOCAL_MAX_ENTRIES", "1000"))
+
+# Shared keep-alive pool used by the async PostgREST client (app/db.py:get_async_client)
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX_CONNECTIONS", "200"))
+DB_POOL_MAX_KEEPALIVE = int(os.environ.get("DB_POOL_MAX_KEEPALIVE", "50"))
+DB_POOL_KEEPALIVE_EXPIRY = float(os.environ.get("DB_POOL_KEEPALIVE_EXPIRY", "30"))
+DB_TIMEOUT_SECONDS = float(os.environ.get("DB_TIMEOUT_SECONDS", "30"))
+
+# /admin/analytics snapshot: served from cache, refreshed in the background after the TTL
+ANALYTICS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "30"))
+ANALYTICS_MAX_STALE_SECONDS = float(os.environ.get("ANALYTICS_MAX_STALE_SECONDS", "600"))
+
+# Admin list endpoints: keyset page size (default when only `cursor` is given / hard cap) and the chunk
+# size of NDJSON streams and of unpaged full-list reads
+ADMIN_PAGE_SIZE_DEFAULT = int(os.environ.get("ADMIN_PAGE_SIZE_DEFAULT", "100"))
+ADMIN_PAGE_SIZE_MAX = int(os.environ.get("ADMIN_PAGE_SIZE_MAX", "1000"))
+ADMIN_STREAM_CHUNK_SIZE = int(os.environ.get("ADMIN_STREAM_CHUNK_SIZE", "500"))
+
+# Rendered certificate PNGs cached by (template hash, cert name, user name)
+CERT_RENDER_CACHE_SIZE = int(os.environ.get("CERT_RENDER_CACHE_SIZE", "256"))
+CERT_RENDER_CACHE_TTL_SECONDS = float(os.environ.get("CERT_RENDER_CACHE_TTL_SECONDS", "3600"))
+# zlib level for certificate PNGs; encoding dominates render time and 3 is ~30% faster than Pillow's 6
+CERT_PNG_COMPRESS_LEVEL = int(os.environ.get("CERT_PNG_COMPRESS_LEVEL", "3"))
+
+# Bulk certificate issuance: worker processes (0 = one per core) and max certificates per request
+CERT_RENDER_WORKERS = int(os.environ.get("CERT_RENDER_WORKERS", "0"))
+CERT_BATCH_MAX = int(os.environ.get("CERT_BATCH_MAX", "5000"))
+
+# Proctoring events are buffered and bulk-inserted once this many are pending or this much time has passed
+PROCTOR_BUFFER_MAX_BATCH = int(os.environ.get("PROCTOR_BUFFER_MAX_BATCH", "500"))
+PROCTOR_BUFFER_MAX_DELAY_SECONDS = float(os.environ.get("PROCTOR_BUFFER_MAX_DELAY_SECONDS", "1.0"))
+PROCTOR_BUFFER_MAX_QUEUE = int(os.environ.get("PROCTOR_BUFFER_MAX_QUEUE", "100000"))
+
+# Compiled question bank per exam (student payload + answer key); invalidated explicitly, TTL as a backstop
+QUESTION_CACHE_TTL_SECONDS = float(os.environ.get("QUESTION_CACHE_TTL_SECONDS", "600"))
+QUESTION_CACHE_MAX_EXAMS = int(os.environ.get("QUESTION_CACHE_MAX_EXAMS", "1000"))
+
+# Regrade: attempts fetched per round trip and score rows written per bulk update
+REGRADE_CHUNK_SIZE = int(os.environ.get("REGRADE_CHUNK_SIZE", "5000"))
+
+# Certificate availability: minimum attempt score and how long eligibility lookups are cached
+CERT_PASS_SCORE = int(os.environ.get("CERT_PASS_SCORE", "75"))
+ELIGIBILITY_CACHE_TTL_SECONDS = float(os.environ.get("ELIGIBILITY_CACHE_TTL_SECONDS", "60"))
+ELIGIBILITY_CACHE_MAX_ENTRIES = int(os.environ.get("ELIGIBILITY_CACHE_MAX_ENTRIES", "50000"))
+
+# Course/certification catalog: server-side snapshot TTL and the max-age sent to browsers/CDNs
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get("CATALOG_CACHE_TTL_SECONDS", "300"))
+CATALOG_HTTP_MAX_AGE_SECONDS = int(os.environ.get("CATALOG_HTTP_MAX_AGE_SECONDS", "60"))
+
+# Google sign-in: signing certs are cached for their Cache-Control max-age (this default if absent)
+GOOGLE_CERTS_URL = os.environ.get("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS = float(os.environ.get("GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS", "3600"))
+GOOGLE_CERTS_MIN_REFRESH_SECONDS = float(os.environ.get("GOOGLE_CERTS_MIN_REFRESH_SECONDS", "60"))
+GOOGLE_TOKEN_CLOCK_SKEW_SECONDS = float(os.environ.get("GOOGLE_TOKEN_CLOCK_SKEW_SECONDS", "10"))
+
+# Self-contained tokens: /auth/google returns a short-lived access token carrying the user
+# (no per-request lookup) plus a refresh token for /auth/refresh. Off by default.
+JWT_SELF_CONTAINED = os.environ.get("JWT_SELF_CONTAINED", "0").lower() in ("1", "true", "yes")
+JWT_ACCESS_MINUTES = int(os.environ.get("JWT_ACCESS_MINUTES", "15"))
+JWT_REFRESH_MINUTES = int(os.environ.get("JWT_REFRESH_MINUTES", str(JWT_EXPIRES_MINUTES)))
+
+# Razorpay Orders API over a pooled async client; the base URL can point at fake_razorpay.py locally.
+# create_order returns the same open order for a (user, certification) within the TTL.
+RAZORPAY_API_BASE = os.environ.get("RAZORPAY_API_BASE", "https://api.razorpay.com")
+RAZORPAY_TIMEOUT_SECONDS = float(os.environ.get("RAZORPAY_TIMEOUT_SECONDS", "15"))
+RAZORPAY_POOL_MAX_CONNECTIONS = int(os.environ.get("RAZORPAY_POOL_MAX_CONNECTIONS", "20"))
+RAZORPAY_ORDER_TTL_SECONDS = float(os.environ.get("RAZORPAY_ORDER_TTL_SECONDS", "900"))
+
+# Razorpay webhooks (POST /payments/webhook): HMAC secret; captured payments are reconciled through the outbox
+RAZORPAY_WEBHOOK_SECRET = os.environ.get("RAZORPAY_WEBHOOK_SECRET")
+
+# Durable outbox (SQLite) for side-effect writes drained by a background worker
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "outbox.sqlite3"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "1.0"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "60"))
+
+# Per-request DB round trips / rows / bytes returned as X-DB-* response headers (app/instrumentation.py)
+DB_QUERY_STATS_HEADERS = os.environ.get("DB_QUERY_STATS_HEADERS", "0").lower() in ("1", "true", "yes")
+
+# GET /metrics (Prometheus text format) and the request/DB latency recording behind it (app/metrics.py)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# Request ids and per-request PostgREST spans (app/tracing.py). Calls slower than SLOW_QUERY_MS go to the
+# app.slow_queries logger (and SLOW_QUERY_LOG_PATH as JSON lines if set); requests slower than
+# TRACE_SLOW_REQUEST_MS are logged with all of their spans.
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_PATH = os.environ.get("SLOW_QUERY_LOG_PATH")
+SLOW_QUERY_RECENT = int(os.environ.get("SLOW_QUERY_RECENT", "200"))
+TRACE_SLOW_REQUEST_MS = float(os.environ.get("TRACE_SLOW_REQUEST_MS", "1000"))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "100"))
+
+# Startup probe (app/readiness.py): schema resolution runs in a background thread instead of blocking
+# startup, retried with exponential backoff; GET /health/ready answers 503 until it has succeeded.
+READINESS_RETRY_SECONDS = float(os.environ.get("READINESS_RETRY_SECONDS", "1.0"))
+READINESS_RETRY_MAX_SECONDS = float(os.environ.get("READINESS_RETRY_MAX_SECONDS", "30"))
+# After a failed schema probe, lookups use the fallback names for this long instead of probing again
+SCHEMA_PROBE_RETRY_SECONDS = float(os.environ.get("SCHEMA_PROBE_RETRY_SECONDS", "5"))
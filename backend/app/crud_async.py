@@ -0,0 +1,158 @@
+# app/crud_async.py
+"""Async counterparts of the crud helpers used on the hot request paths.
+
+Same shapes and semantics as app/crud.py, but awaiting the shared async PostgREST
+client (app/db.py:get_async_client) so a request does not pin a threadpool thread
+while waiting on the database.
+"""
+import uuid
+from typing import List
+
+from .db import get_async_client
+from .cache import cache_user, invalidate_user, cached_cert, cache_cert
+from .schema import schema
+from .crud import _normalize_user_row
+
+
+async def upsert_user(email: str, display_name: str = None, role: str = "student"):
+    await schema.aresolve_users()
+    payload = {"email": email, schema.users_name_column(): display_name or email.split('@')[0], "role": role}
+    res = await get_async_client().table(schema.users_table()).upsert(payload, on_conflict="email").execute()
+    if not getattr(res, 'data', None):
+        return None
+    user = _normalize_user_row(res.data[0])
+    invalidate_user(user_id=user.get('User_id'), email=email)
+    cache_user(user)
+    return user
+
+async def get_user_by_email(email: str):
+    await schema.aresolve_users()
+    res = await get_async_client().table(schema.users_table()).select("*").eq("email", email).execute()
+    if getattr(res, 'data', None):
+        return _normalize_user_row(res.data[0])
+    return None
+
+async def get_user_by_id(user_id: str):
+    await schema.aresolve_users()
+    res = await get_async_client().table(schema.users_table()).select("*").eq(schema.users_id_column(), user_id).execute()
+    if getattr(res, 'data', None):
+        return _normalize_user_row(res.data[0])
+    return None
+
+async def get_cert(cert_id: str):
+    cached = cached_cert(cert_id)
+    if cached is not None:
+        return cached
+    data = (await get_async_client().table("certifications").select("*").eq("id", cert_id).execute()).data
+    if data:
+        cache_cert(cert_id, data)
+    return data
+
+async def create_purchase_row(user_id: str, cert_id: str, amount: float, currency: str, razorpay_order_id: str, purchase_id: str):
+    payload = {
+        "id": purchase_id,
+        "user_id": user_id,
+        "certification_id": cert_id,
+        "amount": amount,
+        "currency": currency,
+        "razorpay_order_id": razorpay_order_id,
+        "status": "created"
+    }
+    return (await get_async_client().table("purchases").insert([payload]).execute()).data
+
+async def get_open_purchase(user_id: str, cert_id: str):
+    """The unpaid ('created') purchase of (user, certification); sql/supabase_schema.sql allows at most one."""
+    return (await get_async_client().table("purchases").select("*").eq("user_id", user_id)
+            .eq("certification_id", cert_id).eq("status", "created").order("created_at", desc=True).limit(1).execute()).data
+
+async def get_purchase(purchase_id: str):
+    return (await get_async_client().table("purchases").select("*").eq("id", purchase_id).execute()).data
+
+async def update_purchase(purchase_id: str, updates: dict):
+    return (await get_async_client().table("purchases").update(updates).eq("id", purchase_id).execute()).data
+
+async def verify_purchase_payment(purchase_id: str, order_id: str, payment_id: str, signature: str, mailid: str, price: int = 1):
+    """Mark a purchase paid and record its transaction in one atomic RPC (sql/supabase_schema.sql).
+
+    Returns the function's JSON ({"status": "paid", ...} or {"error": ...}); raises if the RPC is unavailable.
+    """
+    params = {
+        "p_purchase_id": purchase_id,
+        "p_order_id": order_id,
+        "p_payment_id": payment_id,
+        "p_signature": signature,
+        "p_mailid": mailid,
+        "p_price": int(price),
+    }
+    return (await get_async_client().rpc("verify_purchase_payment", params).execute()).data
+
+async def create_attempt(user_id: str, cert_id: str, metadata: dict = None):
+    attempt_id = str(uuid.uuid4())
+    payload = {
+        "id": attempt_id,
+        "user_id": user_id,
+        "certification_id": cert_id,
+        "started_at": "now()",
+        "status": "started",
+        "metadata": metadata or {}
+    }
+    if not await schema.ahas_column("attempts", "certification_id"):
+        payload.pop("certification_id", None)
+    try:
+        await get_async_client().table("attempts").insert([payload]).execute()
+    except Exception as e:
+        missing = schema.rejected_optional_column("attempts", e, payload)
+        if missing:
+            # the probe said the column exists but the insert was rejected for it: retry once without it
+            payload.pop(missing, None)
+            try:
+                await get_async_client().table("attempts").insert([payload]).execute()
+                return attempt_id
+            except Exception as retry_error:
+                e = retry_error
+        # Log and continue; return attempt_id even if DB insert fails so caller can proceed
+        print(f"create_attempt: non-fatal DB insert failure: {e}")
+    return attempt_id
+
+async def get_attempt(attempt_id: str):
+    return (await get_async_client().table("attempts").select("*").eq("id", attempt_id).execute()).data
+
+async def update_attempt(attempt_id: str, updates: dict):
+    try:
+        return (await get_async_client().table("attempts").update(updates).eq("id", attempt_id).execute()).data
+    except Exception as e:
+        missing = schema.rejected_optional_column("attempts", e, updates)
+        if missing:
+            # e.g. `answers` on a DB without that column: the rest of the update still matters
+            return await update_attempt(attempt_id, {k: v for k, v in updates.items() if k != missing})
+        print(f"update_attempt: DB update failed (non-fatal): {e}")
+        return None
+
+async def update_attempt_scores(scores: List[dict]):
+    """Bulk write of [{"id", "score"}] rows: one RPC (sql/supabase_schema.sql), else a merge upsert."""
+    if not scores:
+        return 0
+    client = get_async_client()
+    try:
+        res = await client.rpc("bulk_update_attempt_scores", {"scores": scores}).execute()
+        return int(res.data or 0)
+    except Exception as e:
+        print(f"update_attempt_scores: RPC unavailable, falling back to upsert: {e}")
+    await client.table("attempts").upsert(scores, on_conflict="id").execute()
+    return len(scores)
+
+async def list_questions(exma_id):
+    return (await get_async_client().table("questions").select("*").eq("exma_id", exma_id).execute()).data
+
+async def add_proctor_event(attempt_id: str, event_type: str, metadata: dict = None):
+    payload = {"attempt_id": attempt_id, "event_type": event_type, "metadata": metadata or {}}
+    return (await get_async_client().table("proctor_events").insert([payload]).execute()).data
+
+async def create_transaction(mailid: str, price: int = 1, course_title: str = None):
+    payload = {
+        "mailid": mailid,
+        "price": int(price)
+    }
+    if course_title:
+        payload["course_title"] = course_title
+    return (await get_async_client().table("transactions").insert([payload]).execute()).data
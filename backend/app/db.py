@@ -1,8 +1,89 @@
 # app/db.py
-from supabase import create_client
-from .config import SUPABASE_URL, SUPABASE_KEY
+"""Supabase / PostgREST clients.
+
+Both are built on first use rather than at import: `supabase` pulls in gotrue,
+storage3, realtime, postgrest and httpx, a large share of the worker's cold start that
+only needs paying once a query actually runs.
+"""
+from typing import Dict, Optional, Union
+
+from .instrumentation import InstrumentedClient, instrument
+from .config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    DB_POOL_MAX_CONNECTIONS,
+    DB_POOL_MAX_KEEPALIVE,
+    DB_POOL_KEEPALIVE_EXPIRY,
+    DB_TIMEOUT_SECONDS,
+)
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise EnvironmentError("SUPABASE_URL and SUPABASE_KEY must be set in environment")
 
-supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def _create_supabase_client():
+    from supabase import create_client
+
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+# every table()/rpc() call through these clients is timed and counted (app/instrumentation.py)
+supabase_client = InstrumentedClient(factory=_create_supabase_client)
+
+
+def _create_pooled_async_client():
+    import httpx
+    from postgrest import AsyncPostgrestClient
+    from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+    class _PooledAsyncPostgrestClient(AsyncPostgrestClient):
+        """AsyncPostgrestClient whose httpx session uses explicit keep-alive pool limits."""
+
+        def create_session(
+            self,
+            base_url: str,
+            headers: Dict[str, str],
+            timeout: Union[int, float, httpx.Timeout],
+            verify: bool = True,
+        ) -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                base_url=base_url,
+                headers=headers,
+                timeout=timeout,
+                verify=verify,
+                follow_redirects=True,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=DB_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=DB_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=DB_POOL_KEEPALIVE_EXPIRY,
+                ),
+            )
+
+    return _PooledAsyncPostgrestClient(
+        f"{SUPABASE_URL.rstrip('/')}/rest/v1",
+        headers={
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apiKey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+        },
+        timeout=DB_TIMEOUT_SECONDS,
+    )
+
+
+_async_client: Optional[InstrumentedClient] = None
+
+
+def get_async_client() -> InstrumentedClient:
+    """Process-wide async PostgREST client; every call shares one keep-alive connection pool."""
+    global _async_client
+    if _async_client is None:
+        _async_client = instrument(_create_pooled_async_client())
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
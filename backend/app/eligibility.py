@@ -0,0 +1,141 @@
+# app/eligibility.py
+"""Certificate eligibility index.
+
+`certificate_eligibility` (sql/supabase_schema.sql) holds one row per
+(user_id, certification_id) whose best completed attempt reached CERT_PASS_SCORE.
+complete_exam writes a passing score before it responds, because the frontend
+checks availability right after; the outbox job (app/outbox.py) only retries it
+if that write failed. Availability is a single primary-key lookup. Only positive
+answers are cached (for ELIGIBILITY_CACHE_TTL_SECONDS): a cached "not eligible"
+would hide a pass recorded by another worker. Writes that can lower or withdraw
+a score (regrade, admin review) call `refresh()`, which re-derives the rows of
+the affected pairs from their attempts.
+
+Deployments that have not created the table yet are detected through the schema
+registry; `lookup()` then returns None and callers use the legacy scan.
+"""
+from typing import List, Optional
+
+from .cache import TTLCache
+from .config import CERT_PASS_SCORE, ELIGIBILITY_CACHE_TTL_SECONDS, ELIGIBILITY_CACHE_MAX_ENTRIES
+from .db import supabase_client, get_async_client
+from .schema import schema, _is_missing_error
+
+TABLE = "certificate_eligibility"
+# attempt statuses whose score counts; 'rejected' (admin review) and 'under_review' do not
+COUNTED_STATUSES = ("completed", "approved")
+# users per attempts read / index delete in refresh(), to keep the in.(...) filter short
+_REFRESH_CHUNK = 200
+
+eligibility_cache = TTLCache("eligibility", maxsize=ELIGIBILITY_CACHE_MAX_ENTRIES, ttl=ELIGIBILITY_CACHE_TTL_SECONDS)
+
+
+def _key(user_id, cert_id):
+    return str(user_id), str(cert_id)
+
+
+def index_available() -> bool:
+    return schema.has_column(TABLE, "best_score")
+
+
+def is_passing(score) -> bool:
+    try:
+        return float(score) >= CERT_PASS_SCORE
+    except (TypeError, ValueError):
+        return False
+
+
+async def lookup(user_id, cert_id) -> Optional[bool]:
+    """Whether the user holds a passing score for the certification; None if the index table is missing."""
+    key = _key(user_id, cert_id)
+    cached = eligibility_cache.get(key)
+    if cached is not None:
+        return cached
+    if not await schema.ahas_column(TABLE, "best_score"):
+        return None
+    try:
+        rows = (await get_async_client().table(TABLE).select("best_score")
+                .eq("user_id", key[0]).eq("certification_id", key[1]).limit(1).execute()).data
+    except Exception as e:
+        if _is_missing_error(e):
+            schema.mark_missing(TABLE, "best_score")
+            return None
+        raise
+    eligible = bool(rows) and is_passing(rows[0].get("best_score"))
+    if eligible:
+        eligibility_cache.set(key, True)
+    return eligible
+
+
+def record_passes(passes: List[dict]) -> int:
+    """Record [{user_id, certification_id, score, attempt_id}] passes in one round trip.
+
+    Non-passing scores are ignored. Uses the record_certificate_eligibility RPC (keeps the best
+    score); without it, a plain upsert keeps the latest passing score, which is equally eligible.
+    """
+    rows = {}
+    for p in passes:
+        if p.get("user_id") and p.get("certification_id") and is_passing(p.get("score")):
+            key = _key(p["user_id"], p["certification_id"])
+            attempt_id = p.get("attempt_id")
+            rows[key] = {"user_id": key[0], "certification_id": key[1], "best_score": p["score"],
+                         "attempt_id": None if attempt_id is None else str(attempt_id)}
+    if not rows or not index_available():
+        return 0
+    try:
+        supabase_client.rpc("record_certificate_eligibility", {"passes": list(rows.values())}).execute()
+    except Exception as e:
+        print(f"record_passes: RPC unavailable, falling back to upsert: {e}")
+        try:
+            supabase_client.table(TABLE).upsert(list(rows.values()), on_conflict="user_id,certification_id").execute()
+        except Exception as e2:
+            if _is_missing_error(e2):
+                schema.mark_missing(TABLE, "best_score")
+                return 0
+            raise
+    for key in rows:
+        eligibility_cache.set(key, True)
+    return len(rows)
+
+
+def refresh(pairs) -> int:
+    """Re-derive the index rows of (user_id, certification_id) pairs from their attempts.
+
+    Keeps each pair's best counted score if it passes and deletes the row otherwise, so a
+    regrade or a rejected review can also withdraw eligibility. Two or three round trips
+    per certification and chunk of users. Returns the number of pairs that remain eligible.
+    """
+    by_cert = {}
+    for user_id, cert_id in pairs:
+        if user_id and cert_id:
+            by_cert.setdefault(str(cert_id), set()).add(str(user_id))
+    for cert_id, users in by_cert.items():
+        for user_id in users:
+            eligibility_cache.delete(_key(user_id, cert_id))
+    if not by_cert or not index_available():
+        return 0
+    eligible = 0
+    for cert_id, users in by_cert.items():
+        users = sorted(users)
+        for i in range(0, len(users), _REFRESH_CHUNK):
+            chunk = users[i:i + _REFRESH_CHUNK]
+            attempts = supabase_client.table("attempts").select("id,user_id,score,status") \
+                .eq("certification_id", cert_id).in_("user_id", chunk).execute().data or []
+            best = {}
+            for a in attempts:
+                if a.get("status") not in COUNTED_STATUSES or not is_passing(a.get("score")):
+                    continue
+                user_id = str(a.get("user_id"))
+                if user_id not in best or float(a["score"]) > float(best[user_id]["best_score"]):
+                    best[user_id] = {"user_id": user_id, "certification_id": cert_id, "best_score": a["score"],
+                                     "attempt_id": str(a["id"])}
+            if best:
+                supabase_client.table(TABLE).upsert(list(best.values()), on_conflict="user_id,certification_id").execute()
+            lost = [u for u in chunk if u not in best]
+            if lost:
+                supabase_client.table(TABLE).delete().eq("certification_id", cert_id).in_("user_id", lost).execute()
+            # a lookup that raced with the writes above may have cached the old answer
+            for user_id in chunk:
+                eligibility_cache.delete(_key(user_id, cert_id))
+            eligible += len(best)
+    return eligible
@@ -0,0 +1,208 @@
+# app/google_verifier.py
+"""Local verification of Google ID tokens.
+
+Google's signing certificates are fetched over one pooled `requests.Session`,
+parsed into verifiers once, and kept for as long as the response's
+`Cache-Control: max-age` allows. Verifying a sign-in is then a signature check and
+a few claim comparisons in-process; the network is only touched when the certs
+expire or a token names a key id we have not seen (Google rotated its keys).
+
+The fetcher is injectable: `fetcher()` returns `({kid: pem}, max_age_seconds)`, so
+tests and bench_google_verify.py run fully offline against a generated key set.
+`requests` and google-auth are imported when the first verifier is built, so
+processes that never see a Google sign-in do not load them.
+"""
+import base64
+import collections
+import json
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .config import (
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CERTS_URL,
+    GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS,
+    GOOGLE_CERTS_MIN_REFRESH_SECONDS,
+    GOOGLE_TOKEN_CLOCK_SKEW_SECONDS,
+)
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+Fetcher = Callable[[], Tuple[Dict[str, str], float]]
+
+
+class TokenVerificationError(ValueError):
+    pass
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def cache_max_age(headers, default: float) -> float:
+    """Seconds a response may be cached for, from Cache-Control max-age minus Age."""
+    match = _MAX_AGE.search(headers.get("Cache-Control", "") or "")
+    if not match:
+        return default
+    try:
+        age = float(headers.get("Age") or 0)
+    except ValueError:
+        age = 0.0
+    return max(float(match.group(1)) - age, 0.0)
+
+
+def session_fetcher(url: str = GOOGLE_CERTS_URL, session: Optional["requests.Session"] = None, timeout: float = 10.0) -> Fetcher:
+    """Fetcher reusing one keep-alive session for every certificate download."""
+    if session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2))
+
+    def fetch():
+        res = session.get(url, timeout=timeout)
+        res.raise_for_status()
+        return res.json(), cache_max_age(res.headers, GOOGLE_CERTS_DEFAULT_MAX_AGE_SECONDS)
+
+    return fetch
+
+
+class GoogleTokenVerifier:
+    def __init__(self, audience: Optional[str] = GOOGLE_CLIENT_ID, fetcher: Optional[Fetcher] = None,
+                 issuers=GOOGLE_ISSUERS, clock_skew: float = GOOGLE_TOKEN_CLOCK_SKEW_SECONDS,
+                 min_refresh: float = GOOGLE_CERTS_MIN_REFRESH_SECONDS, clock: Callable[[], float] = time.time):
+        self.audience = audience
+        from google.auth import crypt
+
+        self._crypt = crypt
+        self.fetcher = fetcher or session_fetcher()
+        self.issuers = tuple(issuers)
+        self.clock_skew = float(clock_skew)
+        self.min_refresh = float(min_refresh)
+        self.clock = clock
+        self._verifiers: Dict[str, object] = {}
+        self._expires_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = threading.Lock()
+        self.verified = 0
+        self.rejected = 0
+        self.cert_fetches = 0
+        self._latencies = collections.deque(maxlen=1024)
+
+    def _refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = self.clock()
+            if not force and now < self._expires_at:
+                return
+            if force and now - self._fetched_at < self.min_refresh:
+                # a token with an unknown kid must not be able to make us hammer Google
+                return
+            try:
+                certs, max_age = self.fetcher()
+            except Exception as e:
+                if not self._verifiers:
+                    raise
+                # keep verifying with the certs we have and retry after min_refresh
+                print(f"Google cert refresh failed, keeping cached certs: {e}")
+                self._fetched_at = now
+                self._expires_at = now + self.min_refresh
+                return
+            self._verifiers = {kid: self._crypt.RSAVerifier.from_string(pem) for kid, pem in certs.items()}
+            self._fetched_at = now
+            self._expires_at = now + max_age
+            self.cert_fetches += 1
+
+    def _verifier_for(self, kid: Optional[str]):
+        self._refresh()
+        verifier = self._verifiers.get(kid)
+        if verifier is None:
+            self._refresh(force=True)
+            verifier = self._verifiers.get(kid)
+        return verifier
+
+    def _decode(self, token) -> dict:
+        if isinstance(token, bytes):
+            token = token.decode()
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            payload = json.loads(_b64decode(payload_b64))
+            signature = _b64decode(signature_b64)
+        except Exception:
+            raise TokenVerificationError("Malformed token")
+        if header.get("alg") != "RS256":
+            raise TokenVerificationError(f"Unsupported algorithm {header.get('alg')!r}")
+        verifier = self._verifier_for(header.get("kid"))
+        if verifier is None:
+            raise TokenVerificationError(f"Unknown key id {header.get('kid')!r}")
+        if not verifier.verify(f"{header_b64}.{payload_b64}".encode(), signature):
+            raise TokenVerificationError("Invalid signature")
+
+        now = self.clock()
+        try:
+            exp, iat = float(payload["exp"]), float(payload["iat"])
+        except (KeyError, TypeError, ValueError):
+            raise TokenVerificationError("Token is missing exp/iat")
+        if exp < now - self.clock_skew:
+            raise TokenVerificationError("Token expired")
+        if iat > now + self.clock_skew:
+            raise TokenVerificationError("Token used too early")
+        if payload.get("iss") not in self.issuers:
+            raise TokenVerificationError(f"Wrong issuer {payload.get('iss')!r}")
+        if self.audience:
+            aud = payload.get("aud")
+            if aud != self.audience and not (isinstance(aud, list) and self.audience in aud):
+                raise TokenVerificationError("Token has wrong audience")
+        return payload
+
+    def verify(self, token) -> dict:
+        """Decoded claims of a valid Google ID token; raises TokenVerificationError otherwise."""
+        started = time.perf_counter()
+        try:
+            payload = self._decode(token)
+        except Exception:
+            self.rejected += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+        self.verified += 1
+        return payload
+
+    def stats(self) -> dict:
+        samples = sorted(self._latencies)
+
+        def pct(p):
+            return round(samples[min(int(len(samples) * p), len(samples) - 1)] * 1000, 3) if samples else None
+
+        return {
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "cert_fetches": self.cert_fetches,
+            "keys": len(self._verifiers),
+            "certs_expire_in_seconds": max(self._expires_at - self.clock(), 0.0) if self._verifiers else None,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "max": pct(1.0)},
+        }
+
+
+_verifier: Optional[GoogleTokenVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def get_google_verifier() -> GoogleTokenVerifier:
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = GoogleTokenVerifier()
+    return _verifier
+
+
+def set_google_verifier(verifier: Optional[GoogleTokenVerifier]) -> None:
+    """Swap the process-wide verifier (e.g. one with an offline fetcher)."""
+    global _verifier
+    _verifier = verifier
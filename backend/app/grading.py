@@ -0,0 +1,74 @@
+# app/grading.py
+"""Batch grading and regrading of exam submissions.
+
+Every (question_id, selected_option) pair across a batch of submissions is looked
+up once in a {(question_id, correct_option): column} table built from the answer
+key, then the marks of the hits are summed per submission in one vectorized pass:
+
+    scores = bincount(rows[hit], weights=marks[cols[hit]])
+
+With submissions held as Python dicts this is about as fast as the per-answer
+loop (bench_grading.py): the dict probe per answer dominates both. Regrading is
+fast because of the chunked reads and bulk score writes around it, not the
+arithmetic. Falls back to the per-answer loop when NumPy is not installed. NumPy is imported
+on the first regrade rather than at startup.
+"""
+from itertools import chain, repeat
+from typing import Dict, List, Optional, Sequence
+
+from .lazy import optional_import
+from .question_bank import CompiledExam
+
+
+class EncodedKey:
+    """Answer key laid out for batch scoring: column j is question `question_ids[j]`."""
+
+    def __init__(self, exam: CompiledExam):
+        self.np = np = optional_import("numpy")
+        self.question_ids = list(exam.answer_key)
+        self.correct = {}
+        marks = []
+        for j, qid in enumerate(self.question_ids):
+            option, mark = exam.answer_key[qid]
+            self.correct[(qid, option)] = j
+            marks.append(mark)
+        self.marks = np.asarray(marks, dtype=np.int64)
+
+    def hits(self, submissions: Sequence[Dict[str, str]]):
+        """(rows, cols) of every correct answer; submissions are {question_id: selected_option} with str keys and values."""
+        np = self.np
+        n = len(submissions)
+        lengths = np.fromiter(map(len, submissions), dtype=np.int64, count=n)
+        total = int(lengths.sum())
+        # one C-level dict probe per answer; wrong answers and unknown questions map to -1
+        cols = np.fromiter(map(self.correct.get, chain.from_iterable(map(dict.items, submissions)), repeat(-1)),
+                           dtype=np.int32, count=total)
+        rows = np.repeat(np.arange(n), lengths)
+        hit = cols >= 0
+        return rows[hit], cols[hit]
+
+    def score(self, submissions: Sequence[Dict[str, str]]):
+        rows, cols = self.hits(submissions)
+        np = self.np
+        totals = np.bincount(rows, weights=self.marks[cols], minlength=len(submissions))
+        return totals.astype(np.int64)
+
+
+def score_submissions(exam: CompiledExam, submissions: Sequence[Optional[dict]]) -> List[int]:
+    """Score many {question_id: selected_option} submissions against one exam's answer key."""
+    if not submissions:
+        return []
+    if optional_import("numpy") is None or not exam.answer_key:
+        return [exam.score((answers or {}).items()) for answers in submissions]
+    return EncodedKey(exam).score([answers or {} for answers in submissions]).tolist()
+
+
+def answers_to_dict(answers) -> Dict[str, str]:
+    """Stored/submitted answers as {question_id: selected_option}; accepts a dict or a list of pairs."""
+    if isinstance(answers, dict):
+        return {str(k): str(v) for k, v in answers.items()}
+    out = {}
+    for a in answers or []:
+        if isinstance(a, dict) and a.get("question_id") is not None:
+            out[str(a["question_id"])] = str(a.get("selected_option"))
+    return out
@@ -0,0 +1,240 @@
+# app/instrumentation.py
+"""Per-call instrumentation of the Supabase / PostgREST clients.
+
+`instrument(client)` wraps a sync or async client so that every
+``client.table(...)...execute()`` (and ``client.rpc(...).execute()``) is timed and
+reported to the registered observers as a `QueryCall` (table, operation, filters,
+rows, duration, error). The wrapper only forwards builder calls, so the query
+itself is unchanged.
+
+`track_queries()` opens a per-request scope (a contextvar, so it follows the
+request into the threadpool and awaited coroutines but not into background
+workers): round trips, rows and response bytes of every call made inside it are
+added up in a `QueryStats`. With DB_QUERY_STATS_HEADERS the middleware in main.py
+does this for every request and returns the totals as X-DB-* headers.
+"""
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# builder methods that decide the operation; everything else keeps the current one
+_OPERATIONS = {"select": "select", "insert": "insert", "upsert": "upsert", "update": "update", "delete": "delete"}
+# builder methods recorded as filters: (method, column, value); order is kept too, it matters for indexing
+_FILTERS = {"eq", "neq", "gt", "gte", "lt", "lte", "in_", "like", "ilike", "is_", "contains", "filter", "match", "order"}
+
+
+class QueryCall:
+    __slots__ = ("table", "op", "filters", "rows", "count", "data", "duration", "error")
+
+    def __init__(self, table: str, op: str, filters: List[tuple], rows: int, count: Optional[int], data,
+                 duration: float, error: Optional[BaseException]):
+        self.table = table
+        self.op = op
+        self.filters = filters
+        self.rows = rows
+        self.count = count
+        self.data = data
+        self.duration = duration
+        self.error = error
+
+
+class QueryStats:
+    """Round trips, rows and JSON-encoded response bytes of the calls inside one `track_queries()` scope."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.rows = 0
+        self.bytes = 0
+        self.duration = 0.0
+        self.calls: List[Tuple[str, str, int]] = []
+        self._lock = threading.Lock()
+
+    def add(self, call: QueryCall) -> None:
+        size = _response_bytes(call.data)
+        with self._lock:
+            self.round_trips += 1
+            self.rows += call.rows
+            self.bytes += size
+            self.duration += call.duration
+            self.calls.append((call.table, call.op, call.rows))
+
+    def as_dict(self) -> dict:
+        return {"round_trips": self.round_trips, "rows": self.rows, "bytes": self.bytes,
+                "db_ms": round(self.duration * 1000, 2)}
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+_observers: List[Callable[[QueryCall], None]] = []
+
+
+def _response_bytes(data) -> int:
+    if data is None:
+        return 0
+    try:
+        return len(json.dumps(data, default=str, separators=(",", ":")))
+    except Exception:
+        return 0
+
+
+def add_observer(fn: Callable[[QueryCall], None]) -> None:
+    """Call `fn(call)` after every instrumented query; it must be cheap and must not raise."""
+    if fn not in _observers:
+        _observers.append(fn)
+
+
+def remove_observer(fn: Callable[[QueryCall], None]) -> None:
+    if fn in _observers:
+        _observers.remove(fn)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _record(table: str, op: str, filters: List[tuple], started: float, res, error: Optional[BaseException]) -> None:
+    data = getattr(res, "data", None)
+    rows = len(data) if isinstance(data, list) else (0 if data is None else 1)
+    call = QueryCall(table, op, filters, rows, getattr(res, "count", None), data, time.perf_counter() - started, error)
+    stats = _current.get()
+    if stats is not None:
+        stats.add(call)
+    for fn in _observers:
+        try:
+            fn(call)
+        except Exception as e:
+            logger.warning("query observer %r failed: %s", fn, e)
+
+
+class _InstrumentedBuilder:
+    """Forwards to a postgrest request builder, remembering the operation and filters for execute()."""
+
+    __slots__ = ("_builder", "_table", "_op", "_filters")
+
+    def __init__(self, builder, table: str, op: str, filters: List[tuple]):
+        self._builder = builder
+        self._table = table
+        self._op = op
+        self._filters = filters
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+        op = _OPERATIONS.get(name, self._op)
+        is_filter = name in _FILTERS
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if is_filter:
+                self._filters.append((name,) + args[:2])
+            if hasattr(result, "execute"):
+                return _InstrumentedBuilder(result, self._table, op, self._filters)
+            return result
+
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+        try:
+            res = self._builder.execute()
+        except BaseException as e:
+            _record(self._table, self._op, self._filters, started, None, e)
+            raise
+        if inspect.isawaitable(res):
+            return self._aexecute(res, started)
+        _record(self._table, self._op, self._filters, started, res, None)
+        return res
+
+    async def _aexecute(self, pending, started: float):
+        try:
+            res = await pending
+        except BaseException as e:
+            _record(self._table, self._op, self._filters, started, None, e)
+            raise
+        _record(self._table, self._op, self._filters, started, res, None)
+        return res
+
+
+class InstrumentedClient:
+    """Wraps a supabase / postgrest client; anything other than table/from_/rpc is passed through.
+
+    With `factory` instead of `client`, the client is only built (and its library
+    imported) on first use.
+    """
+
+    def __init__(self, client=None, factory: Optional[Callable[[], object]] = None):
+        if client is None and factory is None:
+            raise ValueError("InstrumentedClient needs a client or a factory")
+        self._client = client
+        self._factory = factory
+        self._lock = threading.Lock()
+
+    @property
+    def wrapped(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def table(self, name: str) -> _InstrumentedBuilder:
+        return _InstrumentedBuilder(self.wrapped.table(name), name, "select", [])
+
+    def from_(self, name: str) -> _InstrumentedBuilder:
+        return _InstrumentedBuilder(self.wrapped.from_(name), name, "select", [])
+
+    def rpc(self, fn: str, params: dict = None) -> _InstrumentedBuilder:
+        return _InstrumentedBuilder(self.wrapped.rpc(fn, params or {}), fn, "rpc", [])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.wrapped, name)
+
+
+def instrument(client):
+    return client if isinstance(client, InstrumentedClient) else InstrumentedClient(client)
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware: tracks each HTTP request's queries and reports them as X-DB-* response headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_queries() as stats:
+            async def send_with_stats(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers += [
+                        (b"x-db-round-trips", str(stats.round_trips).encode()),
+                        (b"x-db-rows", str(stats.rows).encode()),
+                        (b"x-db-bytes", str(stats.bytes).encode()),
+                    ]
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
@@ -0,0 +1,26 @@
+# app/lazy.py
+"""Deferred imports for dependencies that only some requests need.
+
+`optional_import("numpy")` imports the module on first call and caches it (None
+when it is not installed, matching the `try: import X / except: X = None`
+convention), so Pillow, NumPy, google-auth and friends are not paid for at
+process start. bench_import_time.py checks they stay off the startup path.
+"""
+import importlib
+from types import ModuleType
+from typing import Dict, Optional
+
+_modules: Dict[str, Optional[ModuleType]] = {}
+
+
+def optional_import(name: str) -> Optional[ModuleType]:
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except Exception:
+        module = None
+    _modules[name] = module
+    return module
@@ -1,11 +1,21 @@
 # app/main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .config import ALLOWED_ORIGINS
+from .config import ALLOWED_ORIGINS, DB_QUERY_STATS_HEADERS, METRICS_ENABLED, TRACING_ENABLED
 from .routes import auth_routes, cert_routes, payment_routes, attempt_routes, admin_routes, exam_routes, course_routes
-from .routes import health_routes
+from .routes import health_routes, metrics_routes
 from .config import SUPABASE_URL, SUPABASE_KEY
-from .db import supabase_client
+from .readiness import readiness
+from .db import close_async_client
+from .razorpay_client import close_razorpay_client
+from .certificates import shutdown_render_pool
+from .batching import start_buffers, stop_buffers
+from .outbox import outbox
+from .shared_cache import stop_shared_store
+from .pagination import NEXT_CURSOR_HEADER
+from .instrumentation import QueryStatsMiddleware
+from .metrics import MetricsMiddleware
+from .tracing import TracingMiddleware, REQUEST_ID_HEADER
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,16 +24,27 @@ app = FastAPI(title="Orivon Academy - Backend (FASTAPI + Supabase)")
 
 @app.on_event("startup")
 def startup_check():
-    # Quick check that the Supabase client can connect using provided env vars
-    try:
-        if not SUPABASE_URL or not SUPABASE_KEY:
-            logger.warning('SUPABASE_URL or SUPABASE_KEY not set; DB checks will fail')
-            return
-        # Attempt a lightweight call to the REST endpoint (use actual PK column name)
-        res = supabase_client.table('User').select('User_id').limit(1).execute()
-        logger.info('Supabase connectivity check OK; rows=%s', len(res.data or []))
-    except Exception as e:
-        logger.exception('Supabase connectivity check failed: %s', e)
+    start_buffers()
+    # also drains side-effect writes left in the outbox by a previous run
+    outbox.start()
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        logger.warning('SUPABASE_URL or SUPABASE_KEY not set; DB checks will fail')
+        return
+    # Probe table/column variants in the background (with retries) so the worker accepts requests
+    # straight away; /health/ready answers 503 until the probe has succeeded
+    readiness.start()
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    # guaranteed final flush of buffered writes before the DB client goes away
+    readiness.stop()
+    stop_buffers()
+    outbox.stop()
+    stop_shared_store()
+    await close_async_client()
+    await close_razorpay_client()
+    shutdown_render_pool()
     
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +54,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let browser clients read the keyset cursor on admin list endpoints
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
+if DB_QUERY_STATS_HEADERS:
+    app.add_middleware(QueryStatsMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
 
 app.include_router(auth_routes.router)
 app.include_router(cert_routes.router)
@@ -43,6 +72,8 @@ app.include_router(admin_routes.router)
 app.include_router(exam_routes.router)
 app.include_router(course_routes.router)
 app.include_router(health_routes.router)
+if METRICS_ENABLED:
+    app.include_router(metrics_routes.router)
 
 @app.get("/")
 def root():
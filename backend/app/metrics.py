@@ -0,0 +1,204 @@
+# app/metrics.py
+"""In-process metrics exposed at GET /metrics in the Prometheus text format.
+
+  * orivon_http_request_duration_seconds{method,route,status}  histogram, by route template
+  * orivon_db_query_duration_seconds{table,op,outcome}          histogram, every PostgREST call
+  * orivon_threadpool_*                                         in use / size / waiting, sampled at
+                                                                scrape time, plus a counter of requests
+                                                                that arrived while it was full
+  * orivon_cache_{hits,misses}_total / orivon_cache_hit_ratio   the TTL caches in app/cache.py
+  * orivon_buffer_{queue_depth,dropped_rows_total}{buffer}      write-behind buffers in app/batching.py
+
+Recording is a bisect and a few integer increments under a lock; the text is only
+rendered when /metrics is scraped. Values are per process: with several uvicorn
+workers, scrape each one (or aggregate by instance), as usual for Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from .batching import buffer_stats
+from .cache import cache_stats
+from .instrumentation import QueryCall, add_observer
+
+try:
+    from anyio.to_thread import current_default_thread_limiter
+except Exception:
+    current_default_thread_limiter = None
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Iterable[float]):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+http_duration = Histogram("orivon_http_request_duration_seconds", "HTTP request latency by route template.",
+                          ("method", "route", "status"), HTTP_BUCKETS)
+db_duration = Histogram("orivon_db_query_duration_seconds", "Supabase/PostgREST call latency by table and operation.",
+                        ("table", "op", "outcome"), DB_BUCKETS)
+threadpool_saturated = Counter("orivon_threadpool_saturated_requests_total",
+                               "Requests that arrived while every worker thread was busy.")
+
+
+def _observe_query(call: QueryCall) -> None:
+    db_duration.observe((call.table, call.op, "error" if call.error is not None else "ok"), call.duration)
+
+
+add_observer(_observe_query)
+
+
+def _threadpool_full() -> bool:
+    if current_default_thread_limiter is None:
+        return False
+    try:
+        limiter = current_default_thread_limiter()
+    except Exception:
+        return False
+    return limiter.borrowed_tokens >= limiter.total_tokens
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording one latency observation per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if _threadpool_full():
+            threadpool_saturated.inc()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI stores the matched route on the scope; its path is the template (/attempts/{attempt_id})
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            http_duration.observe((scope["method"], template, str(status)), time.perf_counter() - started)
+
+
+def _threadpool_lines() -> List[str]:
+    if current_default_thread_limiter is None:
+        return []
+    try:
+        stats = current_default_thread_limiter().statistics()
+    except Exception:
+        return []
+    lines = []
+    for name, help_text, value in (
+        ("orivon_threadpool_threads_in_use", "Worker threads currently running sync endpoints/dependencies.", stats.borrowed_tokens),
+        ("orivon_threadpool_threads_total", "Size of the worker thread pool.", stats.total_tokens),
+        ("orivon_threadpool_tasks_waiting", "Calls queued for a worker thread.", stats.tasks_waiting),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return lines
+
+
+def _cache_lines() -> List[str]:
+    stats = [s for s in cache_stats() if "hits" in s]
+    lines = []
+    for metric, kind, help_text, key in (
+        ("orivon_cache_hits_total", "counter", "Cache lookups answered from the cache.", "hits"),
+        ("orivon_cache_misses_total", "counter", "Cache lookups that had to load the value.", "misses"),
+        ("orivon_cache_hit_ratio", "gauge", "hits / (hits + misses) since process start.", "hit_ratio"),
+        ("orivon_cache_entries", "gauge", "Entries currently held.", "size"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f"{metric}{_labels(('cache',), (s['name'],))} {_number(s[key])}" for s in stats if key in s]
+    return lines
+
+
+def _buffer_lines() -> List[str]:
+    stats = buffer_stats()
+    lines = []
+    for metric, kind, help_text, key in (
+        ("orivon_buffer_queue_depth", "gauge", "Rows waiting in a write-behind buffer.", "queue_depth"),
+        ("orivon_buffer_dropped_rows_total", "counter", "Oldest rows shed because the buffer was full.", "dropped"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f"{metric}{_labels(('buffer',), (s['name'],))} {_number(s[key])}" for s in stats]
+    return lines
+
+
+def render_metrics() -> str:
+    """Must run on the event loop thread (the threadpool gauges are read from anyio's limiter)."""
+    lines = http_duration.render() + db_duration.render() + threadpool_saturated.render()
+    lines += _threadpool_lines() + _cache_lines() + _buffer_lines()
+    return "\n".join(lines) + "\n"
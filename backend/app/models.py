@@ -53,6 +53,10 @@ class EventSchema(BaseModel):
     metadata: Optional[dict] = None
 
 
+class EventBatchSchema(BaseModel):
+    events: List[EventSchema]
+
+
 class ExamCreateSchema(BaseModel):
     title: str
     certification_id: Optional[str] = None
@@ -61,3 +65,13 @@ class ExamCreateSchema(BaseModel):
 class ExamCompleteSchema(BaseModel):
     passing_score: int
     pass_status: bool
+
+
+class CertificateGrant(BaseModel):
+    user_email: str
+    user_name: str
+    cert_name: str
+
+
+class CertificateBatchSchema(BaseModel):
+    certificates: List[CertificateGrant]
@@ -0,0 +1,243 @@
+# app/outbox.py
+"""Durable local outbox for side-effect writes that should not hold up a response.
+
+Request handlers `await aenqueue(kind, payload)` into a SQLite file (WAL mode, a
+local insert of well under a millisecond, run in a worker thread so a busy file
+never stalls the event loop) and return. A worker thread drains due jobs,
+groups them by kind and hands each group to the handler registered for that kind,
+so side effects are written in bulk. A failed group is retried with exponential
+backoff; after OUTBOX_MAX_ATTEMPTS it is kept as `dead` for inspection, except for
+kinds registered with `dead_letter=False` (captured payments), which are retried
+until they succeed.
+
+Jobs are leased rather than deleted when picked up, so several worker processes
+can share one file and a crash mid-batch only delays those jobs by the lease.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from . import crud
+from .config import OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE_SECONDS
+from .razorpay_client import open_orders, purchase_orders, seen_payments
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+create table if not exists outbox (
+  id integer primary key autoincrement,
+  kind text not null,
+  payload text not null,
+  attempts integer not null default 0,
+  next_at real not null,
+  created_at real not null,
+  dead integer not null default 0,
+  last_error text
+);
+create index if not exists outbox_due on outbox (dead, next_at);
+"""
+
+
+class Outbox:
+    def __init__(self, path: str = OUTBOX_PATH, batch_size: int = OUTBOX_BATCH_SIZE, poll: float = OUTBOX_POLL_SECONDS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, lease: float = OUTBOX_LEASE_SECONDS):
+        self.path = path
+        self.batch_size = max(int(batch_size), 1)
+        self.poll = float(poll)
+        self.max_attempts = int(max_attempts)
+        self.lease = float(lease)
+        self._handlers: Dict[str, Callable[[List[dict]], object]] = {}
+        self._retry_forever = set()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.processed = 0
+        self.failures = 0
+        self.dead = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+                    conn.execute("pragma journal_mode=wal")
+                    conn.execute("pragma synchronous=normal")
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def register(self, kind: str, handler: Callable[[List[dict]], object], dead_letter: bool = True) -> None:
+        """`handler(payloads)` writes a batch of same-kind jobs; raising retries the whole batch.
+
+        With `dead_letter=False` a failing job is never parked as dead, only retried less often.
+        """
+        self._handlers[kind] = handler
+        if dead_letter:
+            self._retry_forever.discard(kind)
+        else:
+            self._retry_forever.add(kind)
+
+    def enqueue(self, kind: str, payload: dict) -> None:
+        if kind not in self._handlers:
+            raise ValueError(f"No outbox handler registered for {kind!r}")
+        now = time.time()
+        data = json.dumps(payload, default=str, separators=(",", ":"))
+        conn = self.conn
+        with self._lock:
+            conn.execute("insert into outbox (kind, payload, next_at, created_at) values (?, ?, ?, ?)", (kind, data, now, now))
+        self.enqueued += 1
+        if self._thread is None:
+            self.start()
+        self._wakeup.set()
+
+    async def aenqueue(self, kind: str, payload: dict) -> None:
+        """`enqueue` for async handlers: the insert can wait on the file lock, so it runs off the event loop."""
+        await asyncio.to_thread(self.enqueue, kind, payload)
+
+    def _claim(self) -> List[tuple]:
+        """Lease up to batch_size due jobs: they become invisible to other workers for `lease` seconds."""
+        now = time.time()
+        conn = self.conn
+        with self._lock:
+            conn.execute("begin immediate")
+            try:
+                rows = conn.execute(
+                    "select id, kind, payload, attempts from outbox where dead = 0 and next_at <= ? order by id limit ?",
+                    (now, self.batch_size),
+                ).fetchall()
+                if rows:
+                    conn.executemany("update outbox set next_at = ? where id = ?", [(now + self.lease, r[0]) for r in rows])
+                conn.execute("commit")
+            except Exception:
+                conn.execute("rollback")
+                raise
+        return rows
+
+    def _complete(self, ids: List[int]) -> None:
+        with self._lock:
+            self.conn.executemany("delete from outbox where id = ?", [(i,) for i in ids])
+
+    def _fail(self, jobs: List[tuple], error: Exception) -> None:
+        now = time.time()
+        updates, dead = [], 0
+        for job_id, kind, _payload, attempts in jobs:
+            attempts += 1
+            if attempts >= self.max_attempts and kind not in self._retry_forever:
+                dead += 1
+                updates.append((attempts, now, 1, str(error)[:500], job_id))
+            else:
+                backoff = min(2 ** attempts, 300)
+                updates.append((attempts, now + backoff, 0, str(error)[:500], job_id))
+        with self._lock:
+            self.conn.executemany("update outbox set attempts = ?, next_at = ?, dead = ?, last_error = ? where id = ?", updates)
+        self.failures += 1
+        self.dead += dead
+
+    def drain(self) -> int:
+        """Process every job that is due now. Returns the number of jobs written."""
+        done = 0
+        with self._drain_lock:
+            while True:
+                jobs = self._claim()
+                if not jobs:
+                    return done
+                groups: "OrderedDict[str, List[tuple]]" = OrderedDict()
+                for job in jobs:
+                    groups.setdefault(job[1], []).append(job)
+                for kind, group in groups.items():
+                    handler = self._handlers.get(kind)
+                    try:
+                        if handler is None:
+                            raise LookupError(f"No outbox handler registered for {kind!r}")
+                        handler([json.loads(job[2]) for job in group])
+                    except Exception as e:
+                        logger.warning("outbox: %d %s job(s) failed, will retry: %s", len(group), kind, e)
+                        self._fail(group, e)
+                        continue
+                    self._complete([job[0] for job in group])
+                    self.processed += len(group)
+                    done += len(group)
+                if len(jobs) < self.batch_size:
+                    return done
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.poll)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.exception("outbox worker error: %s", e)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the worker after a final drain; jobs that still fail stay in the file for the next start."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        try:
+            self.drain()
+        except Exception as e:
+            logger.warning("outbox: final drain failed: %s", e)
+
+    def stats(self) -> dict:
+        conn = self.conn
+        with self._lock:
+            pending, dead = conn.execute(
+                "select coalesce(sum(dead = 0), 0), coalesce(sum(dead = 1), 0) from outbox").fetchone()
+        return {
+            "path": self.path,
+            "pending": pending,
+            "dead": dead,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed_batches": self.failures,
+        }
+
+
+def reconcile_payments(events: List[dict]) -> int:
+    """Outbox handler for captured-payment webhooks ([{payment_id, order_id, email}]).
+
+    Marks the purchases paid and closes their open orders, as /payments/verify does. Payment
+    ids count as seen only once the reconcile has committed, so a redelivery after a failure
+    is queued again rather than ignored.
+    """
+    paid = crud.reconcile_payment_events(events)
+    for purchase in paid:
+        purchase_orders.delete(str(purchase.get("purchase_id")))
+        open_orders.forget(purchase.get("user_id"), purchase.get("certification_id"))
+    for e in events:
+        seen_payments.set(e.get("payment_id"), True)
+    return len(paid)
+
+
+outbox = Outbox()
+outbox.register("exam_row", crud.insert_exam_rows)
+outbox.register("attempt_completed", crud.apply_completed_attempts)
+outbox.register("transaction", crud.insert_transactions)
+# a captured payment that is never reconciled is a customer charged for nothing
+outbox.register("payment_event", reconcile_payments, dead_letter=False)
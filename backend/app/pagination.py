@@ -0,0 +1,100 @@
+# app/pagination.py
+"""Keyset (cursor) pagination and NDJSON streaming for the admin list endpoints.
+
+A page is fetched with ``order(key).gt(key, cursor).limit(n)`` (``lt`` when
+descending), so every page costs the same indexed query no matter how deep into
+the table it is. The cursor handed back to the client is simply the key of the
+last row on the page, returned in the ``X-Next-Cursor`` header so the JSON body
+stays a plain list.
+
+Paging is opt-in: a request without ``limit`` or ``cursor`` gets the whole list in
+one body, as before paging existed (read in keyset chunks), so callers that never
+look at the header are not silently truncated.
+"""
+import json
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .db import supabase_client, get_async_client
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _page_query(client, table: str, key: str, columns: str, cursor: Optional[str], limit: int, desc: bool,
+                filters: Optional[dict] = None):
+    q = client.table(table).select(columns)
+    for k, v in (filters or {}).items():
+        q = q.eq(k, v)
+    q = q.order(key, desc=desc)
+    if cursor not in (None, ""):
+        q = q.lt(key, cursor) if desc else q.gt(key, cursor)
+    return q.limit(limit)
+
+
+def _next_cursor(rows: List[dict], key: str, limit: int) -> Optional[str]:
+    if len(rows) < limit or not rows:
+        return None
+    last = rows[-1].get(key)
+    return None if last is None else str(last)
+
+
+def fetch_page(table: str, key: str, *, columns: str = "*", cursor: Optional[str] = None,
+               limit: int = 100, desc: bool = False, filters: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+    rows = _page_query(supabase_client, table, key, columns, cursor, limit, desc, filters).execute().data or []
+    return rows, _next_cursor(rows, key, limit)
+
+
+async def afetch_page(table: str, key: str, *, columns: str = "*", cursor: Optional[str] = None,
+                      limit: int = 100, desc: bool = False, filters: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+    res = await _page_query(get_async_client(), table, key, columns, cursor, limit, desc, filters).execute()
+    rows = res.data or []
+    return rows, _next_cursor(rows, key, limit)
+
+
+def iter_rows(table: str, key: str, *, columns: str = "*", cursor: Optional[str] = None,
+              chunk_size: int = 500, desc: bool = False, filters: Optional[dict] = None) -> Iterator[dict]:
+    """Yield every row from `cursor` onwards, fetching `chunk_size` rows per round trip."""
+    while True:
+        rows, cursor = fetch_page(table, key, columns=columns, cursor=cursor, limit=chunk_size, desc=desc, filters=filters)
+        yield from rows
+        if cursor is None:
+            return
+
+
+async def aiter_rows(table: str, key: str, *, columns: str = "*", cursor: Optional[str] = None,
+                     chunk_size: int = 500, desc: bool = False, filters: Optional[dict] = None) -> AsyncIterator[dict]:
+    while True:
+        rows, cursor = await afetch_page(table, key, columns=columns, cursor=cursor, limit=chunk_size, desc=desc, filters=filters)
+        for row in rows:
+            yield row
+        if cursor is None:
+            return
+
+
+def wants_page(cursor: Optional[str], limit: Optional[int]) -> bool:
+    return limit is not None or cursor not in (None, "")
+
+
+def page_response(items: List[Any], next_cursor: Optional[str]) -> JSONResponse:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return JSONResponse(content=items, headers=headers)
+
+
+def _ndjson_line(row: Any) -> bytes:
+    return json.dumps(row, default=str, separators=(",", ":")).encode() + b"\n"
+
+
+def ndjson_response(rows: Iterator[dict], mapper: Callable[[dict], Any] = None) -> StreamingResponse:
+    """Stream rows as newline-delimited JSON; sync iterators are driven from the threadpool."""
+    def body():
+        for row in rows:
+            yield _ndjson_line(mapper(row) if mapper else row)
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def andjson_response(rows: AsyncIterator[dict], mapper: Callable[[dict], Any] = None) -> StreamingResponse:
+    async def body():
+        async for row in rows:
+            yield _ndjson_line(mapper(row) if mapper else row)
+    return StreamingResponse(body(), media_type="application/x-ndjson")
@@ -0,0 +1,118 @@
+# app/question_bank.py
+"""Per-exam question cache.
+
+For each exam the `questions` rows are loaded once and compiled into:
+  * the student-safe payload (question_id, text, options, marks) pre-serialized to
+    JSON bytes, spliced directly into the /attempts/start response, and
+  * an answer key (question_id -> (correct_index, marks)) used for grading.
+
+Entries are keyed by exma_id in a cache from app/cache.py:make_cache, so with
+CACHE_BACKEND=sqlite one compiled copy serves every worker on the host.
+`invalidate()` deletes the entry (in all workers) and bumps a per-process version
+so a load already in flight here does not put the old rows back; the TTL bounds
+staleness for edits made outside the API.
+"""
+import asyncio
+import json
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from .cache import make_cache
+from .config import QUESTION_CACHE_TTL_SECONDS, QUESTION_CACHE_MAX_EXAMS
+from .crud_async import list_questions
+
+STUDENT_FIELDS = ("question_id", "text", "options", "marks")
+
+
+class CompiledExam:
+    __slots__ = ("exma_id", "version", "payload_json", "answer_key")
+
+    def __init__(self, exma_id: str, version: int, payload_json: bytes, answer_key: Dict[str, Tuple[str, int]]):
+        self.exma_id = exma_id
+        self.version = version
+        self.payload_json = payload_json
+        self.answer_key = answer_key
+
+    def score(self, answers: Iterable[Tuple[str, str]]) -> int:
+        """Total marks for (question_id, selected_option) pairs."""
+        total = 0
+        key = self.answer_key
+        for question_id, selected in answers:
+            entry = key.get(str(question_id))
+            if entry is not None and str(selected) == entry[0]:
+                total += entry[1]
+        return total
+
+
+def _marks(row: dict) -> int:
+    marks = row.get("marks")
+    return 1 if marks is None else int(marks)
+
+
+def compile_exam(exma_id: str, version: int, rows: List[dict]) -> CompiledExam:
+    safe = [{f: r.get(f) for f in STUDENT_FIELDS} for r in rows]
+    payload = json.dumps(safe, separators=(",", ":"), default=str).encode()
+    # correct_index and submitted options are compared as strings: answers arrive as str
+    answer_key = {
+        str(r.get("question_id")): (str(r.get("correct_index")), _marks(r))
+        for r in rows
+        if r.get("question_id") is not None and r.get("correct_index") is not None
+    }
+    return CompiledExam(exma_id, version, payload, answer_key)
+
+
+class QuestionBank:
+    def __init__(self, ttl: float = QUESTION_CACHE_TTL_SECONDS, maxsize: int = QUESTION_CACHE_MAX_EXAMS):
+        self._cache = make_cache("questions", maxsize=maxsize, ttl=ttl)
+        self._versions: Dict[str, int] = {}
+        self._versions_lock = threading.Lock()
+        # exma_id -> [lock, requests holding or waiting on it, result of the load in flight]
+        self._load_locks: Dict[str, list] = {}
+
+    def version(self, exma_id) -> int:
+        return self._versions.get(str(exma_id), 0)
+
+    def invalidate(self, exma_id=None) -> None:
+        """Bump the version of one exam (or of every cached exam when exma_id is None)."""
+        with self._versions_lock:
+            if exma_id is None:
+                for k in list(self._versions):
+                    self._versions[k] += 1
+                self._cache.clear()
+            else:
+                k = str(exma_id)
+                self._versions[k] = self._versions.get(k, 0) + 1
+                self._cache.delete(k)
+
+    async def get(self, exma_id) -> CompiledExam:
+        key = str(exma_id)
+        compiled = self._cache.get(key)
+        if compiled is not None:
+            return compiled
+        # single-flight: an exam-start spike triggers one load per worker, not one per request
+        entry = self._load_locks.get(key)
+        if entry is None:
+            entry = self._load_locks[key] = [asyncio.Lock(), 0, None]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # requests that waited on this load share its result, even an uncached empty one,
+                # unless the exam was invalidated meanwhile
+                compiled = entry[2] if entry[2] is not None and entry[2].version == self.version(key) else None
+                compiled = compiled or self._cache.peek(key)
+                if compiled is None:
+                    version = self.version(key)
+                    rows = await list_questions(exma_id)
+                    compiled = entry[2] = compile_exam(key, version, rows or [])
+                    # an exam without questions yet is not cached, so questions added later show up at once
+                    if rows and version == self.version(key):
+                        self._cache.set(key, compiled)
+        finally:
+            # the lock only lives as long as the requests waiting on it
+            entry[1] -= 1
+            if entry[1] == 0 and self._load_locks.get(key) is entry:
+                del self._load_locks[key]
+        return compiled
+
+
+question_bank = QuestionBank()
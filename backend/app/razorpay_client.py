@@ -0,0 +1,147 @@
+# app/razorpay_client.py
+"""Async Razorpay Orders API client with idempotent order creation.
+
+Orders are created over one pooled `httpx.AsyncClient` (no threadpool hop, reused
+TLS connections). `OpenOrders` makes /payments/create_order idempotent per
+(user, certification) within a process: concurrent or repeated calls serialize
+on a per-key lock and get the order that is already open instead of a new order
+and a new purchase row. Entries live RAZORPAY_ORDER_TTL_SECONDS and are dropped
+once the purchase is paid. Across workers the purchases table is the source of
+truth: on a miss, create_order first reuses the open ('created') purchase row,
+and a unique partial index (sql/supabase_schema.sql) stops two workers from
+inserting one each.
+
+`purchase_orders` remembers purchase_id -> order for the same TTL so /payments/verify
+can check the signature without first reading the purchase row back.
+
+RAZORPAY_API_BASE points the client at a local stand-in (fake_razorpay.py) for
+tests and load runs.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from .cache import TTLCache
+from .config import (
+    RAZORPAY_KEY_ID,
+    RAZORPAY_KEY_SECRET,
+    RAZORPAY_API_BASE,
+    RAZORPAY_TIMEOUT_SECONDS,
+    RAZORPAY_POOL_MAX_CONNECTIONS,
+    RAZORPAY_ORDER_TTL_SECONDS,
+)
+
+
+class RazorpayError(Exception):
+    def __init__(self, status_code: int, detail):
+        super().__init__(f"Razorpay API error {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RazorpayClient:
+    def __init__(self, base_url: str = RAZORPAY_API_BASE, key_id: str = RAZORPAY_KEY_ID,
+                 key_secret: str = RAZORPAY_KEY_SECRET, timeout: float = RAZORPAY_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self._auth = (key_id or "", key_secret or "")
+        self._timeout = timeout
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # imported with the first order rather than at startup
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=self._auth,
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=RAZORPAY_POOL_MAX_CONNECTIONS,
+                                    max_keepalive_connections=RAZORPAY_POOL_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        res = await self.client.request(method, path, **kwargs)
+        if res.status_code >= 400:
+            try:
+                detail = res.json().get("error", res.text)
+            except Exception:
+                detail = res.text
+            raise RazorpayError(res.status_code, detail)
+        return res.json()
+
+    async def create_order(self, amount: int, currency: str = "INR", receipt: str = None, notes: dict = None) -> dict:
+        payload = {"amount": int(amount), "currency": currency, "payment_capture": 1}
+        if receipt:
+            payload["receipt"] = receipt
+        if notes:
+            payload["notes"] = notes
+        return await self._request("POST", "/v1/orders", json=payload)
+
+    async def fetch_order(self, order_id: str) -> dict:
+        return await self._request("GET", f"/v1/orders/{order_id}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OpenOrders:
+    """Short-lived (user, certification) -> create_order response map with per-key single-flight."""
+
+    def __init__(self, ttl: float = RAZORPAY_ORDER_TTL_SECONDS):
+        self._cache = TTLCache("razorpay_orders", maxsize=50000, ttl=ttl)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+
+    def _open(self, key, amount: int, peek: bool = False) -> Optional[dict]:
+        order = self._cache.peek(key) if peek else self._cache.get(key)
+        # a price change since the order was opened needs a new order
+        return order if order is not None and order.get("amount") == amount else None
+
+    async def get_or_create(self, user_id, cert_id, amount: int, create: Callable[[], Awaitable[dict]]) -> dict:
+        """The open order for (user, certification, amount), calling `create()` at most once per key."""
+        key = (str(user_id), str(cert_id))
+        order = self._open(key, amount)
+        if order is not None:
+            return order
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                order = self._open(key, amount, peek=True)
+                if order is None:
+                    order = await create()
+                    self._cache.set(key, order)
+                return order
+        finally:
+            # the result is cached before the lock is released, so late arrivals with a fresh lock still hit
+            if not lock.locked() and self._locks.get(key) is lock:
+                del self._locks[key]
+
+    def forget(self, user_id, cert_id) -> None:
+        """Drop the open order of (user, certification), e.g. once it has been paid."""
+        self._cache.delete((str(user_id), str(cert_id)))
+
+
+_client: Optional[RazorpayClient] = None
+open_orders = OpenOrders()
+# purchase_id -> {"order_id", "user_id", "certification_id"} for orders opened by this process
+purchase_orders = TTLCache("purchase_orders", maxsize=50000, ttl=RAZORPAY_ORDER_TTL_SECONDS)
+# payment ids whose webhook event has been reconciled; Razorpay delivers at least once and
+# sends several events per payment (payment.captured, order.paid)
+seen_payments = TTLCache("seen_payments", maxsize=100_000, ttl=24 * 3600)
+
+
+def get_razorpay_client() -> RazorpayClient:
+    global _client
+    if _client is None:
+        _client = RazorpayClient()
+    return _client
+
+
+async def close_razorpay_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
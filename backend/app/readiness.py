@@ -0,0 +1,106 @@
+# app/readiness.py
+"""Startup probe that does not hold up startup.
+
+Resolving the schema variants (app/schema.py) is the first thing that touches
+Supabase, and so also the first thing that imports the client libraries and
+opens a connection. Run inline in the startup hook it kept the worker from
+accepting requests until the database answered, for the full connect timeout when
+it did not. `readiness.start()` runs it in a daemon thread instead, retrying
+with exponential backoff (READINESS_RETRY_SECONDS doubling up to
+READINESS_RETRY_MAX_SECONDS) until every probe has succeeded.
+
+Requests served before then use the schema fallbacks: async code never probes
+on the event loop, and sync code resolves lazily with a backoff after failures
+(see app/schema.py). GET /health/ready reports the state and
+answers 503 until the probe has succeeded, for load balancer readiness checks.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from .config import READINESS_RETRY_SECONDS, READINESS_RETRY_MAX_SECONDS
+from .schema import schema
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProbe:
+    def __init__(self, retry: float = READINESS_RETRY_SECONDS, retry_max: float = READINESS_RETRY_MAX_SECONDS):
+        self.retry = max(float(retry), 0.01)
+        self.retry_max = max(float(retry_max), self.retry)
+        self.state = "idle"
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.ready_after: Optional[float] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def check(self) -> bool:
+        """One probe: resolve the schema and report whether everything was settled."""
+        self.attempts += 1
+        resolved = schema.resolve_all()
+        if not schema.resolved:
+            # resolve_all logs and falls back on transient errors; unresolved entries are retried
+            missing = [k for k, v in resolved.items() if v is None] or ["columns"]
+            raise RuntimeError(f"schema not fully resolved: {', '.join(missing)}")
+        return True
+
+    def _run(self) -> None:
+        delay = self.retry
+        while not self._stopping.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self.state, self.error = "retrying", str(e)[:500]
+                logger.warning("Startup probe failed (attempt %d), retrying in %.1fs: %s", self.attempts, delay, e)
+                if self._stopping.wait(delay):
+                    return
+                delay = min(delay * 2, self.retry_max)
+                continue
+            self.ready_after = time.perf_counter() - self.started_at
+            self.state, self.error = "ready", None
+            logger.info("Supabase connectivity check OK after %.2fs; schema=%s", self.ready_after, schema.snapshot())
+            return
+
+    def start(self) -> None:
+        with self._lock:
+            if self.ready or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stopping.clear()
+            self.state = "pending"
+            self.started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="startup-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(5)
+        self._thread = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until ready (or `timeout`); for scripts that want the pre-lazy behaviour."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "attempts": self.attempts,
+            "error": self.error,
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+        }
+
+
+readiness = StartupProbe()
@@ -0,0 +1,65 @@
+# app/revocation.py
+"""Revocation state for self-contained access tokens (JWT_SELF_CONTAINED).
+
+Two compact in-memory structures:
+  * a deny-list of token ids (`jti`) kept only until the token would have expired
+    anyway, for logout / refresh-token rotation, and
+  * a per-user epoch counter. Access tokens carry the epoch they were issued under
+    (`ep`); bumping a user's epoch (e.g. on a role change) rejects all of their
+    earlier access tokens at once without listing them. Refresh tokens are not
+    epoch-bound: /auth/refresh re-reads the user row, so the next access token
+    carries the new role.
+
+Both are per process, so with several workers a revocation is guaranteed only on
+the worker that saw it; the short access-token lifetime bounds the gap elsewhere.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+
+class RevocationList:
+    def __init__(self):
+        self._denied: Dict[str, float] = {}
+        self._epochs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def epoch(self, user_id) -> int:
+        return self._epochs.get(str(user_id), 0)
+
+    def bump_user(self, user_id) -> int:
+        """Invalidate every token issued to `user_id` so far; returns the new epoch."""
+        key = str(user_id)
+        with self._lock:
+            self._epochs[key] = self._epochs.get(key, 0) + 1
+            return self._epochs[key]
+
+    def deny(self, jti: Optional[str], expires_at: float) -> None:
+        if not jti:
+            return
+        with self._lock:
+            self._denied[jti] = float(expires_at)
+            self._prune(time.time())
+
+    def _prune(self, now: float) -> None:
+        # caller holds the lock; at most once a minute
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        for jti in [j for j, exp in self._denied.items() if exp <= now]:
+            del self._denied[jti]
+
+    def is_revoked(self, claims: dict, check_epoch: bool = True) -> bool:
+        if claims.get("jti") in self._denied:
+            return True
+        if not check_epoch:
+            return False
+        user_id = claims.get("user_id")
+        return user_id is not None and int(claims.get("ep", 0)) < self.epoch(user_id)
+
+    def stats(self) -> dict:
+        return {"denied_tokens": len(self._denied), "user_epochs": len(self._epochs)}
+
+
+revocations = RevocationList()
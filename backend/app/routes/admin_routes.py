@@ -1,48 +1,75 @@
 # app/routes/admin_routes.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
 from ..auth import require_admin
-from ..crud import list_attempts, get_proctor_events_for_attempt, update_attempt, get_purchase
+from ..crud import list_attempts, get_proctor_events_for_attempt, update_attempt, get_purchase, update_user_role
 from ..db import supabase_client
+from ..schema import schema
 from ..config import SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_USE_TLS, SENDGRID_API_KEY, SENDGRID_FROM
+from ..config import ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_MAX_STALE_SECONDS
+from ..config import ADMIN_PAGE_SIZE_DEFAULT, ADMIN_PAGE_SIZE_MAX, ADMIN_STREAM_CHUNK_SIZE
+from ..pagination import fetch_page, iter_rows, page_response, ndjson_response, wants_page
+from ..cache import RefreshingSnapshot
+from ..question_bank import question_bank
+from .. import eligibility
 import os
-import io
+import logging
 from fastapi import Depends
 from email.message import EmailMessage
 import smtplib
 import base64
-try:
-    from PIL import Image, ImageDraw, ImageFont
-except Exception:
-    Image = None
+from ..certificates import TEMPLATE_PATH, get_renderer, iter_certificate_zip, pil_available
+from ..config import CERT_BATCH_MAX
+from ..models import CertificateBatchSchema
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-@router.get("/analytics", dependencies=[Depends(require_admin)])
-def analytics():
-    # Simple analytics aggregations; can be expanded
+def _count(table: str, column: str = "id", **filters) -> int:
+    """Row count via a count-only query: PostgREST returns the total in Content-Range, not the rows."""
+    q = supabase_client.table(table).select(column, count="exact")
+    for k, v in filters.items():
+        q = q.eq(k, v)
+    return q.limit(1).execute().count or 0
+
+
+def _compute_analytics() -> dict:
     try:
-        users_count = supabase_client.table("User").select("User_id", count="exact").execute().count
+        users_count = _count(schema.users_table(), schema.users_id_column())
     except Exception:
         users_count = 0
     try:
-        certs = supabase_client.table("certifications").select("*").execute().data
-        active_cert_count = len(certs)
+        # One round trip: counts and revenue aggregated in Postgres (see sql/supabase_schema.sql)
+        agg = supabase_client.rpc("analytics_snapshot", {}).execute().data or {}
+        return {
+            "users_count": users_count,
+            "active_certifications_count": int(agg.get("active_certifications_count") or 0),
+            "attempts_under_review": int(agg.get("attempts_under_review") or 0),
+            "revenue": float(agg.get("revenue") or 0),
+        }
+    except Exception as e:
+        logger.warning("analytics_snapshot RPC unavailable, using count queries: %s", e)
+
+    try:
+        active_cert_count = _count("certifications")
     except Exception:
         # table might not exist in some environments
         active_cert_count = 0
     try:
-        # Prefer transactions table (price column) for revenue, fall back to purchases.amount
+        # Prefer transactions table (price column) for revenue, fall back to purchases.amount.
+        # Without the RPC the sum still needs the column values, so only that column is fetched.
         txs = supabase_client.table("transactions").select("price").execute().data
         if txs:
             revenue = sum([float(t.get("price", 0) or 0) for t in txs])
         else:
-            purchases = supabase_client.table("purchases").select("*").eq("status","paid").execute().data
+            purchases = supabase_client.table("purchases").select("amount").eq("status","paid").execute().data
             revenue = sum([float(p.get("amount",0) or 0) for p in purchases])
     except Exception:
         revenue = 0
     try:
-        attempts_under_review = supabase_client.table("attempts").select("*").eq("status","under_review").execute().data
-        attempts_count = len(attempts_under_review)
+        attempts_count = _count("attempts", status="under_review")
     except Exception:
         attempts_count = 0
     return {
@@ -52,22 +79,68 @@ def analytics():
         "revenue": revenue
     }
 
+
+analytics_snapshot = RefreshingSnapshot(
+    "admin_analytics", _compute_analytics, ttl=ANALYTICS_CACHE_TTL_SECONDS, max_stale=ANALYTICS_MAX_STALE_SECONDS
+)
+
+
+@router.get("/analytics", dependencies=[Depends(require_admin)])
+def analytics():
+    # Cached snapshot; refreshed in the background once older than ANALYTICS_CACHE_TTL_SECONDS
+    return analytics_snapshot.get()
+
 # New endpoint: List all users with name and email
 @router.get("/users", dependencies=[Depends(require_admin)])
-def list_all_users():
-    users = supabase_client.table("User").select("User_id,displayName,email").execute().data
-    user_list = []
-    for u in users:
-        user_list.append({
-            "id": u.get("User_id"),
-            "name": u.get("displayName", ""),
+def list_all_users(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ADMIN_PAGE_SIZE_MAX),
+    stream: bool = False,
+):
+    """Users ordered by id; all of them unless `limit` or `cursor` is given.
+
+    With `limit`/`cursor`, follow `X-Next-Cursor` for the next page; stream=true returns NDJSON.
+    """
+    id_col, name_col = schema.users_id_column(), schema.users_name_column()
+    columns = f"{id_col},{name_col},email"
+
+    def to_out(u):
+        return {
+            "id": u.get(id_col),
+            "name": u.get(name_col, ""),
             "email": u.get("email", "")
-        })
-    return user_list
+        }
+
+    if stream:
+        return ndjson_response(iter_rows(schema.users_table(), id_col, columns=columns, cursor=cursor, chunk_size=ADMIN_STREAM_CHUNK_SIZE), to_out)
+    if not wants_page(cursor, limit):
+        return [to_out(u) for u in iter_rows(schema.users_table(), id_col, columns=columns, chunk_size=ADMIN_STREAM_CHUNK_SIZE)]
+    users, next_cursor = fetch_page(schema.users_table(), id_col, columns=columns, cursor=cursor, limit=limit or ADMIN_PAGE_SIZE_DEFAULT)
+    return page_response([to_out(u) for u in users], next_cursor)
+
+@router.put("/users/{user_id}/role", dependencies=[Depends(require_admin)])
+def set_user_role(user_id: str, payload: dict):
+    """Change a user's role ('student' or 'admin'). Cached user rows are evicted immediately."""
+    role = payload.get("role")
+    if role not in ("student", "admin"):
+        raise HTTPException(status_code=400, detail="role must be 'student' or 'admin'")
+    updated = update_user_role(user_id, role)
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"ok": True, "user": updated}
 
 @router.get("/attempts", dependencies=[Depends(require_admin)])
-def list_all_attempts():
-    return supabase_client.table("attempts").select("*").execute().data
+def list_all_attempts(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ADMIN_PAGE_SIZE_MAX),
+    stream: bool = False,
+):
+    if stream:
+        return ndjson_response(iter_rows("attempts", "id", cursor=cursor, chunk_size=ADMIN_STREAM_CHUNK_SIZE))
+    if not wants_page(cursor, limit):
+        return list(iter_rows("attempts", "id", chunk_size=ADMIN_STREAM_CHUNK_SIZE))
+    rows, next_cursor = fetch_page("attempts", "id", cursor=cursor, limit=limit or ADMIN_PAGE_SIZE_DEFAULT)
+    return page_response(rows, next_cursor)
 
 @router.get("/attempts/{attempt_id}", dependencies=[Depends(require_admin)])
 def attempt_details(attempt_id: str):
@@ -78,21 +151,30 @@ def attempt_details(attempt_id: str):
     return {"attempt": att[0], "events": events}
 
 
-@router.get("/transactions", dependencies=[Depends(require_admin)])
-def list_transactions():
-    # Return recent transactions from the transactions table
-    txs = supabase_client.table("transactions").select("*").order("id", desc=True).execute().data
+def _transaction_out(t):
     # Normalize fields for frontend
-    out = []
-    for t in txs:
-        out.append({
-            "id": t.get("id") or t.get("transaction_id") or str(t.get("id")),
-            "mailid": t.get("mailid") or t.get("email") or "",
-            "price": t.get("price") or t.get("amount") or 0,
-            "course_title": t.get("course_title") or t.get("course") or t.get("certification") or None,
-            "created_at": t.get("created_at") or t.get("inserted_at") or None,
-        })
-    return out
+    return {
+        "id": t.get("id") or t.get("transaction_id") or str(t.get("id")),
+        "mailid": t.get("mailid") or t.get("email") or "",
+        "price": t.get("price") or t.get("amount") or 0,
+        "course_title": t.get("course_title") or t.get("course") or t.get("certification") or None,
+        "created_at": t.get("created_at") or t.get("inserted_at") or None,
+    }
+
+
+@router.get("/transactions", dependencies=[Depends(require_admin)])
+def list_transactions(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ADMIN_PAGE_SIZE_MAX),
+    stream: bool = False,
+):
+    # Most recent transactions first
+    if stream:
+        return ndjson_response(iter_rows("transactions", "id", cursor=cursor, chunk_size=ADMIN_STREAM_CHUNK_SIZE, desc=True), _transaction_out)
+    if not wants_page(cursor, limit):
+        return [_transaction_out(t) for t in iter_rows("transactions", "id", chunk_size=ADMIN_STREAM_CHUNK_SIZE, desc=True)]
+    txs, next_cursor = fetch_page("transactions", "id", cursor=cursor, limit=limit or ADMIN_PAGE_SIZE_DEFAULT, desc=True)
+    return page_response([_transaction_out(t) for t in txs], next_cursor)
 
 @router.put("/attempts/{attempt_id}/review", dependencies=[Depends(require_admin)])
 def review_attempt(attempt_id: str, payload: dict):
@@ -104,10 +186,23 @@ def review_attempt(attempt_id: str, payload: dict):
         updates["score"] = payload["score"]
     if "review_notes" in payload:
         updates["review_notes"] = payload["review_notes"]
-    supabase_client.table("attempts").update(updates).eq("id", attempt_id).execute()
+    rows = supabase_client.table("attempts").update(updates).eq("id", attempt_id).execute().data or []
+    if "status" in updates or "score" in updates:
+        # a new score or a rejection can grant or withdraw the certificate
+        try:
+            eligibility.refresh([(r.get("user_id"), r.get("certification_id")) for r in rows])
+        except Exception as e:
+            logger.warning("review_attempt: eligibility refresh failed for %s: %s", attempt_id, e)
     return {"ok": True}
 
 
+@router.post("/questions/invalidate", dependencies=[Depends(require_admin)])
+def invalidate_questions(exma_id: Optional[str] = None):
+    """Call after editing the `questions` table so exams reload their questions and answer key."""
+    question_bank.invalidate(exma_id)
+    return {"ok": True, "exma_id": exma_id, "version": question_bank.version(exma_id) if exma_id else None}
+
+
 # Admin: generate certificate and email to user
 @router.post("/grant_certificate")
 def grant_certificate(payload: dict, user=Depends(require_admin)):
@@ -116,7 +211,7 @@ def grant_certificate(payload: dict, user=Depends(require_admin)):
     Expected payload: { user_email: str, user_name: str, cert_name: str }
     Email will be sent From the admin's email (the logged-in user).
     """
-    if Image is None:
+    if not pil_available():
         raise HTTPException(status_code=500, detail="Pillow is not installed on the server")
 
     user_email = payload.get("user_email")
@@ -125,79 +220,12 @@ def grant_certificate(payload: dict, user=Depends(require_admin)):
     if not user_email or not user_name or not cert_name:
         raise HTTPException(status_code=400, detail="Missing user_email, user_name, or cert_name")
 
-    # locate template
-    base = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    template_path = os.path.join(base, 'certificate.png')
-    if not os.path.exists(template_path):
+    if not os.path.exists(TEMPLATE_PATH):
         raise HTTPException(status_code=404, detail='Certificate template not found on server')
 
     print(f"[grant_certificate] Rendering certificate for '{user_name}' / cert '{cert_name}'")
     try:
-        img = Image.open(template_path).convert('RGBA')
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
-
-        # Helper to pick a truetype font or fallback
-        def load_font(preferred_size: int):
-            candidates = [
-                '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-                '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
-                'arial.ttf'
-            ]
-            for c in candidates:
-                try:
-                    return ImageFont.truetype(c, preferred_size)
-                except Exception:
-                    continue
-            return ImageFont.load_default()
-
-        # Draw cert title (centered) similar to frontend positions
-        max_width = width - 300
-        title_size = 56
-        title_font = None
-        while title_size > 18:
-            try:
-                title_font = load_font(title_size)
-                tw, th = draw.textsize(cert_name, font=title_font)
-            except Exception:
-                tw = th = 0
-            if tw <= max_width:
-                break
-            title_size -= 2
-
-        title_x = (width - tw) / 2
-        title_y = 460 - (th / 2)
-        # outline by drawing multiple slightly offset white strokes
-        outline_color = (255, 255, 255, 230)
-        text_color = (15, 23, 42, 255)
-        for ox, oy in [(-2, -2), (-2, 2), (2, -2), (2, 2)]:
-            draw.text((title_x + ox, title_y + oy), cert_name, font=title_font, fill=outline_color)
-        draw.text((title_x, title_y), cert_name, font=title_font, fill=text_color)
-
-        # Draw recipient name lower on the cert
-        name_size = 40
-        name_font = None
-        while name_size > 12:
-            try:
-                name_font = load_font(name_size)
-                nw, nh = draw.textsize(user_name, font=name_font)
-            except Exception:
-                nw = nh = 0
-            if nw <= (width - 320):
-                break
-            name_size -= 1
-
-        name_x = (width - nw) / 2
-        name_y = 670 - (nh / 2)
-        for ox, oy in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
-            draw.text((name_x + ox, name_y + oy), user_name, font=name_font, fill=outline_color)
-        draw.text((name_x, name_y), user_name, font=name_font, fill=text_color)
-
-        # Export PNG bytes
-        bio = io.BytesIO()
-        img.convert('RGB').save(bio, format='PNG')
-        bio.seek(0)
-        img_bytes = bio.read()
+        img_bytes = get_renderer().render(cert_name, user_name)
     except Exception as e:
         print('Failed to render certificate:', e)
         raise HTTPException(status_code=500, detail='Failed to render certificate')
@@ -216,3 +244,28 @@ def grant_certificate(payload: dict, user=Depends(require_admin)):
     # we intentionally do not send email and return a neutral response indicating the
     # action is disabled.
     return {"ok": True, "emailed_to": None, "sent_via": "disabled"}
+
+
+@router.post("/grant_certificates/batch", dependencies=[Depends(require_admin)])
+def grant_certificates_batch(payload: CertificateBatchSchema):
+    """Render a cohort's certificates in the process pool and stream them back as one ZIP.
+
+    Expected payload: { certificates: [{ user_email, user_name, cert_name }, ...] }
+    Entries are named <n>_<user_email>.png in request order.
+    """
+    if not pil_available():
+        raise HTTPException(status_code=500, detail="Pillow is not installed on the server")
+    if not payload.certificates:
+        raise HTTPException(status_code=400, detail="No certificates requested")
+    if len(payload.certificates) > CERT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {CERT_BATCH_MAX} certificates per batch")
+    if not os.path.exists(TEMPLATE_PATH):
+        raise HTTPException(status_code=404, detail='Certificate template not found on server')
+
+    grants = [(c.user_email, c.user_name, c.cert_name) for c in payload.certificates]
+    print(f"[grant_certificates_batch] Rendering {len(grants)} certificates")
+    return StreamingResponse(
+        iter_certificate_zip(grants),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="certificates.zip"'},
+    )
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import jwt as pyjwt
 from ..models import GoogleToken
-from ..auth import verify_google_token, create_jwt
-from ..crud import upsert_user, get_user_by_email
-from ..config import ADMIN_EMAILS
+from ..auth import verify_google_token, create_jwt, issue_tokens, decode_jwt, security
+from ..crud_async import upsert_user, get_user_by_email, get_user_by_id
+from ..revocation import revocations
+from ..config import ADMIN_EMAILS, JWT_SELF_CONTAINED
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,26 +16,30 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/google")
-def auth_google(body: GoogleToken):
+async def auth_google(body: GoogleToken):
     try:
-        idinfo = verify_google_token(body.id_token)
+        # google-auth verification is blocking (it may fetch Google's certs); keep it off the event loop
+        idinfo = await run_in_threadpool(verify_google_token, body.id_token)
         if not idinfo:
             raise HTTPException(status_code=401, detail="Invalid Google token")
 
         email = idinfo.get("email")
         name = idinfo.get("name")
 
-        user = get_user_by_email(email)
+        user = await get_user_by_email(email)
 
         if user:
             role = user.get("role", "student")
             user_id = user.get("User_id")
         else:
             role = "admin" if email.lower() in ADMIN_EMAILS else "student"
-            new_user = upsert_user(email=email, display_name=name, role=role)
+            new_user = await upsert_user(email=email, display_name=name, role=role)
             user = new_user
             user_id = new_user.get("User_id")
 
+        if JWT_SELF_CONTAINED:
+            return {**issue_tokens(user), "user": user}
+
         token = create_jwt({"user_id": user_id, "email": email, "role": role})
 
         return {"access_token": token, "user": user}
@@ -45,7 +52,44 @@ class TokenBody(BaseModel):
     id_token: str
 
 
+class RefreshBody(BaseModel):
+    refresh_token: str
+
+
+@router.post("/refresh")
+async def refresh(body: RefreshBody):
+    """Exchange a refresh token for a new access/refresh pair (the old refresh token is revoked).
+
+    The user row is re-read here, so role changes show up in the next access token.
+    """
+    claims = decode_jwt(body.refresh_token, expected_type="refresh")
+    try:
+        user = await get_user_by_id(claims.get("user_id")) if claims.get("user_id") else None
+        if not user and claims.get("email"):
+            user = await get_user_by_email(claims["email"])
+    except Exception:
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    revocations.deny(claims.get("jti"), claims.get("exp", 0))
+    return {**issue_tokens(user), "user": user}
+
+
+@router.post("/logout")
+async def logout(body: RefreshBody = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the presented access token and, if given, the refresh token."""
+    access = decode_jwt(credentials.credentials)
+    revocations.deny(access.get("jti"), access.get("exp", 0))
+    if body and body.refresh_token:
+        try:
+            refresh_claims = decode_jwt(body.refresh_token, expected_type="refresh")
+            revocations.deny(refresh_claims.get("jti"), refresh_claims.get("exp", 0))
+        except HTTPException:
+            pass
+    return {"ok": True}
+
+
 @router.post("/debug-decode")
-def debug_decode(body: TokenBody):
+async def debug_decode(body: TokenBody):
     payload = pyjwt.decode(body.id_token, options={"verify_signature": False})
     return {"payload": payload}
@@ -1,34 +1,39 @@
 # app/routes/cert_routes.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from ..crud import list_certifications, get_cert, create_cert, update_cert, delete_cert
 from ..auth import get_current_user, require_admin
+from ..catalog import catalog, catalog_response, CERTIFICATIONS
 from ..models import CertificationCreate
 
 router = APIRouter(prefix="/certifications", tags=["certifications"])
 
 @router.get("")
-def list_all():
-    return list_certifications(active_only=True)
+def list_all(request: Request):
+    entry = catalog.get(CERTIFICATIONS, "active", lambda: list_certifications(active_only=True))
+    return catalog_response(request, entry)
 
 @router.get("/{cert_id}")
-def get_one(cert_id: str):
-    res = get_cert(cert_id)
-    if not res:
+def get_one(cert_id: str, request: Request):
+    entry = catalog.get(CERTIFICATIONS, ("id", cert_id), lambda: (get_cert(cert_id) or [None])[0])
+    if entry is None:
         raise HTTPException(status_code=404, detail="Certification not found")
-    return res[0]
+    return catalog_response(request, entry)
 
 @router.post("", dependencies=[Depends(require_admin)])
 def create_certification(payload: CertificationCreate):
     data = payload.dict()
     res = create_cert(data)
+    catalog.bump(CERTIFICATIONS)
     return res[0]
 
 @router.put("/{cert_id}", dependencies=[Depends(require_admin)])
 def update_certification(cert_id: str, payload: CertificationCreate):
     res = update_cert(cert_id, payload.dict())
+    catalog.bump(CERTIFICATIONS)
     return res[0]
 
 @router.delete("/{cert_id}", dependencies=[Depends(require_admin)])
 def delete_certification(cert_id: str):
     res = delete_cert(cert_id)
+    catalog.bump(CERTIFICATIONS)
     return {"deleted": True}
@@ -1,26 +1,31 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from ..db import supabase_client
+from ..catalog import catalog, catalog_response, COURSES
 
 router = APIRouter(prefix="/courses", tags=["courses"])
 
 
+def _load_courses():
+    # fetch raw fields and map to frontend-friendly keys
+    res = supabase_client.table('courses').select('id,title,badge,desc,img,price').order('id', desc=False).execute()
+    rows = res.data or []
+    # map 'desc' -> 'description', 'img' -> 'imageUrl'
+    mapped = []
+    for r in rows:
+        mapped.append({
+            'id': r.get('id'),
+            'title': r.get('title'),
+            'badge': r.get('badge'),
+            'description': r.get('desc'),
+            'imageUrl': r.get('img'),
+            'price': r.get('price'),
+        })
+    return mapped
+
+
 @router.get("")
-def list_courses():
+def list_courses(request: Request):
     try:
-        # fetch raw fields and map to frontend-friendly keys
-        res = supabase_client.table('courses').select('id,title,badge,desc,img,price').order('id', desc=False).execute()
-        rows = res.data or []
-        # map 'desc' -> 'description', 'img' -> 'imageUrl'
-        mapped = []
-        for r in rows:
-            mapped.append({
-                'id': r.get('id'),
-                'title': r.get('title'),
-                'badge': r.get('badge'),
-                'description': r.get('desc'),
-                'imageUrl': r.get('img'),
-                'price': r.get('price'),
-            })
-        return mapped
+        return catalog_response(request, catalog.get(COURSES, "list", _load_courses))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+import asyncio
 import logging
+import time
 from ..auth import get_current_user, require_admin
-from ..crud import create_attempt, update_attempt
-from ..db import supabase_client
-from fastapi import Depends
+from ..crud_async import create_attempt, update_attempt, update_attempt_scores
+from ..grading import score_submissions, answers_to_dict
+from ..question_bank import question_bank
+from ..schema import schema
+from ..db import get_async_client
+from ..outbox import outbox
 from ..models import ExamCreateSchema, ExamCompleteSchema
+from .. import eligibility
+from ..config import CERT_PASS_SCORE, ADMIN_PAGE_SIZE_DEFAULT, ADMIN_PAGE_SIZE_MAX, ADMIN_STREAM_CHUNK_SIZE, REGRADE_CHUNK_SIZE
+from ..pagination import afetch_page, aiter_rows, page_response, andjson_response, wants_page
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +21,12 @@ router = APIRouter(prefix="/exams", tags=["exams"])
 
 
 @router.get("/ping")
-def ping():
+async def ping():
     return {"ok": True, "message": "exams router alive"}
 
 
 @router.post("", status_code=201)
-def create_exam(payload: ExamCreateSchema, user=Depends(get_current_user)):
+async def create_exam(payload: ExamCreateSchema, user=Depends(get_current_user)):
     try:
         name = user.get('name') or user.get('displayName') or user.get('email')
         logger.info('create_exam called for user=%s title=%s', name, payload.title)
@@ -25,7 +34,7 @@ def create_exam(payload: ExamCreateSchema, user=Depends(get_current_user)):
         # a certification_id we store it on the attempt so we can link the pass to a purchase.
         cert_id = getattr(payload, 'certification_id', None) or payload.title
         # create_attempt expects user_id and cert_id
-        attempt_id = create_attempt(user_id=user.get('User_id') or user.get('id') or user.get('UserId'), cert_id=cert_id)
+        attempt_id = await create_attempt(user_id=user.get('User_id') or user.get('id') or user.get('UserId'), cert_id=cert_id)
         return {"ok": True, "exma_id": attempt_id}
     except Exception as e:
         logger.exception('create_exam failed: %s', e)
@@ -33,16 +42,18 @@ def create_exam(payload: ExamCreateSchema, user=Depends(get_current_user)):
 
 
 @router.put("/{exma_id}")
-def complete_exam(exma_id: str, payload: dict, user=Depends(get_current_user)):
+async def complete_exam(exma_id: str, payload: dict, user=Depends(get_current_user)):
     try:
         logger.info('complete_exam called exma_id=%s user=%s payload=%s', exma_id, getattr(user, 'get', lambda k: None)('email'), payload)
         # Update the attempt record with score and mark completed
         passing_score = int(payload.get('passing_score', 0))
         updates = {"score": passing_score, "status": 'completed'}
-        res = update_attempt(exma_id, updates)
+        res = await update_attempt(exma_id, updates)
 
         # Insert a minimal row into `exams` table using the fields requested by the client.
         # The `exams` table in your DB expects: exma_id, title, passing_score, questions, nameofuser
+        # Side-effect writes go through the outbox (app/outbox.py); only the attempt update above
+        # is on the response path.
         try:
             exam_row = {}
             # include exma_id only if it's an integer (DB exma_id is int8)
@@ -59,30 +70,30 @@ def complete_exam(exma_id: str, payload: dict, user=Depends(get_current_user)):
             # questions column is json in your schema; store the provided questions payload (number or structure)
             exam_row['questions'] = payload.get('questions') if payload.get('questions') is not None else None
             exam_row['nameofuser'] = payload.get('nameofuser')
-
-            # attempt to insert; if table doesn't exist or insert fails, log and continue
-            try:
-                supabase_client.table('exams').insert([exam_row]).execute()
-            except Exception as e:
-                logger.warning('Failed to insert into exams table (non-fatal): %s', e)
+            await outbox.aenqueue('exam_row', exam_row)
         except Exception as e:
-            logger.warning('Failed to prepare exams row: %s', e)
+            logger.warning('Failed to queue exams row: %s', e)
 
-        # If passed, attempt to mark purchase as 'issued' so certificate availability is tracked in DB
+        # If passed, the purchase is marked 'issued' so certificate availability is tracked in DB,
+        # and a passing score is recorded in the certificate eligibility index. The index row is
+        # written before responding: the client checks availability as soon as this returns.
         passed = bool(payload.get('pass_status'))
-        if passed:
+        if passed or eligibility.is_passing(passing_score):
             try:
-                # attempt record contains certification_id; fetch it
-                attempt_row = supabase_client.table('attempts').select('*').eq('id', exma_id).execute().data
-                cert_id = None
-                if attempt_row and len(attempt_row) > 0:
-                    cert_id = attempt_row[0].get('certification_id')
                 user_id = user.get('User_id') or user.get('id') or user.get('UserId')
-                if cert_id and user_id:
-                    # mark any paid purchase for this user+cert as 'issued'
-                    supabase_client.table('purchases').update({'status': 'issued'}).eq('user_id', user_id).eq('certification_id', cert_id).execute()
+                if user_id:
+                    job = {'attempt_id': exma_id, 'user_id': user_id, 'score': passing_score, 'passed': passed}
+                    cert_id = (res or [{}])[0].get('certification_id')
+                    if cert_id and eligibility.is_passing(passing_score):
+                        try:
+                            await asyncio.to_thread(eligibility.record_passes, [
+                                {'user_id': user_id, 'certification_id': cert_id, 'score': passing_score, 'attempt_id': exma_id}])
+                            job['eligibility_recorded'] = True
+                        except Exception as e:
+                            logger.warning('Eligibility write failed, left to the outbox: %s', e)
+                    await outbox.aenqueue('attempt_completed', job)
             except Exception as e:
-                logger.warning('Failed to mark purchase issued: %s', e)
+                logger.warning('Failed to queue attempt completion side effects: %s', e)
 
         return {"ok": True, "updated": res}
     except Exception as e:
@@ -91,118 +102,198 @@ def complete_exam(exma_id: str, payload: dict, user=Depends(get_current_user)):
 
 
 @router.get('/certification/{cert_id}/availability', dependencies=[Depends(get_current_user)])
-def certificate_availability(cert_id: str, user=Depends(get_current_user)):
+async def certificate_availability(cert_id: str, user=Depends(get_current_user)):
     """Return whether a certificate is available for the current user for the given certification.
 
     Availability rule: the attempts table must contain a completed attempt for this user and
-    certification where the recorded score equals 75 (as requested).
+    certification whose recorded score is at least CERT_PASS_SCORE (75 by default). The
+    answer comes from the certificate_eligibility index; `_legacy_availability` is only
+    used on databases that do not have that table yet.
     """
     try:
         user_id = user.get('User_id') or user.get('id') or user.get('UserId')
         if not user_id:
             raise HTTPException(status_code=401, detail='User id not found')
-        # First, check the persistent `exams` table for a recorded passing exam for this user.
-        try:
-            # prefer display name or email as nameofuser column
-            name_candidates = [user.get('display_name') or user.get('displayName'), user.get('name'), user.get('email')]
-            name_candidates = [str(n) for n in name_candidates if n]
-            if name_candidates:
-                # Try a direct query using the first candidate
-                try:
-                    rows_ex = supabase_client.table('exams').select('*').eq('nameofuser', name_candidates[0]).execute().data
-                except Exception:
-                    # fallback to retrieving all exams and filter locally
-                    rows_all = supabase_client.table('exams').select('*').execute().data or []
-                    rows_ex = [r for r in rows_all if (r.get('nameofuser') or r.get('name') or r.get('Name')) in name_candidates]
-            else:
-                rows_ex = []
-        except Exception:
+        eligible = await eligibility.lookup(user_id, cert_id)
+        if eligible is None:
+            eligible = await _legacy_availability(user, user_id, cert_id)
+        return {"available": eligible}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception('certificate_availability failed: %s', e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _legacy_availability(user, user_id, cert_id) -> bool:
+    """Scan `exams` and `attempts` for a passing score (pre-index databases)."""
+    db = get_async_client()
+    # First, check the persistent `exams` table for a recorded passing exam for this user.
+    try:
+        # prefer display name or email as nameofuser column
+        name_candidates = [user.get('display_name') or user.get('displayName'), user.get('name'), user.get('email')]
+        name_candidates = [str(n) for n in name_candidates if n]
+        if name_candidates:
+            # Try a direct query using the first candidate
+            try:
+                rows_ex = (await db.table('exams').select('*').eq('nameofuser', name_candidates[0]).execute()).data
+            except Exception:
+                # fallback to retrieving all exams and filter locally
+                rows_all = (await db.table('exams').select('*').execute()).data or []
+                rows_ex = [r for r in rows_all if (r.get('nameofuser') or r.get('name') or r.get('Name')) in name_candidates]
+        else:
             rows_ex = []
+    except Exception:
+        rows_ex = []
 
-        if rows_ex:
-            for r in rows_ex:
-                try:
-                    sc = None
-                    if r.get('passing_score') is not None:
-                        sc = int(float(r.get('passing_score')))
-                    elif r.get('score') is not None:
-                        sc = int(float(r.get('score')))
-                    if sc is not None and sc >= 75:
-                        return {"available": True}
-                except Exception:
-                    continue
-
-        # Query attempts for this user+certification. Be tolerant to schema differences
-        try:
-            # Preferred, efficient query (may fail if column names differ)
-            rows = supabase_client.table('attempts').select('*').eq('user_id', user_id).eq('certification_id', cert_id).eq('status', 'completed').execute().data
-        except Exception:
-            # Fallback: fetch attempts and filter in Python to handle column name variations
+    if rows_ex:
+        for r in rows_ex:
             try:
-                all_rows = supabase_client.table('attempts').select('*').execute().data or []
-            except Exception as e:
-                logger.warning('Failed to query attempts table for availability fallback: %s', e)
-                raise
-            rows = []
-            for r in all_rows:
-                # match user id using possible column names
-                row_user = r.get('user_id') or r.get('User_id') or r.get('UserId')
-                if not row_user or str(row_user) != str(user_id):
-                    continue
-                # match certification id with possible column names
-                row_cert = r.get('certification_id') or r.get('certificationId') or r.get('certification') or r.get('cert_id') or r.get('title')
-                if not row_cert or str(row_cert) != str(cert_id):
-                    continue
-                # match status
-                status = (r.get('status') or r.get('state') or '').lower()
-                if status != 'completed':
-                    continue
-                rows.append(r)
-
-        if not rows:
-            return {"available": False}
-        for r in rows:
+                sc = None
+                if r.get('passing_score') is not None:
+                    sc = int(float(r.get('passing_score')))
+                elif r.get('score') is not None:
+                    sc = int(float(r.get('score')))
+                if sc is not None and sc >= CERT_PASS_SCORE:
+                    return True
+            except Exception:
+                continue
+
+    # Query attempts for this user+certification. Be tolerant to schema differences
+    try:
+        # Preferred, efficient query (may fail if column names differ)
+        rows = (await db.table('attempts').select('*').eq('user_id', user_id).eq('certification_id', cert_id).eq('status', 'completed').execute()).data
+    except Exception:
+        # Fallback: fetch attempts and filter in Python to handle column name variations
+        try:
+            all_rows = (await db.table('attempts').select('*').execute()).data or []
+        except Exception as e:
+            logger.warning('Failed to query attempts table for availability fallback: %s', e)
+            raise
+        rows = []
+        for r in all_rows:
+            # match user id using possible column names
+            row_user = r.get('user_id') or r.get('User_id') or r.get('UserId')
+            if not row_user or str(row_user) != str(user_id):
+                continue
+            # match certification id with possible column names
+            row_cert = r.get('certification_id') or r.get('certificationId') or r.get('certification') or r.get('cert_id') or r.get('title')
+            if not row_cert or str(row_cert) != str(cert_id):
+                continue
+            # match status
+            status = (r.get('status') or r.get('state') or '').lower()
+            if status != 'completed':
+                continue
+            rows.append(r)
+
+    if not rows:
+        return False
+    for r in rows:
+        try:
+            score = r.get('score') or r.get('passing_score') or r.get('points')
+            # score may be numeric or string; coerce to int when possible
+            if score is None:
+                continue
             try:
-                score = r.get('score') or r.get('passing_score') or r.get('points')
-                # score may be numeric or string; coerce to int when possible
-                if score is None:
-                    continue
-                try:
-                    sc = int(float(score))
-                except Exception:
-                    continue
-                if sc >= 75:
-                    return {"available": True}
+                sc = int(float(score))
             except Exception:
                 continue
-        return {"available": False}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception('certificate_availability failed: %s', e)
-        raise HTTPException(status_code=500, detail=str(e))
+            if sc >= CERT_PASS_SCORE:
+                return True
+        except Exception:
+            continue
+    return False
+
+
+def _exam_out(r):
+    # Normalize fields for frontend consumption
+    return {
+        'exma_id': r.get('exma_id') or r.get('id') or None,
+        'title': r.get('title') or r.get('name') or '',
+        'passing_score': r.get('passing_score') or r.get('score') or 0,
+        'nameofuser': r.get('nameofuser') or r.get('name') or r.get('user') or '',
+        'questions': r.get('questions') or None,
+        'created_at': r.get('created_at') or r.get('inserted_at') or None
+    }
 
 
 @router.get('/admin/list', dependencies=[Depends(require_admin)])
-def admin_list_exams():
-    """Return rows from the `exams` table for admin viewing.
+async def admin_list_exams(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ADMIN_PAGE_SIZE_MAX),
+    stream: bool = False,
+):
+    """Return rows from the `exams` table for admin viewing, newest first.
 
-    Returns a list of objects containing at least: exma_id, title, passing_score, nameofuser, questions, created_at
+    Returns a list of objects containing at least: exma_id, title, passing_score, nameofuser, questions, created_at.
+    Every row unless `limit` or `cursor` is given; pages are keyed on exma_id, so then follow
+    the `X-Next-Cursor` header. stream=true returns NDJSON.
     """
     try:
-        rows = supabase_client.table('exams').select('*').order('exma_id', desc=True).execute().data or []
-        # Normalize fields for frontend consumption
-        out = []
-        for r in rows:
-            out.append({
-                'exma_id': r.get('exma_id') or r.get('id') or None,
-                'title': r.get('title') or r.get('name') or '',
-                'passing_score': r.get('passing_score') or r.get('score') or 0,
-                'nameofuser': r.get('nameofuser') or r.get('name') or r.get('user') or '',
-                'questions': r.get('questions') or None,
-                'created_at': r.get('created_at') or r.get('inserted_at') or None
-            })
-        return out
+        if stream:
+            return andjson_response(aiter_rows('exams', 'exma_id', cursor=cursor, chunk_size=ADMIN_STREAM_CHUNK_SIZE, desc=True), _exam_out)
+        if not wants_page(cursor, limit):
+            return [_exam_out(r) async for r in aiter_rows('exams', 'exma_id', chunk_size=ADMIN_STREAM_CHUNK_SIZE, desc=True)]
+        rows, next_cursor = await afetch_page('exams', 'exma_id', cursor=cursor, limit=limit or ADMIN_PAGE_SIZE_DEFAULT, desc=True)
+        return page_response([_exam_out(r) for r in rows], next_cursor)
     except Exception as e:
         logger.exception('admin_list_exams failed: %s', e)
         raise HTTPException(status_code=500, detail='Failed to fetch exams')
+
+
+@router.post('/admin/{exma_id}/regrade', dependencies=[Depends(require_admin)])
+async def regrade_exam(exma_id: str):
+    """Re-score every stored submission for an exam against its current answer key.
+
+    Call after correcting a question's `correct_index` or `marks`. The question cache is
+    invalidated, submissions are read in keyset chunks and scored together
+    (app/grading.py), and only changed scores are written back in bulk; the certificate
+    eligibility rows of those attempts' users are then re-derived (eligibility.refresh).
+
+    `exma_id` is the question-set id, which attempts store as their `certification_id`
+    (start_attempt loads questions by it); older schemas without that column keep it in
+    `attempts.exma_id`, the same fallback submit uses.
+    """
+    try:
+        started = time.perf_counter()
+        question_bank.invalidate(exma_id)
+        exam = await question_bank.get(exma_id)
+        if not exam.answer_key:
+            raise HTTPException(status_code=404, detail='No questions with an answer key for this exam')
+
+        scanned = changed = 0
+        chunk = []
+        exam_column = 'certification_id' if await schema.ahas_column('attempts', 'certification_id') else 'exma_id'
+
+        async def grade(rows):
+            nonlocal changed
+            scores = score_submissions(exam, [answers_to_dict(r.get('answers')) for r in rows])
+            changed_rows = [(r, s) for r, s in zip(rows, scores) if r.get('score') is None or float(r['score']) != s]
+            if not changed_rows:
+                return
+            changed += await update_attempt_scores([{'id': r['id'], 'score': s} for r, s in changed_rows])
+            # the eligibility index is keyed by certification_id, which only the newer schema has
+            if exam_column == 'certification_id':
+                try:
+                    await asyncio.to_thread(eligibility.refresh, [(r.get('user_id'), exma_id) for r, _ in changed_rows])
+                except Exception as e:
+                    logger.warning('regrade exma_id=%s: eligibility refresh failed for %d attempts: %s', exma_id, len(changed_rows), e)
+
+        async for row in aiter_rows('attempts', 'id', columns='id,user_id,answers,score', chunk_size=REGRADE_CHUNK_SIZE, filters={exam_column: exma_id}):
+            if row.get('answers') is None:
+                continue
+            scanned += 1
+            chunk.append(row)
+            if len(chunk) >= REGRADE_CHUNK_SIZE:
+                await grade(chunk)
+                chunk = []
+        if chunk:
+            await grade(chunk)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info('regrade exma_id=%s scanned=%s changed=%s in %.1f ms', exma_id, scanned, changed, elapsed_ms)
+        return {"ok": True, "exma_id": exma_id, "version": exam.version, "graded": scanned, "updated": changed, "elapsed_ms": round(elapsed_ms, 1)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception('regrade_exam failed: %s', e)
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,18 +1,67 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from ..auth import require_admin
 from ..db import supabase_client
+from ..cache import cache_stats
+from ..batching import buffer_stats
+from ..outbox import outbox
+from ..schema import schema
+from ..readiness import readiness
+from ..google_verifier import get_google_verifier
+from ..revocation import revocations
+from ..tracing import slow_queries
 
 router = APIRouter(prefix="/health", tags=["health"]) 
 
+# Only /health/ready is public (load balancers call it); the rest expose internals and are admin-only.
 
-@router.get("/db")
+
+@router.get("/db", dependencies=[Depends(require_admin)])
 def db_health():
     """Lightweight DB connectivity check: attempt to read 1 row from pg_catalog or a small table."""
     try:
         # Use a simple RPC via PostgREST to check schema; select from pg_catalog is restricted, so try a small existing table
-        res = supabase_client.table("User").select("User_id").limit(1).execute()
+        res = supabase_client.table(schema.users_table()).select(schema.users_id_column()).limit(1).execute()
         # If table doesn't exist, PostgREST will return an error
         if hasattr(res, 'status_code') and res.status_code >= 400:
             raise Exception(getattr(res, 'error', res))
         return {"ok": True, "rows": len(res.data or [])}
     except Exception as e:
         raise HTTPException(status_code=500, detail={"ok": False, "error": str(e)})
+
+
+@router.get("/ready")
+async def readiness_health():
+    """Readiness for load balancers: 503 until the background startup probe has resolved the schema."""
+    state = readiness.snapshot()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@router.get("/cache", dependencies=[Depends(require_admin)])
+def cache_health():
+    """Hit/miss counters for the in-process caches, used to size them."""
+    return {"caches": cache_stats()}
+
+
+@router.get("/schema", dependencies=[Depends(require_admin)])
+def schema_health():
+    """Table/column variants resolved for this process."""
+    return schema.snapshot()
+
+
+@router.get("/queues", dependencies=[Depends(require_admin)])
+def queue_health():
+    """Queue depth and flush latency of the write-behind buffers, and the outbox backlog."""
+    return {"buffers": buffer_stats(), "outbox": outbox.stats()}
+
+
+@router.get("/auth", dependencies=[Depends(require_admin)])
+def auth_health():
+    """Google token verification latency, certificate cache state and token revocation sizes."""
+    return {**get_google_verifier().stats(), "revocations": revocations.stats()}
+
+
+@router.get("/slow_queries", dependencies=[Depends(require_admin)])
+def slow_query_health():
+    """PostgREST calls over SLOW_QUERY_MS: totals per query shape (index candidates first) and the latest calls."""
+    return slow_queries.snapshot()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from ..metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of this process's request, DB, threadpool and cache metrics."""
+    # async on purpose: the threadpool gauges must be read on the event loop, not from a worker thread
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -1,86 +1,183 @@
 # app/routes/payment_routes.py
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import FileResponse
 from ..auth import get_current_user
 from ..auth import require_admin
-from ..crud import get_cert, create_purchase_row, get_purchase, update_purchase
-from ..config import RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET
-import razorpay, uuid
+from ..crud_async import get_cert, create_purchase_row, get_open_purchase, get_purchase, update_purchase, create_transaction, verify_purchase_payment
+from ..db import get_async_client
+from ..razorpay_client import get_razorpay_client, open_orders, purchase_orders, seen_payments, RazorpayError
+import uuid
 from ..models import PurchaseCreate, VerifyPaymentSchema
-from ..utils import verify_razorpay_signature
+from ..utils import verify_razorpay_signature, verify_razorpay_webhook_signature
+from ..outbox import outbox
+from ..schema import _is_missing_function_error, _is_unique_violation
+from ..config import RAZORPAY_WEBHOOK_SECRET
 
 router = APIRouter(prefix="/payments", tags=["payments"])
-razor = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
 
 @router.post("/create_order")
-def create_order(payload: PurchaseCreate, user=Depends(get_current_user)):
-    certs = get_cert(payload.certification_id)
+async def create_order(payload: PurchaseCreate, user=Depends(get_current_user)):
+    certs = await get_cert(payload.certification_id)
     if not certs:
         raise HTTPException(status_code=404, detail="Certification not found")
     cert = certs[0]
     price = float(cert.get("price_numeric", 0.0))
-    if price <= 0:
-        # Optionally allow free purchases: create purchase row and return
-        purchase_id = str(uuid.uuid4())
-        create_purchase_row(user_id=user["id"], cert_id=payload.certification_id, amount=price, currency="INR", razorpay_order_id="", purchase_id=purchase_id)
-        return {"order_id": "", "amount": int(price * 100), "currency": "INR", "purchase_id": purchase_id}
     amount_paise = int(price * 100)
-    purchase_id = str(uuid.uuid4())
-    order = razor.order.create({
-        "amount": amount_paise,
-        "currency": "INR",
-        "receipt": purchase_id,
-        "payment_capture": 1
-    })
-    create_purchase_row(user_id=user["id"], cert_id=payload.certification_id, amount=price, currency="INR", razorpay_order_id=order["id"], purchase_id=purchase_id)
-    return {"order_id": order["id"], "amount": amount_paise, "currency": "INR", "purchase_id": purchase_id}
+
+    def order_response(purchase):
+        order_id = purchase.get("razorpay_order_id") or ""
+        if order_id:
+            purchase_orders.set(purchase["id"], {"order_id": order_id, "user_id": user["id"], "certification_id": payload.certification_id})
+        return {"order_id": order_id, "amount": amount_paise, "currency": purchase.get("currency") or "INR", "purchase_id": purchase["id"]}
+
+    async def open_order():
+        # the open purchase may have been created by another worker, or before a restart
+        existing = (await get_open_purchase(user["id"], payload.certification_id) or [None])[0]
+        if existing is not None:
+            if round(float(existing.get("amount") or 0) * 100) == amount_paise and (existing.get("razorpay_order_id") or price <= 0):
+                return order_response(existing)
+            # the price changed since that order was opened; it stays payable, but is no longer the open one
+            await update_purchase(existing["id"], {"status": "superseded"})
+        purchase_id = str(uuid.uuid4())
+        # Optionally allow free purchases: a purchase row without a Razorpay order
+        order_id = "" if price <= 0 else (await get_razorpay_client().create_order(amount_paise, "INR", receipt=purchase_id))["id"]
+        try:
+            await create_purchase_row(user_id=user["id"], cert_id=payload.certification_id, amount=price, currency="INR", razorpay_order_id=order_id, purchase_id=purchase_id)
+        except Exception as e:
+            # a concurrent call on another worker inserted first (purchases_open_order_idx): use its purchase
+            if not _is_unique_violation(e):
+                raise
+            winner = (await get_open_purchase(user["id"], payload.certification_id) or [None])[0]
+            if winner is None:
+                raise
+            return order_response(winner)
+        return order_response({"id": purchase_id, "razorpay_order_id": order_id, "currency": "INR"})
+
+    # double clicks / retries for the same user+certification get the order that is already open
+    try:
+        return await open_orders.get_or_create(user["id"], payload.certification_id, amount_paise, open_order)
+    except RazorpayError as e:
+        print("Razorpay order creation failed:", e)
+        raise HTTPException(status_code=502, detail="Payment provider error")
+
+_RPC_ERRORS = {
+    "not_found": (404, "Purchase not found"),
+    "order_mismatch": (400, "Order id does not match purchase"),
+    "already_paid": (409, "Purchase already paid with another payment"),
+}
+
+
+def _paid_response(user):
+    # Generate a transaction id to return for client-side reference
+    txn_id = str(uuid.uuid4())
+
+    # Return payment confirmation including mail id and transaction id
+    return {"status": "paid", "transaction_id": txn_id, "mailid": user.get("email"), "price": 1}
+
 
 @router.post("/verify")
-def verify_payment(body: VerifyPaymentSchema, user=Depends(get_current_user)):
-    purchase = get_purchase(body.purchase_id)
-    if not purchase:
-        raise HTTPException(status_code=404, detail="Purchase not found")
-    purchase = purchase[0]
-    order_id = purchase.get("razorpay_order_id")
+async def verify_payment(body: VerifyPaymentSchema, user=Depends(get_current_user)):
+    # The order id comes from the create_order cache when this process opened the order;
+    # otherwise it is read from the purchase row.
+    opened = purchase_orders.get(body.purchase_id)
+    purchase = None
+    if opened:
+        order_id = opened["order_id"]
+    else:
+        purchase = await get_purchase(body.purchase_id)
+        if not purchase:
+            raise HTTPException(status_code=404, detail="Purchase not found")
+        purchase = purchase[0]
+        order_id = purchase.get("razorpay_order_id")
     if not order_id:
         raise HTTPException(status_code=400, detail="No order id on purchase")
     ok = verify_razorpay_signature(order_id, body.razorpay_payment_id, body.razorpay_signature)
     if not ok:
         raise HTTPException(status_code=400, detail="Invalid signature")
-    update_purchase(body.purchase_id, {"status":"paid", "razorpay_payment_id": body.razorpay_payment_id, "razorpay_signature": body.razorpay_signature})
-    # Insert a transaction record with mailid and price (default 1 rupee)
+
+    # Mark paid + record the transaction atomically in one round trip
+    try:
+        result = await verify_purchase_payment(body.purchase_id, order_id, body.razorpay_payment_id, body.razorpay_signature,
+                                               mailid=user.get("email"), price=1)
+    except Exception as e:
+        # Only a database without the function takes the sequential path. Any other failure (timeout,
+        # 5xx) may have happened after the function committed, and replaying the writes here could
+        # record the transaction twice; the client retries and the RPC treats the replay as a no-op.
+        if not _is_missing_function_error(e):
+            print("verify_purchase_payment failed:", e)
+            raise HTTPException(status_code=503, detail="Payment verification temporarily unavailable, please retry")
+        print("verify_purchase_payment RPC unavailable, using sequential updates:", e)
+        result = None
+    if result is not None:
+        if result.get("error"):
+            status, detail = _RPC_ERRORS.get(result["error"], (400, result["error"]))
+            raise HTTPException(status_code=status, detail=detail)
+        purchase_orders.delete(body.purchase_id)
+        open_orders.forget(result.get("user_id"), result.get("certification_id"))
+        return _paid_response(user)
+
+    if purchase is None:
+        purchase = (await get_purchase(body.purchase_id) or [None])[0]
+        if not purchase:
+            raise HTTPException(status_code=404, detail="Purchase not found")
+    await update_purchase(body.purchase_id, {"status":"paid", "razorpay_payment_id": body.razorpay_payment_id, "razorpay_signature": body.razorpay_signature})
+    # the order is no longer open: the next create_order for this certification starts a new one
+    purchase_orders.delete(body.purchase_id)
+    open_orders.forget(purchase.get("user_id"), purchase.get("certification_id"))
+    # Record a transaction with mailid and price (default 1 rupee) through the outbox; the
+    # certificate title is looked up by the worker (app/crud.py:insert_transactions)
     try:
-        from ..crud import create_transaction, get_cert
-        # Attempt to include certificate title if purchase links to a certification
-        cert_title = None
         cert_id = purchase.get("certification_id") or purchase.get("cert_id")
-        if cert_id:
-            certs = get_cert(cert_id)
-            if certs:
-                cert_title = certs[0].get("title") or certs[0].get("name")
-        txn = create_transaction(mailid=user.get("email"), price=1, course_title=cert_title)
+        await outbox.aenqueue("transaction", {"mailid": user.get("email"), "price": 1, "certification_id": cert_id})
     except Exception as e:
         # Log but don't fail the whole flow
-        print("Failed to create transaction row:", e)
-        txn = None
+        print("Failed to queue transaction row:", e)
 
-    # Generate a transaction id to return for client-side reference
-    txn_id = str(uuid.uuid4())
+    return _paid_response(user)
 
-    # Return payment confirmation including mail id and transaction id
-    return {"status": "paid", "transaction_id": txn_id, "mailid": user.get("email"), "price": 1}
+
+# Webhook events that mean the order's money has been captured
+_CAPTURED_EVENTS = {"payment.captured", "order.paid"}
+
+
+@router.post("/webhook")
+async def razorpay_webhook(request: Request):
+    """Razorpay webhook: verify the body signature and queue captured payments for batched reconciliation.
+
+    Purchases whose browser never called /payments/verify are marked paid by the outbox worker
+    (app/outbox.py:reconcile_payments). The event is written to the outbox file before the 200,
+    so an acknowledged payment survives a crash; if that write fails Razorpay gets a 500 and
+    redelivers. Deliveries of an already reconciled payment are ignored.
+    """
+    if not RAZORPAY_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook not configured")
+    body = await request.body()
+    if not verify_razorpay_webhook_signature(body, request.headers.get("x-razorpay-signature", "")):
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if event.get("event") not in _CAPTURED_EVENTS:
+        return {"ok": True, "queued": False}
+    payment = ((event.get("payload") or {}).get("payment") or {}).get("entity") or {}
+    payment_id, order_id = payment.get("id"), payment.get("order_id")
+    if not payment_id or not order_id or seen_payments.get(payment_id) is not None:
+        return {"ok": True, "queued": False}
+    await outbox.aenqueue("payment_event", {"payment_id": payment_id, "order_id": order_id, "email": payment.get("email")})
+    return {"ok": True, "queued": True}
 
 
 @router.post("/record_transaction")
-def record_transaction(payload: dict, user=Depends(get_current_user)):
+async def record_transaction(payload: dict, user=Depends(get_current_user)):
     """Record a transaction row with the logged-in user's email and provided price.
     Expects payload: { price: number, payment_id?: string }
     """
     price = int(payload.get("price", 1))
     course_title = payload.get("course_title")
     try:
-        from ..crud import create_transaction
-        res = create_transaction(mailid=user.get("email"), price=price, course_title=course_title)
+        res = await create_transaction(mailid=user.get("email"), price=price, course_title=course_title)
     except Exception as e:
         print("Failed to insert transaction:", e)
         raise HTTPException(status_code=500, detail="Failed to record transaction")
@@ -88,7 +185,7 @@ def record_transaction(payload: dict, user=Depends(get_current_user)):
 
 
 @router.get('/certificates/template')
-def certificate_template():
+async def certificate_template():
     """Serve the certificate template image stored in the backend folder as 'certificate.png'."""
     import os
     base = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -100,7 +197,7 @@ def certificate_template():
 
 
 @router.post('/admin_record_transaction')
-def admin_record_transaction(payload: dict, admin=Depends(require_admin)):
+async def admin_record_transaction(payload: dict, admin=Depends(require_admin)):
     """Admin-only: record a transaction on behalf of a user.
 
     Expects JSON: { mailid: string, price: number, course_title?: string }
@@ -114,8 +211,7 @@ def admin_record_transaction(payload: dict, admin=Depends(require_admin)):
     if not mailid:
         raise HTTPException(status_code=400, detail='mailid is required')
     try:
-        from ..crud import create_transaction
-        res = create_transaction(mailid=mailid, price=price, course_title=course_title)
+        res = await create_transaction(mailid=mailid, price=price, course_title=course_title)
     except Exception as e:
         print('admin_record_transaction failed:', e)
         raise HTTPException(status_code=500, detail='Failed to create transaction')
@@ -123,11 +219,10 @@ def admin_record_transaction(payload: dict, admin=Depends(require_admin)):
 
 
 @router.get("/my_transactions")
-def my_transactions(user=Depends(get_current_user)):
+async def my_transactions(user=Depends(get_current_user)):
     """Return transactions for the currently authenticated user (by email)."""
     try:
-        from ..db import supabase_client
-        txs = supabase_client.table("transactions").select("*").eq("mailid", user.get("email")).order("id", desc=True).execute().data
+        txs = (await get_async_client().table("transactions").select("*").eq("mailid", user.get("email")).order("id", desc=True).execute()).data
         out = []
         for t in txs:
             out.append({
@@ -0,0 +1,225 @@
+# app/schema.py
+"""Resolve which table/column variants this Supabase project actually has.
+
+Different deployments of this backend grew slightly different schemas (``User`` vs
+``users``, ``User_id`` vs ``id``, optional ``pass_status`` / ``certification_id``
+columns). Instead of discovering that by trial and error on every request, the
+variants are probed once per process (at startup, or lazily on first use) and the
+crud layer issues a single correctly shaped query from then on.
+
+Probes are blocking round trips on the sync client, so they never run on the event
+loop: async callers use `aresolve_users()` / `ahas_column()`, which probe in a
+worker thread, and a plain lookup made on the loop gets the fallbacks (preferred
+names, optional columns assumed present and dropped if a write rejects them)
+until the startup probe (app/readiness.py) has resolved them. After a failed probe, lazy lookups do not
+probe again for SCHEMA_PROBE_RETRY_SECONDS, so an outage is not re-probed on every call.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import SCHEMA_PROBE_RETRY_SECONDS
+from .db import supabase_client
+
+logger = logging.getLogger(__name__)
+
+USER_TABLES = ("User", "users", "users_table")
+USER_ID_COLUMNS = ("User_id", "user_id", "id", "UserId")
+USER_NAME_COLUMNS = ("displayName", "name")
+
+# Columns that only exist on some deployments: (table, column)
+OPTIONAL_COLUMNS = (
+    ("attempts", "certification_id"),
+    ("attempts", "answers"),
+    ("exams", "pass_status"),
+    ("certificate_eligibility", "best_score"),
+)
+
+# PostgREST / Postgres error codes meaning "this table or column does not exist"
+_MISSING_CODES = {"42P01", "42703", "PGRST200", "PGRST204", "PGRST205"}
+
+
+def _is_missing_error(exc: Exception) -> bool:
+    code = getattr(exc, "code", None)
+    if code in _MISSING_CODES:
+        return True
+    msg = str(exc)
+    return any(c in msg for c in _MISSING_CODES) or "does not exist" in msg
+
+
+# ... and "this SQL function (RPC) does not exist"
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+
+def _is_missing_function_error(exc: Exception) -> bool:
+    code = getattr(exc, "code", None)
+    if code in _MISSING_FUNCTION_CODES:
+        return True
+    msg = str(exc)
+    return any(c in msg for c in _MISSING_FUNCTION_CODES) or "Could not find the function" in msg
+
+
+# ... and "this insert hit a unique constraint"
+_UNIQUE_VIOLATION_CODE = "23505"
+
+
+def _is_unique_violation(exc: Exception) -> bool:
+    return getattr(exc, "code", None) == _UNIQUE_VIOLATION_CODE or _UNIQUE_VIOLATION_CODE in str(exc)
+
+
+class SchemaRegistry:
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+        self._users: Optional[Tuple[str, str, str]] = None
+        self._columns: Dict[Tuple[str, str], bool] = {}
+        self._retry_at = 0.0
+
+    @property
+    def client(self):
+        return self._client or supabase_client
+
+    def _may_probe(self, force: bool = False) -> bool:
+        """Lazy probes are skipped on the event loop and during the backoff after a failure."""
+        if force:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        return False
+
+    def _failed(self) -> None:
+        self._retry_at = time.monotonic() + SCHEMA_PROBE_RETRY_SECONDS
+
+    def _probe(self, table: str, columns: str = "*"):
+        """Return the probe rows, None if the table/column is missing; re-raise other errors."""
+        try:
+            return self.client.table(table).select(columns).limit(1).execute().data or []
+        except Exception as e:
+            if _is_missing_error(e):
+                return None
+            raise
+
+    def _resolve_users(self) -> Optional[Tuple[str, str, str]]:
+        for table in USER_TABLES:
+            rows = self._probe(table)
+            if rows is None:
+                continue
+            if rows:
+                keys = rows[0].keys()
+                id_col = next((c for c in USER_ID_COLUMNS if c in keys), USER_ID_COLUMNS[0])
+                name_col = next((c for c in USER_NAME_COLUMNS if c in keys), USER_NAME_COLUMNS[0])
+            else:
+                # empty table: probe the columns individually
+                id_col = next((c for c in USER_ID_COLUMNS if self._probe(table, c) is not None), USER_ID_COLUMNS[0])
+                name_col = next((c for c in USER_NAME_COLUMNS if self._probe(table, c) is not None), USER_NAME_COLUMNS[0])
+            return table, id_col, name_col
+        return None
+
+    def _users_info(self, force: bool = False) -> Tuple[str, str, str]:
+        if self._users is None:
+            if not self._may_probe(force):
+                return USER_TABLES[0], USER_ID_COLUMNS[0], USER_NAME_COLUMNS[0]
+            with self._lock:
+                if self._users is None:
+                    try:
+                        self._users = self._resolve_users()
+                    except Exception as e:
+                        # transient failure: use the preferred names and retry after the backoff
+                        self._failed()
+                        logger.warning("User table resolution failed, retrying later: %s", e)
+                        return USER_TABLES[0], USER_ID_COLUMNS[0], USER_NAME_COLUMNS[0]
+                    if self._users is None:
+                        logger.warning("No user table found among %s", USER_TABLES)
+                        self._users = (USER_TABLES[0], USER_ID_COLUMNS[0], USER_NAME_COLUMNS[0])
+                    else:
+                        logger.info("Resolved user table=%s id=%s name=%s", *self._users)
+        return self._users
+
+    async def aresolve_users(self) -> None:
+        """Resolve the user table in a worker thread, for async callers; a no-op once resolved or while backing off."""
+        if self._users is None and time.monotonic() >= self._retry_at:
+            await asyncio.to_thread(self._users_info)
+
+    def users_table(self) -> str:
+        return self._users_info()[0]
+
+    def users_id_column(self) -> str:
+        return self._users_info()[1]
+
+    def users_name_column(self) -> str:
+        return self._users_info()[2]
+
+    def has_column(self, table: str, column: str, force: bool = False) -> bool:
+        """Whether `table.column` exists. Unknown (not probed yet, or probe failed) is treated as present."""
+        key = (table, column)
+        known = self._columns.get(key)
+        if known is not None:
+            return known
+        if not self._may_probe(force):
+            return True
+        try:
+            present = self._probe(table, column) is not None
+        except Exception as e:
+            self._failed()
+            logger.warning("Column probe %s.%s failed, assuming present: %s", table, column, e)
+            return True
+        self._columns[key] = present
+        return present
+
+    async def ahas_column(self, table: str, column: str) -> bool:
+        """`has_column` for async callers: an unsettled column is probed in a worker thread."""
+        known = self._columns.get((table, column))
+        if known is not None:
+            return known
+        if time.monotonic() < self._retry_at:
+            return True
+        return await asyncio.to_thread(self.has_column, table, column)
+
+    def mark_missing(self, table: str, column: str) -> None:
+        """Record a column as absent after a write was rejected because of it."""
+        self._columns[(table, column)] = False
+
+    def rejected_optional_column(self, table: str, exc: Exception, keys) -> Optional[str]:
+        """If `exc` was caused by one of `keys` that is an optional column of `table`, mark and return it."""
+        msg = str(exc)
+        for t, column in OPTIONAL_COLUMNS:
+            if t == table and column in keys and column in msg:
+                self.mark_missing(table, column)
+                return column
+        return None
+
+    def resolve_all(self) -> dict:
+        """Probe everything not settled yet, ignoring the failure backoff (the startup probe has its own)."""
+        self._users_info(force=True)
+        for table, column in OPTIONAL_COLUMNS:
+            self.has_column(table, column, force=True)
+        return self.snapshot()
+
+    @property
+    def resolved(self) -> bool:
+        """Whether the user table and every optional column have been settled by a successful probe."""
+        return self._users is not None and all(key in self._columns for key in OPTIONAL_COLUMNS)
+
+    def snapshot(self) -> dict:
+        users = self._users or (None, None, None)
+        return {
+            "users_table": users[0],
+            "users_id_column": users[1],
+            "users_name_column": users[2],
+            "columns": {f"{t}.{c}": v for (t, c), v in self._columns.items()},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._users = None
+            self._columns.clear()
+            self._retry_at = 0.0
+
+
+schema = SchemaRegistry()
@@ -0,0 +1,343 @@
+# app/shared_cache.py
+"""Host-local cache storage shared by the uvicorn workers of one machine.
+
+With CACHE_BACKEND=sqlite the caches built by app/cache.py:make_cache keep their
+entries in one SQLite file (WAL mode, so readers never wait on the writer)
+instead of in each worker's memory: a user or question set loaded by one worker
+is a local read for the others, and memory grows with hosts, not workers.
+
+Request handlers never write the file or wait on its lock: `set()`, `delete()`
+and `clear()` only queue the change, and one background thread per process
+writes each queued batch in a single transaction. The same thread polls the
+`cache_invalidations` feed every SHARED_CACHE_SYNC_SECONDS and drops the named
+keys from this process's in-memory copies. A process that fell so far behind
+that rows were pruned before it read them drops all of its copies. Reads use
+their own connection with a short busy timeout (WAL readers do not wait on the
+writer), and a key with a queued change is reported missing until it has been
+written, so a worker always reads its own writes. The background thread also
+recounts each namespace's entries every few seconds, so `count()` (reported by
+/metrics) is a dict lookup rather than a query on the event loop.
+
+Values are pickled, so the file must only be writable by the application user,
+like the outbox file next to it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import SHARED_CACHE_PATH, SHARED_CACHE_SYNC_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+create table if not exists cache (
+  ns text not null,
+  key text not null,
+  value blob not null,
+  expires_at real not null,
+  primary key (ns, key)
+) without rowid;
+create index if not exists cache_expiry on cache (ns, expires_at);
+create table if not exists cache_invalidations (
+  seq integer primary key autoincrement,
+  ns text not null,
+  key text,
+  origin text not null,
+  at real not null
+);
+create index if not exists cache_invalidations_key on cache_invalidations (ns, key, at);
+"""
+
+# expired rows and over-size namespaces are trimmed every this many writes
+_PRUNE_EVERY = 500
+# invalidation rows are kept this long; a worker that has not synced for longer drops its local copies
+_FEED_RETENTION_SECONDS = 600.0
+# sets queued beyond this are not shared (the local copy still serves them); deletes are always queued
+_MAX_QUEUED_WRITES = 10_000
+# the per-namespace entry counts reported by count() are refreshed this often
+_COUNT_EVERY_SECONDS = 5.0
+# reads on the request path give up (and count as a miss) rather than wait longer for the file
+_READ_TIMEOUT_SECONDS = 0.5
+
+
+class SharedStore:
+    def __init__(self, path: str = SHARED_CACHE_PATH, sync_interval: float = SHARED_CACHE_SYNC_SECONDS):
+        self.path = path
+        self.sync_interval = float(sync_interval)
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn = None
+        self._lock = threading.Lock()
+        self._reader = None
+        self._read_lock = threading.Lock()
+        self._listeners: Dict[str, Callable[[Optional[str]], None]] = {}
+        self._maxsize: Dict[str, int] = {}
+        self._seq = 0
+        self._synced_at = 0.0
+        self._writes = 0
+        # ns -> live entries, written by the background thread only; None until its first count
+        self._counts: Optional[Dict[str, int]] = None
+        self._counted_at = 0.0
+        # queued ("set" | "delete" | "clear", ns, keys, value, ttl, queued_at) and the (ns, key) they touch
+        self._queue: deque = deque()
+        self._queue_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, Optional[str]], int] = {}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.invalidations_sent = 0
+        self.invalidations_received = 0
+        self.dropped_writes = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+                    conn.execute("pragma journal_mode=wal")
+                    conn.execute("pragma synchronous=normal")
+                    conn.executescript(_SCHEMA)
+                    # only evictions made after this process started concern its (empty) local copies
+                    self._seq = conn.execute("select coalesce(max(seq), 0) from cache_invalidations").fetchone()[0]
+                    self._synced_at = time.monotonic()
+                    self._conn = conn
+        return self._conn
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        if self._reader is None:
+            with self._read_lock:
+                if self._reader is None:
+                    self._reader = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                                   timeout=_READ_TIMEOUT_SECONDS)
+        return self._reader
+
+    def register(self, ns: str, on_invalidate: Callable[[Optional[str]], None], maxsize: int) -> None:
+        """`on_invalidate(key)` is called for evictions of `ns` made by other processes (key None: clear)."""
+        self._listeners[ns] = on_invalidate
+        self._maxsize[ns] = max(int(maxsize), 1)
+
+    def get(self, ns: str, key: str) -> Optional[Tuple[bytes, float]]:
+        """(value, seconds left) of a live entry, else None; also None while a change to the key is queued."""
+        self._ensure_started()
+        if self._conn is None:
+            # the feed position is not known yet, so a copy read now could miss its invalidation
+            return None
+        with self._queue_lock:
+            if (ns, key) in self._pending or (ns, None) in self._pending:
+                return None
+        now = time.time()
+        reader = self.reader
+        with self._read_lock:
+            row = reader.execute("select value, expires_at from cache where ns = ? and key = ? and expires_at > ?",
+                                 (ns, key, now)).fetchone()
+        return (row[0], row[1] - now) if row else None
+
+    def set(self, ns: str, key: str, value: bytes, ttl: float) -> None:
+        self._submit(("set", ns, [key], value, ttl, time.time()))
+
+    def delete(self, ns: str, keys: Iterable[str]) -> None:
+        keys = list(dict.fromkeys(keys))
+        if keys:
+            self._submit(("delete", ns, keys, None, None, time.time()))
+
+    def clear(self, ns: str) -> None:
+        self._submit(("clear", ns, [None], None, None, time.time()))
+
+    def _submit(self, op: tuple) -> None:
+        kind, ns, keys = op[:3]
+        with self._queue_lock:
+            if kind == "set" and len(self._queue) >= _MAX_QUEUED_WRITES:
+                self.dropped_writes += 1
+                return
+            self._queue.append(op)
+            for key in keys:
+                self._pending[(ns, key)] = self._pending.get((ns, key), 0) + 1
+        self._ensure_started()
+        self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write every queued change in one transaction, broadcasting deletes. Returns the number of changes."""
+        with self._queue_lock:
+            ops: List[tuple] = list(self._queue)
+            self._queue.clear()
+        if not ops:
+            return 0
+        now = time.time()
+        sent = 0
+        try:
+            conn = self.conn
+            with self._lock:
+                conn.execute("begin immediate")
+                try:
+                    for kind, ns, keys, value, ttl, queued_at in ops:
+                        if kind == "set":
+                            # a value loaded before another worker's delete must not outlive that delete
+                            conn.execute("insert or replace into cache (ns, key, value, expires_at) select ?, ?, ?, ? "
+                                         "where not exists (select 1 from cache_invalidations "
+                                         "where ns = ? and (key = ? or key is null) and at >= ?)",
+                                         (ns, keys[0], sqlite3.Binary(value), now + ttl, ns, keys[0], queued_at))
+                            continue
+                        if kind == "delete":
+                            conn.executemany("delete from cache where ns = ? and key = ?", [(ns, k) for k in keys])
+                        else:
+                            conn.execute("delete from cache where ns = ?", (ns,))
+                        conn.executemany("insert into cache_invalidations (ns, key, origin, at) values (?, ?, ?, ?)",
+                                         [(ns, k, self.origin, queued_at) for k in keys])
+                        sent += len(keys)
+                    conn.execute("commit")
+                except Exception:
+                    conn.execute("rollback")
+                    raise
+                self.invalidations_sent += sent
+                before = self._writes
+                self._writes += len(ops)
+                prune = self._writes // _PRUNE_EVERY != before // _PRUNE_EVERY
+        except Exception as e:
+            # other workers keep their copies until the TTL, as if the store were unreachable
+            logger.warning("shared cache: dropped %d queued change(s): %s", len(ops), e)
+            prune = False
+        finally:
+            with self._queue_lock:
+                for _kind, ns, keys, _value, _ttl, _queued_at in ops:
+                    for key in keys:
+                        left = self._pending[(ns, key)] - 1
+                        if left:
+                            self._pending[(ns, key)] = left
+                        else:
+                            del self._pending[(ns, key)]
+        if prune:
+            self.prune()
+        return len(ops)
+
+    def sync(self, force: bool = False) -> None:
+        """Apply other processes' evictions to the registered local copies (throttled to sync_interval)."""
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        conn = self.conn
+        with self._lock:
+            rows = conn.execute("select seq, ns, key, origin from cache_invalidations where seq > ? order by seq",
+                                (self._seq,)).fetchall()
+            if not rows:
+                return
+            missed = rows[0][0] > self._seq + 1 and self._seq > 0
+            self._seq = rows[-1][0]
+        if missed:
+            logger.warning("shared cache: invalidation feed was pruned past this worker; dropping local copies")
+            for listener in self._listeners.values():
+                listener(None)
+        for _, ns, key, origin in rows:
+            if origin == self.origin:
+                continue
+            listener = self._listeners.get(ns)
+            if listener is not None:
+                self.invalidations_received += 1
+                listener(key)
+
+    def prune(self) -> None:
+        """Drop expired entries, trim each namespace to its maxsize (soonest to expire first) and age out the feed."""
+        now = time.time()
+        conn = self.conn
+        with self._lock:
+            conn.execute("delete from cache where expires_at <= ?", (now,))
+            for ns, maxsize in self._maxsize.items():
+                extra = conn.execute("select count(*) from cache where ns = ?", (ns,)).fetchone()[0] - maxsize
+                if extra > 0:
+                    conn.execute("delete from cache where ns = ? and key in "
+                                 "(select key from cache where ns = ? order by expires_at limit ?)", (ns, ns, extra))
+            conn.execute("delete from cache_invalidations where at < ?", (now - _FEED_RETENTION_SECONDS,))
+
+    def recount(self, force: bool = False) -> None:
+        """Refresh the per-namespace entry counts (throttled to _COUNT_EVERY_SECONDS)."""
+        now = time.monotonic()
+        if not force and now - self._counted_at < _COUNT_EVERY_SECONDS:
+            return
+        self._counted_at = now
+        conn = self.conn
+        with self._lock:
+            rows = conn.execute("select ns, count(*) from cache where expires_at > ? group by ns", (time.time(),)).fetchall()
+        self._counts = dict(rows)
+
+    def _run(self) -> None:
+        try:
+            self.conn
+        except Exception as e:
+            logger.warning("shared cache: cannot open %s: %s", self.path, e)
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.sync()
+                self.recount()
+            except Exception as e:
+                logger.warning("shared cache: background sync failed: %s", e)
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self.start()
+
+    def start(self) -> None:
+        with self._queue_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="shared-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the background thread after writing what is still queued."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("shared cache: final flush failed: %s", e)
+
+    def count(self, ns: str) -> Optional[int]:
+        """Live entries of `ns` as of the background thread's last recount; None before the first one."""
+        counts = self._counts
+        return None if counts is None else counts.get(ns, 0)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "last_seq": self._seq,
+            "invalidations_sent": self.invalidations_sent,
+            "invalidations_received": self.invalidations_received,
+            "queued_writes": len(self._queue),
+            "dropped_writes": self.dropped_writes,
+        }
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store() -> SharedStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedStore()
+    return _store
+
+
+def stop_shared_store() -> None:
+    """Flush and stop the store's background thread, if this process ever used it."""
+    if _store is not None:
+        _store.stop()
@@ -0,0 +1,196 @@
+# app/tracing.py
+"""Request ids, per-request PostgREST spans and the slow-query log.
+
+`TracingMiddleware` gives every HTTP request an id (the caller's X-Request-ID if
+it sent one, else a new one) and echoes it in the response. While the request
+runs, every instrumented PostgREST call (app/instrumentation.py) is recorded as
+a span: table, operation, filter shape, rows, duration and offset from the
+start of the request. A request slower than TRACE_SLOW_REQUEST_MS is logged with
+all of its spans, so a slow /exams/certification/{cert_id}/availability shows
+which of its queries took the time.
+
+Independently of requests, any call slower than SLOW_QUERY_MS goes to the
+`app.slow_queries` logger (JSON lines, also appended to SLOW_QUERY_LOG_PATH when
+set) and is aggregated by query shape for GET /health/slow_queries, which ranks
+shapes by total time spent: the list to work down when adding indexes.
+
+Filter values are not recorded (they are emails, user ids, ...), only which
+columns are filtered and how, e.g. ``select attempts where eq(user_id) and
+eq(status)``.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+
+from .config import SLOW_QUERY_MS, SLOW_QUERY_LOG_PATH, SLOW_QUERY_RECENT, TRACE_SLOW_REQUEST_MS, TRACE_MAX_SPANS
+from .instrumentation import QueryCall, add_observer
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class Trace:
+    __slots__ = ("request_id", "method", "path", "scope", "started", "spans", "dropped")
+
+    def __init__(self, request_id: str, method: str, path: str, scope: dict):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+        self.dropped = 0
+
+    @property
+    def route(self) -> str:
+        # set by FastAPI once the request has been routed
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.path
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+def query_shape(call: QueryCall) -> str:
+    """`op table where eq(col) and in(col) order(col)`: the query without its values."""
+    if call.op == "rpc":
+        return f"rpc {call.table}"
+    parts, order = [], ""
+    for f in call.filters:
+        if f[0] == "order":
+            order = f" order({f[1]})" if len(f) > 1 else ""
+            continue
+        name = f[0].rstrip("_")
+        parts.append(f"{name}({f[1]})" if len(f) > 1 else name)
+    return f"{call.op} {call.table}" + (" where " + " and ".join(parts) if parts else "") + order
+
+
+class SlowQueryLog:
+    """Recent slow calls plus per-shape totals since process start."""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, recent: int = SLOW_QUERY_RECENT):
+        self.threshold_ms = float(threshold_ms)
+        self.recent = deque(maxlen=max(int(recent), 1))
+        self._shapes: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: QueryCall, trace: Optional[Trace]) -> None:
+        ms = call.duration * 1000
+        if ms < self.threshold_ms:
+            return
+        shape = query_shape(call)
+        entry = {
+            "ts": round(time.time(), 3),
+            "request_id": trace.request_id if trace is not None else None,
+            "route": f"{trace.method} {trace.route}" if trace is not None else "background",
+            "query": shape,
+            "rows": call.rows,
+            "ms": round(ms, 2),
+            "error": str(call.error)[:200] if call.error is not None else None,
+        }
+        with self._lock:
+            self.recent.append(entry)
+            totals = self._shapes.setdefault(shape, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += ms
+            totals[2] = max(totals[2], ms)
+            totals[3] += call.rows
+        slow_query_logger.warning(json.dumps(entry, separators=(",", ":")))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = list(self.recent)
+            shapes = [
+                {"query": shape, "count": t[0], "total_ms": round(t[1], 2), "max_ms": round(t[2], 2),
+                 "avg_ms": round(t[1] / t[0], 2), "avg_rows": round(t[3] / t[0], 1)}
+                for shape, t in self._shapes.items()
+            ]
+        shapes.sort(key=lambda s: s["total_ms"], reverse=True)
+        return {"threshold_ms": self.threshold_ms, "by_query": shapes, "recent": recent[::-1]}
+
+
+slow_queries = SlowQueryLog()
+
+
+def _on_query(call: QueryCall) -> None:
+    trace = _current.get()
+    if trace is not None:
+        if len(trace.spans) < TRACE_MAX_SPANS:
+            end = time.perf_counter() - trace.started
+            trace.spans.append({
+                "query": query_shape(call),
+                "rows": call.rows,
+                "start_ms": round((end - call.duration) * 1000, 2),
+                "ms": round(call.duration * 1000, 2),
+                "error": call.error is not None,
+            })
+        else:
+            trace.dropped += 1
+    slow_queries.record(call, trace)
+
+
+add_observer(_on_query)
+
+
+def _configure_slow_query_file() -> None:
+    if not SLOW_QUERY_LOG_PATH:
+        return
+    handler = logging.FileHandler(SLOW_QUERY_LOG_PATH)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_query_logger.addHandler(handler)
+
+
+_configure_slow_query_file()
+
+
+class TracingMiddleware:
+    """ASGI middleware: request id in and out, spans collected for the duration of the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                # accept the caller's id (a proxy or the frontend) so logs line up across services
+                request_id = value.decode("latin-1")[:128]
+                break
+        trace = Trace(request_id or uuid.uuid4().hex, scope["method"], scope.get("path", ""), scope)
+        token = _current.set(trace)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            elapsed_ms = (time.perf_counter() - trace.started) * 1000
+            if elapsed_ms >= TRACE_SLOW_REQUEST_MS:
+                logger.warning("slow request %s %s %.1fms request_id=%s db_calls=%d spans=%s",
+                               trace.method, trace.route, elapsed_ms, trace.request_id,
+                               len(trace.spans) + trace.dropped, json.dumps(trace.spans, separators=(",", ":")))
@@ -1,6 +1,6 @@
 # app/utils.py
 import hmac, hashlib
-from .config import RAZORPAY_KEY_SECRET
+from .config import RAZORPAY_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET
 
 def verify_razorpay_signature(order_id: str, payment_id: str, signature: str) -> bool:
     msg = f"{order_id}|{payment_id}"
@@ -10,3 +10,15 @@ def verify_razorpay_signature(order_id: str, payment_id: str, signature: str) ->
         digestmod=hashlib.sha256
     ).hexdigest()
     return gen == signature
+
+def verify_razorpay_webhook_signature(body: bytes, signature: str, secret: str = None) -> bool:
+    """Razorpay signs the raw webhook body with the webhook secret (X-Razorpay-Signature)."""
+    secret = secret or RAZORPAY_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    gen = hmac.new(
+        key=bytes(secret, "utf-8"),
+        msg=body,
+        digestmod=hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(gen, signature)
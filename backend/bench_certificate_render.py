@@ -0,0 +1,81 @@
+"""Micro-benchmark for server-side certificate rendering.
+
+Usage (from backend/):  python bench_certificate_render.py [-n 50]
+
+Reports per-certificate time for:
+  legacy  - reopen the template and reload fonts on every step of a linear shrink loop
+  render  - CertificateRenderer with a cold render cache (unique names)
+  cached  - CertificateRenderer render-cache hits
+"""
+import argparse
+import io
+import statistics
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.certificates import CertificateRenderer, TEMPLATE_PATH, FONT_CANDIDATES
+
+
+def legacy_render(cert_name: str, user_name: str) -> bytes:
+    img = Image.open(TEMPLATE_PATH).convert('RGBA')
+    draw = ImageDraw.Draw(img)
+    width, _ = img.size
+
+    def load_font(size):
+        for c in FONT_CANDIDATES:
+            try:
+                return ImageFont.truetype(c, size)
+            except Exception:
+                continue
+        return ImageFont.load_default()
+
+    for text, size, floor, step, margin, y in ((cert_name, 56, 18, 2, 300, 460), (user_name, 40, 12, 1, 320, 670)):
+        while size > floor:
+            font = load_font(size)
+            l, t, r, b = draw.textbbox((0, 0), text, font=font)
+            if r - l <= width - margin:
+                break
+            size -= step
+        draw.text(((width - (r - l)) / 2, y - (b - t) / 2), text, font=font, fill=(15, 23, 42, 255))
+    bio = io.BytesIO()
+    img.convert('RGB').save(bio, format='PNG')
+    return bio.getvalue()
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<8} n={len(samples):<5} mean={statistics.mean(samples):8.2f} ms  "
+          f"p50={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=50, help='certificates per scenario')
+    args = parser.parse_args()
+
+    # long titles/names force several shrink steps, which is where the legacy loop hurts
+    names = [(f"Advanced Full Stack Cloud Engineering Professional Certificate {i}",
+              f"Learner With A Fairly Long Display Name Number {i}") for i in range(args.n)]
+
+    t0 = time.perf_counter()
+    renderer = CertificateRenderer()
+    print(f"renderer init: {(time.perf_counter() - t0) * 1000:.2f} ms (font={renderer.font_path})")
+
+    report('legacy', timed(legacy_render, names))
+    report('render', timed(renderer.render, names))
+    report('cached', timed(renderer.render, names))
+
+
+if __name__ == '__main__':
+    main()
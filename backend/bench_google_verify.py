@@ -0,0 +1,85 @@
+"""Offline check and benchmark of the cached Google ID token verifier.
+
+Generates an RSA key set locally, serves it through an injected fetcher (no network),
+signs ID tokens with it and measures verification latency. Also checks that expired,
+wrong-audience, wrong-issuer and tampered tokens are rejected and that an unknown
+key id triggers exactly one cert refetch.
+
+Usage (from backend/):  python bench_google_verify.py [--tokens 2000]
+"""
+import argparse
+import time
+
+import rsa
+from google.auth import crypt, jwt
+
+from app.google_verifier import GoogleTokenVerifier, TokenVerificationError
+
+AUDIENCE = "bench-client.apps.googleusercontent.com"
+
+
+def make_key_set(kids):
+    keys = {kid: rsa.newkeys(2048) for kid in kids}
+    certs = {kid: pub.save_pkcs1().decode() for kid, (pub, _) in keys.items()}
+    signers = {kid: crypt.RSASigner.from_string(priv.save_pkcs1().decode(), key_id=kid) for kid, (_, priv) in keys.items()}
+    return certs, signers
+
+
+def sign(signer, **claims):
+    now = int(time.time())
+    payload = {"iss": "https://accounts.google.com", "aud": AUDIENCE, "sub": "1234", "email": "bench@example.com",
+               "iat": now, "exp": now + 3600}
+    payload.update(claims)
+    return jwt.encode(signer, payload).decode()
+
+
+def expect_rejected(verifier, token, label):
+    try:
+        verifier.verify(token)
+    except TokenVerificationError as e:
+        print(f"  rejected {label:<16} {e}")
+        return
+    raise AssertionError(f"{label} token was accepted")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    certs, signers = make_key_set(["k1", "k2"])
+    served = {"certs": {"k1": certs["k1"]}}
+    fetches = []
+
+    def fetcher():
+        fetches.append(time.time())
+        return dict(served["certs"]), 3600.0
+
+    verifier = GoogleTokenVerifier(audience=AUDIENCE, fetcher=fetcher, min_refresh=0)
+    tokens = [sign(signers["k1"], sub=str(i)) for i in range(args.tokens)]
+
+    started = time.perf_counter()
+    for token in tokens:
+        verifier.verify(token)
+    elapsed = time.perf_counter() - started
+    print(f"verified {len(tokens)} tokens in {elapsed * 1000:.1f} ms "
+          f"({elapsed / len(tokens) * 1e6:.0f} us/token), cert fetches: {len(fetches)}")
+    assert len(fetches) == 1, "certs should be fetched once and then served from cache"
+
+    expect_rejected(verifier, sign(signers["k1"], exp=int(time.time()) - 3600), "expired")
+    expect_rejected(verifier, sign(signers["k1"], aud="someone-else"), "wrong audience")
+    expect_rejected(verifier, sign(signers["k1"], iss="evil.example.com"), "wrong issuer")
+    header, payload, signature = tokens[0].split(".")
+    expect_rejected(verifier, ".".join((header, sign(signers["k1"], sub="x").split(".")[1], signature)), "tampered")
+
+    # key rotation: a token signed with a key we have not seen triggers one refetch
+    served["certs"] = certs
+    verifier.verify(sign(signers["k2"]))
+    print(f"after rotation: cert fetches: {len(fetches)}")
+    assert len(fetches) == 2
+
+    print("stats:", verifier.stats())
+
+
+if __name__ == "__main__":
+    main()
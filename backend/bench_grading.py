@@ -0,0 +1,53 @@
+"""Benchmark: grade 100k exam submissions with the per-answer loop vs. the vectorized engine.
+
+Usage (from backend/):  python bench_grading.py [--submissions 100000] [--questions 50]
+"""
+import argparse
+import random
+import time
+
+from app.grading import score_submissions
+from app.lazy import optional_import
+from app.question_bank import compile_exam
+
+
+def build(num_questions: int, num_submissions: int, seed: int = 7):
+    rng = random.Random(seed)
+    rows = [
+        {"question_id": f"q{j}", "text": f"Question {j}", "options": ["A", "B", "C", "D"],
+         "correct_index": rng.randrange(4), "marks": rng.choice((1, 2, 5))}
+        for j in range(num_questions)
+    ]
+    exam = compile_exam("bench", 0, rows)
+    submissions = [
+        {f"q{j}": str(rng.randrange(4)) for j in range(num_questions) if rng.random() < 0.95}
+        for _ in range(num_submissions)
+    ]
+    return exam, submissions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions", type=int, default=100_000)
+    parser.add_argument("--questions", type=int, default=50)
+    args = parser.parse_args()
+
+    exam, submissions = build(args.questions, args.submissions)
+    print(f"{args.submissions} submissions x {args.questions} questions (numpy={'yes' if optional_import('numpy') is not None else 'no'})")
+
+    t0 = time.perf_counter()
+    loop_scores = [exam.score(s.items()) for s in submissions]
+    loop_s = time.perf_counter() - t0
+    print(f"loop        {loop_s * 1000:9.1f} ms  ({args.submissions / loop_s:,.0f} submissions/s)")
+
+    t0 = time.perf_counter()
+    vec_scores = score_submissions(exam, submissions)
+    vec_s = time.perf_counter() - t0
+    print(f"vectorized  {vec_s * 1000:9.1f} ms  ({args.submissions / vec_s:,.0f} submissions/s)  "
+          f"{loop_s / vec_s:.1f}x")
+
+    assert loop_scores == vec_scores, "vectorized scores differ from the reference loop"
+
+
+if __name__ == "__main__":
+    main()
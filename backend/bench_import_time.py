@@ -0,0 +1,84 @@
+"""Cold-import budget for the backend (`python -X importtime` report).
+
+Imports app.main in fresh interpreters, reports the fastest total and the most
+expensive modules, and exits non-zero when:
+  * the import takes longer than IMPORT_BUDGET_MS, or
+  * one of DEFERRED_MODULES was imported. These are only needed by particular
+    requests (certificate rendering, Google sign-in, regrading) or once the first
+    query runs, and are imported on first use.
+
+Run it after adding an import to a module on the startup path; raise the budget
+only together with the reason in the same change.
+
+Usage (from backend/):  python bench_import_time.py [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# ~600 ms here with the clients deferred (1340 ms when supabase/httpx/PIL/numpy loaded at import)
+IMPORT_BUDGET_MS = 900
+
+DEFERRED_MODULES = ("PIL", "numpy", "google.auth", "requests", "httpx", "supabase", "postgrest", "gotrue", "storage3", "realtime", "razorpay")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+_ENV = {
+    # db.py refuses to import without these; no connection is made at import time
+    "SUPABASE_URL": "http://import-bench.invalid",
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYmVuY2gifQ.bench",
+}
+
+_PROBE = "import sys, app.main; print(' '.join(sorted(sys.modules)))"
+
+
+def run_once(here: str):
+    env = dict(os.environ, **_ENV, PYTHONPATH=here, PYTHONDONTWRITEBYTECODE="")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE], cwd=here, env=env,
+                          capture_output=True, text=True, check=True)
+    modules = set(proc.stdout.split())
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(max(args.runs, 1)):
+        rows, modules = run_once(here)
+        total = next(cumulative for name, _, cumulative, _ in rows if name == "app.main")
+        if best is None or total < best[0]:
+            best = (total, rows, modules)
+    total, rows, modules = best
+
+    print(f"import app.main: {total / 1000:.1f} ms (best of {args.runs}, budget {IMPORT_BUDGET_MS} ms)\n")
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    # top-level packages and app modules by cumulative time: where the time actually goes
+    shown = [r for r in rows if r[3] <= 1 or r[0].startswith("app.")]
+    for name, self_us, cumulative_us, depth in sorted(shown, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    failed = False
+    loaded = [m for m in DEFERRED_MODULES if m in modules]
+    if loaded:
+        failed = True
+        print(f"\nFAIL: imported at startup but should be deferred to first use: {', '.join(loaded)}")
+    if total / 1000 > IMPORT_BUDGET_MS:
+        failed = True
+        print(f"\nFAIL: import took {total / 1000:.1f} ms, over the {IMPORT_BUDGET_MS} ms budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: per-worker caches vs. the host-shared SQLite cache (CACHE_BACKEND=sqlite).
+
+Starts --workers processes that each look up the same --keys keys twice through
+a cache, loading on a miss (each worker starts at a different offset, as real
+traffic does not hit every worker with the same key in the same millisecond), then deletes keys from one process and measures how
+long the other processes keep serving their copies. Reports loads per key (what
+the database would see), lookup latency of a local and a shared hit, and the
+invalidation delay.
+
+Usage (from backend/):  python bench_shared_cache.py [--workers 4] [--keys 2000]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://bench.invalid")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYmVuY2gifQ.bench")
+
+from app.cache import SharedCache, TTLCache  # noqa: E402
+from app.shared_cache import SharedStore  # noqa: E402
+
+
+def user_row(i: int) -> dict:
+    return {"id": f"user-{i}", "User_id": f"user-{i}", "email": f"user{i}@example.com", "name": f"User {i}", "role": "student"}
+
+
+def build(backend: str, path: str, keys: int):
+    if backend == "sqlite":
+        return SharedCache("users", SharedStore(path, sync_interval=0.05), maxsize=keys * 2, ttl=600, local_maxsize=keys * 2)
+    return TTLCache("users", maxsize=keys * 2, ttl=600, register=False)
+
+
+def worker(backend: str, path: str, keys: int, offset: int, start, results, invalidated, done):
+    cache = build(backend, path, keys)
+    start.wait()
+    loads = 0
+    for _ in range(2):
+        for i in ((offset + n) % keys for n in range(keys)):
+            if cache.get(("id", f"user-{i}")) is None:
+                loads += 1
+                cache.set(("id", f"user-{i}"), user_row(i))
+    # local hit latency (key already in this process)
+    t0 = time.perf_counter()
+    for i in range(keys):
+        cache.get(("id", f"user-{i}"))
+    local_us = (time.perf_counter() - t0) / keys * 1e6
+    results.put(("loads", loads, local_us))
+    if backend != "sqlite":
+        return
+    # how long until a delete made by the parent process is seen here
+    invalidated.wait()
+    t0 = time.perf_counter()
+    while cache.get(("id", "user-0")) is not None and time.perf_counter() - t0 < 5:
+        time.sleep(0.001)
+    results.put(("invalidation", (time.perf_counter() - t0) * 1000, 0))
+    done.wait()
+
+
+def run(backend: str, args, path: str) -> None:
+    ctx = mp.get_context("spawn")
+    start, invalidated, done = ctx.Event(), ctx.Event(), ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(backend, path, args.keys, n * args.keys // args.workers, start, results,
+                                              invalidated, done))
+             for n in range(args.workers)]
+    for p in procs:
+        p.start()
+    start.set()
+    loads = [results.get() for _ in procs]
+    total_loads = sum(r[1] for r in loads)
+    local_us = statistics.median(r[2] for r in loads)
+    line = f"{backend:<8} loads {total_loads:>7} ({total_loads / args.keys:.2f} per key)   local hit {local_us:6.2f} us"
+    if backend == "sqlite":
+        parent = build(backend, path, args.keys)
+        t0 = time.perf_counter()
+        for i in range(args.keys):
+            parent.get(("id", f"user-{i}"))
+        shared_us = (time.perf_counter() - t0) / args.keys * 1e6
+        parent.delete(("id", "user-0"))
+        invalidated.set()
+        delays = [results.get()[1] for _ in procs]
+        done.set()
+        line += f"   shared hit {shared_us:6.2f} us   invalidation seen after {max(delays):.1f} ms (max of {len(delays)})"
+    for p in procs:
+        p.join()
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=2000)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-cache-"), "cache.sqlite3")
+    print(f"{args.workers} workers x {args.keys} keys, each looked up twice per worker")
+    run("memory", args, path)
+    run("sqlite", args, path)
+
+
+if __name__ == "__main__":
+    main()
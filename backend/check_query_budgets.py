@@ -0,0 +1,122 @@
+"""Database round-trip budgets for the hot endpoints, checked against fake_postgrest.
+
+Replays one student through the exam and payment flows and an admin through the
+dashboard, counts the PostgREST calls each request makes (app/instrumentation.py)
+and exits non-zero when a route makes more round trips than its budget below.
+A new fallback or an extra lookup on one of these paths shows up here first; if
+the extra query is intended, raise the budget in the same change.
+
+The first request of the run also pays for the user lookup behind get_current_user;
+later ones are served from the user cache, as in production.
+
+Usage (from backend/):  python check_query_budgets.py [--no-rpc] [-v]
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import sys
+
+import httpx
+
+# importing loadtest points the app at the fakes before app.main is loaded
+import loadtest  # noqa: F401
+from app.auth import create_jwt
+from app.instrumentation import track_queries
+from app.main import app
+from app.outbox import outbox
+from fake_postgrest import FakeDatabase, install, register_sql_functions, seed
+
+# route -> max PostgREST round trips per request
+BUDGETS = {
+    "POST /attempts/start": 3,                                  # user lookup, attempt insert, question set load
+    "POST /attempts/{attempt_id}/submit": 2,                    # attempt read, score write
+    "PUT /exams/{exma_id}": 2,                                  # attempt update + eligibility row; the rest goes through the outbox
+    "GET /exams/certification/{cert_id}/availability": 1,      # eligibility index
+    "POST /payments/create_order": 3,                           # certification read, open purchase lookup, purchase insert
+    "POST /payments/verify": 1,                                 # verify_purchase_payment RPC
+    "GET /admin/analytics": 3,                                  # admin lookup, users count, analytics_snapshot RPC
+}
+
+# with --no-rpc the documented fallbacks are allowed their extra queries (the failed RPC call counts too)
+FALLBACK_BUDGETS = dict(BUDGETS, **{
+    "PUT /exams/{exma_id}": 3,                                  # attempt update, failed RPC, eligibility upsert
+    "POST /payments/verify": 3,                                 # failed RPC, purchase read, purchase update
+    "GET /admin/analytics": 6,                                  # failed RPC, then count/sum queries
+})
+
+
+async def replay(client: httpx.AsyncClient, ids: dict, verbose: bool) -> list:
+    student, admin = ids["users"][0], ids["admins"][0]
+    headers = {"Authorization": "Bearer " + create_jwt({"user_id": student, "email": ids["emails"][student]})}
+    admin_headers = {"Authorization": "Bearer " + create_jwt({"user_id": admin, "email": ids["emails"][admin]})}
+    cert_id = ids["certifications"][0]
+    results = []
+
+    async def call(route: str, method: str, url: str, as_admin: bool = False, **kwargs):
+        with track_queries() as stats:
+            res = await client.request(method, url, headers=admin_headers if as_admin else headers, **kwargs)
+        results.append((route, res.status_code, stats))
+        if verbose:
+            for table, op, rows in stats.calls:
+                print(f"    {route:<50} {op:<7} {table:<24} rows={rows}")
+        return res.json() if res.status_code < 400 else None
+
+    started = await call("POST /attempts/start", "POST", "/attempts/start", json={"certification_id": cert_id})
+    attempt_id = started["attempt_id"]
+    answers = [{"question_id": q, "selected_option": c} for q, c in ids["answer_key"][cert_id].items()]
+    await call("POST /attempts/{attempt_id}/submit", "POST", f"/attempts/{attempt_id}/submit", json={"answers": answers})
+    await call("PUT /exams/{exma_id}", "PUT", f"/exams/{attempt_id}",
+               json={"passing_score": 100, "pass_status": True, "title": "Budget check", "questions": len(answers)})
+    # let the outbox record the pass, so availability is answered from the eligibility index
+    await asyncio.to_thread(outbox.drain)
+    await call("GET /exams/certification/{cert_id}/availability", "GET", f"/exams/certification/{cert_id}/availability")
+
+    order = await call("POST /payments/create_order", "POST", "/payments/create_order", json={"certification_id": cert_id})
+    payment_id = "pay_budgetcheck"
+    signature = hmac.new(os.environ["RAZORPAY_KEY_SECRET"].encode(), f"{order['order_id']}|{payment_id}".encode(),
+                         hashlib.sha256).hexdigest()
+    await call("POST /payments/verify", "POST", "/payments/verify",
+               json={"purchase_id": order["purchase_id"], "razorpay_payment_id": payment_id, "razorpay_signature": signature})
+    await call("GET /admin/analytics", "GET", "/admin/analytics", as_admin=True)
+    return results
+
+
+async def main_async(args) -> int:
+    db = FakeDatabase()
+    ids = seed(db, users=5, admins=1, certifications=2, questions=10)
+    if not args.no_rpc:
+        register_sql_functions(db)
+    install(db)
+    loadtest.use_fake_razorpay()
+
+    budgets = FALLBACK_BUDGETS if args.no_rpc else BUDGETS
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://budget-check") as client:
+            results = await replay(client, ids, args.verbose)
+
+    failed = 0
+    print(f"{'endpoint':<52}{'status':>7}{'trips':>7}{'budget':>8}{'rows':>7}{'bytes':>9}")
+    for route, status, stats in results:
+        budget = budgets[route]
+        over = stats.round_trips > budget or status >= 400
+        failed += over
+        print(f"{route:<52}{status:>7}{stats.round_trips:>7}{budget:>8}{stats.rows:>7}{stats.bytes:>9}"
+              f"{'  OVER BUDGET' if stats.round_trips > budget else ''}{'  FAILED' if status >= 400 else ''}")
+        if over and not args.verbose:
+            for table, op, rows in stats.calls:
+                print(f"    {op:<7} {table:<24} rows={rows}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--no-rpc", action="store_true", help="check the budgets of the RPC fallback paths")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every query")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
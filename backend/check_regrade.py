@@ -0,0 +1,114 @@
+"""End-to-end check of POST /exams/admin/{exma_id}/regrade against fake_postgrest.
+
+Students start and submit attempts through the API (so the stored answers and the
+attempt -> question set link are the ones production writes), then an admin
+corrects one question's answer and regrades. Exits non-zero unless exactly the
+affected attempts of that exam get new scores, the stored scores equal a fresh
+grading against the corrected key, attempts of another exam are untouched, and
+the certificate eligibility index agrees with the new scores. Scores are raw
+counts here, so the pass mark is set to 8 (of the default 10 questions).
+
+Usage (from backend/):  python check_regrade.py [--students 12] [--questions 10] [--no-rpc]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+import httpx
+
+os.environ.setdefault("CERT_PASS_SCORE", "8")
+# importing loadtest points the app at the fakes before app.main is loaded
+import loadtest  # noqa: E402,F401
+from app.auth import create_jwt  # noqa: E402
+from app.config import CERT_PASS_SCORE  # noqa: E402
+from app.main import app  # noqa: E402
+from fake_postgrest import FakeDatabase, install, register_sql_functions, seed  # noqa: E402
+
+
+async def main_async(args) -> int:
+    db = FakeDatabase()
+    ids = seed(db, users=args.students, admins=1, certifications=2, questions=args.questions)
+    if not args.no_rpc:
+        register_sql_functions(db)
+    install(db)
+    rng = random.Random(7)
+    exam_id, other_id = ids["certifications"]
+    admin = ids["admins"][0]
+    admin_headers = {"Authorization": "Bearer " + create_jwt({"user_id": admin, "email": ids["emails"][admin]})}
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://regrade-check") as client:
+            for student in ids["users"]:
+                headers = {"Authorization": "Bearer " + create_jwt({"user_id": student, "email": ids["emails"][student]})}
+                for cert_id in (exam_id, other_id):
+                    res = await client.post("/attempts/start", json={"certification_id": cert_id}, headers=headers)
+                    res.raise_for_status()
+                    attempt_id = res.json()["attempt_id"]
+                    # mostly right answers, with a few random misses
+                    answers = [{"question_id": q, "selected_option": c if rng.random() < 0.7 else str(rng.randrange(4))}
+                               for q, c in ids["answer_key"][cert_id].items()]
+                    res = await client.post(f"/attempts/{attempt_id}/submit", json={"answers": answers}, headers=headers)
+                    res.raise_for_status()
+                    # the exam page then completes the attempt, which records eligibility for a pass
+                    res = await client.put(f"/exams/{attempt_id}", json={"passing_score": res.json()["score"]}, headers=headers)
+                    res.raise_for_status()
+
+            before = {a["id"]: a["score"] for a in db.rows["attempts"]}
+            # the admin fixes question q0 of the first exam: its right answer is now option "3"
+            key = dict(ids["answer_key"][exam_id])
+            key["q0"] = "3" if key["q0"] != "3" else "2"
+            for q in db.rows["questions"]:
+                if q["exma_id"] == exam_id and q["question_id"] == "q0":
+                    q["correct_index"] = key["q0"]
+
+            res = await client.post(f"/exams/admin/{exam_id}/regrade", headers=admin_headers)
+            print(f"regrade: {res.status_code} {res.text}")
+            if res.status_code != 200:
+                return 1
+            result = res.json()
+
+    failures = []
+    expected_changes = 0
+    for attempt in db.rows["attempts"]:
+        answers = attempt.get("answers") or {}
+        if attempt["certification_id"] == exam_id:
+            expected = sum(1 for q, chosen in answers.items() if key.get(q) == str(chosen))
+            expected_changes += expected != before[attempt["id"]]
+            if attempt["score"] != expected:
+                failures.append(f"attempt {attempt['id']}: score {attempt['score']}, expected {expected}")
+        elif attempt["score"] != before[attempt["id"]]:
+            failures.append(f"attempt {attempt['id']} of another exam was regraded")
+    if result["graded"] != args.students:
+        failures.append(f"graded {result['graded']} attempts, expected {args.students}")
+    if result["updated"] != expected_changes:
+        failures.append(f"updated {result['updated']} scores, expected {expected_changes}")
+    crossed = sum(1 for a in db.rows["attempts"] if a["certification_id"] == exam_id
+                  and (a["score"] >= CERT_PASS_SCORE) != (before[a["id"]] >= CERT_PASS_SCORE))
+    if crossed == 0:
+        failures.append("no score crossed the pass mark; the eligibility check proves nothing")
+    eligible = {row["user_id"] for row in db.rows["certificate_eligibility"] if row["certification_id"] == exam_id}
+    for attempt in db.rows["attempts"]:
+        if attempt["certification_id"] == exam_id and (attempt["score"] >= CERT_PASS_SCORE) != (attempt["user_id"] in eligible):
+            failures.append(f"user {attempt['user_id']}: score {attempt['score']} but eligible={attempt['user_id'] in eligible}")
+    if expected_changes == 0:
+        failures.append("the corrected question changed no score; the check proves nothing")
+
+    print(f"{args.students} attempts graded, {expected_changes} scores changed, {crossed} across the pass mark")
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--students", type=int, default=12)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--no-rpc", action="store_true", help="write scores through the upsert fallback")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
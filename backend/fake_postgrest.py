@@ -0,0 +1,479 @@
+"""In-memory stand-in for the Supabase/PostgREST clients, for load runs and local checks.
+
+Implements the subset of the postgrest-py query builder this backend uses: `table()`
+with `select(columns, count=)`, `eq/neq/gt/gte/lt/lte/in_`, `order`, `limit`, `range`,
+`insert`, `upsert(on_conflict=)`, `update`, `delete` and `rpc()`. Errors are raised as
+postgrest `APIError`s with the codes PostgREST uses (42P01 missing table, 42703 missing
+column, PGRST204 unknown insert column, PGRST202 unknown function), so the schema
+probes and RPC fallbacks in app/ behave as they do against a real project.
+
+Every `execute()` sleeps for the configured latency (time.sleep on the sync client,
+asyncio.sleep on the async one) to model the network round trip:
+
+    db = FakeDatabase(latency_ms=20)
+    seed(db, users=500, certifications=10)
+    install(db)          # after `import app.main`
+"""
+import asyncio
+import copy
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+from postgrest.exceptions import APIError
+
+# Columns per table, as in sql/supabase_schema.sql plus the variants the backend probes for
+TABLES = {
+    "users": ("id", "email", "name", "google_id", "role", "created_at"),
+    "certifications": ("id", "title", "description", "duration_minutes", "price_numeric", "active", "metadata", "created_at"),
+    "courses": ("id", "title", "badge", "desc", "img", "price"),
+    "questions": ("id", "exma_id", "question_id", "text", "options", "correct_index", "marks"),
+    "purchases": ("id", "user_id", "certification_id", "amount", "currency", "razorpay_order_id", "razorpay_payment_id",
+                  "razorpay_signature", "status", "created_at"),
+    "attempts": ("id", "user_id", "certification_id", "started_at", "ended_at", "status", "score", "review_notes",
+                 "metadata", "answers", "created_at"),
+    "proctor_events": ("id", "attempt_id", "event_type", "metadata", "created_at"),
+    "transactions": ("id", "mailid", "price", "course_title", "created_at"),
+    "exams": ("id", "exma_id", "title", "passing_score", "questions", "nameofuser", "pass_status", "created_at"),
+    "certificate_eligibility": ("user_id", "certification_id", "best_score", "attempt_id", "updated_at"),
+}
+
+# Tables whose primary key is a serial rather than a uuid
+SERIAL_TABLES = {"transactions", "exams", "courses", "proctor_events"}
+
+
+def _error(code: str, message: str) -> APIError:
+    return APIError({"code": code, "message": message, "details": None, "hint": None})
+
+
+def _coerce(value, like):
+    """`value` (often a string from a cursor or path) converted to the type of the stored `like`."""
+    if like is None or value is None or isinstance(value, type(like)):
+        return value
+    try:
+        return type(like)(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class FakeResponse:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeDatabase:
+    """Thread-safe table store shared by the sync and async fake clients."""
+
+    def __init__(self, tables: Dict[str, Iterable[str]] = None, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.columns = {name: tuple(cols) for name, cols in (tables or TABLES).items()}
+        self.rows: Dict[str, List[dict]] = {name: [] for name in self.columns}
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.functions: Dict[str, Callable[[dict], object]] = {}
+        self.lock = threading.RLock()
+        self.queries = 0
+        self._serial = 0
+
+    def delay(self) -> float:
+        if not self.latency and not self.jitter:
+            return 0.0
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def register_rpc(self, name: str, fn: Callable[[dict], object]) -> None:
+        """Make `rpc(name, params)` return `fn(params)`; unregistered functions raise PGRST202."""
+        self.functions[name] = fn
+
+    def new_row(self, table: str, values: dict) -> dict:
+        row = dict.fromkeys(self.columns[table])
+        row.update(values)
+        if "id" in row and row["id"] is None:
+            if table in SERIAL_TABLES:
+                self._serial += 1
+                row["id"] = self._serial
+            else:
+                row["id"] = str(uuid.uuid4())
+        if "created_at" in row and row["created_at"] is None:
+            row["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return row
+
+    def insert_rows(self, table: str, rows: Iterable[dict]) -> List[dict]:
+        with self.lock:
+            created = [self.new_row(table, r) for r in rows]
+            self.rows[table].extend(created)
+            return created
+
+
+class FakeQuery:
+    def __init__(self, db: FakeDatabase, table: str):
+        self.db = db
+        self.table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._filters = []
+        self._order = []
+        self._offset = 0
+        self._limit = None
+        self._payload = None
+        self._on_conflict = None
+
+    # -- builder -------------------------------------------------------------------
+    def select(self, *columns, count: str = None):
+        self._columns = ",".join(columns) or "*"
+        self._count = count
+        return self
+
+    def _filter(self, column, test):
+        self._filters.append((column, test))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda x: x is not None and str(x) == str(value))
+
+    def neq(self, column, value):
+        return self._filter(column, lambda x: x is None or str(x) != str(value))
+
+    def gt(self, column, value):
+        return self._filter(column, lambda x: x is not None and x > _coerce(value, x))
+
+    def gte(self, column, value):
+        return self._filter(column, lambda x: x is not None and x >= _coerce(value, x))
+
+    def lt(self, column, value):
+        return self._filter(column, lambda x: x is not None and x < _coerce(value, x))
+
+    def lte(self, column, value):
+        return self._filter(column, lambda x: x is not None and x <= _coerce(value, x))
+
+    def in_(self, column, values):
+        wanted = {str(v) for v in values}
+        return self._filter(column, lambda x: x is not None and str(x) in wanted)
+
+    def order(self, column, desc: bool = False, nullsfirst: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int):
+        self._limit = int(size)
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    def insert(self, json, **kwargs):
+        self._op = "insert"
+        self._payload = json if isinstance(json, list) else [json]
+        return self
+
+    def upsert(self, json, on_conflict: str = "", **kwargs):
+        self._op = "upsert"
+        self._payload = json if isinstance(json, list) else [json]
+        self._on_conflict = [c.strip() for c in (on_conflict or "id").split(",")]
+        return self
+
+    def update(self, json, **kwargs):
+        self._op = "update"
+        self._payload = json
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # -- execution -----------------------------------------------------------------
+    def _check_columns(self, names: Iterable[str], code: str) -> None:
+        known = self.db.columns[self.table]
+        for name in names:
+            if name not in known:
+                if code == "PGRST204":
+                    raise _error(code, f"Could not find the '{name}' column of '{self.table}' in the schema cache")
+                raise _error(code, f"column {self.table}.{name} does not exist")
+
+    def _matches(self, row: dict) -> bool:
+        return all(test(row.get(column)) for column, test in self._filters)
+
+    def _run(self) -> FakeResponse:
+        db = self.db
+        if self.table not in db.columns:
+            raise _error("42P01", f'relation "public.{self.table}" does not exist')
+        self._check_columns([c for c, _ in self._filters] + [c for c, _ in self._order], "42703")
+        with db.lock:
+            db.queries += 1
+            rows = db.rows[self.table]
+            if self._op == "select":
+                return self._select(rows)
+            if self._op in ("insert", "upsert"):
+                return self._write(rows)
+            if self._op == "update":
+                self._check_columns(self._payload, "PGRST204")
+                updated = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self._payload)
+                        updated.append(row)
+                return FakeResponse(copy.deepcopy(updated))
+            kept, removed = [], []
+            for row in rows:
+                (removed if self._matches(row) else kept).append(row)
+            db.rows[self.table] = kept
+            return FakeResponse(removed)
+
+    def _select(self, rows: List[dict]) -> FakeResponse:
+        columns = None if self._columns.strip() == "*" else [c.strip() for c in self._columns.split(",")]
+        if columns:
+            self._check_columns(columns, "42703")
+        out = [r for r in rows if self._matches(r)]
+        count = len(out) if self._count else None
+        for column, desc in reversed(self._order):
+            out.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        out = out[self._offset:]
+        if self._limit is not None:
+            out = out[:self._limit]
+        if columns:
+            out = [{c: r.get(c) for c in columns} for r in out]
+        return FakeResponse(copy.deepcopy(out), count)
+
+    def _write(self, rows: List[dict]) -> FakeResponse:
+        written = []
+        for values in self._payload:
+            self._check_columns(values, "PGRST204")
+            existing = None
+            if self._op == "upsert":
+                key = [str(values.get(c)) for c in self._on_conflict]
+                existing = next((r for r in rows if [str(r.get(c)) for c in self._on_conflict] == key), None)
+            if existing is not None:
+                existing.update(values)
+                written.append(existing)
+            else:
+                row = self.db.new_row(self.table, values)
+                rows.append(row)
+                written.append(row)
+        return FakeResponse(copy.deepcopy(written))
+
+    def execute(self) -> FakeResponse:
+        delay = self.db.delay()
+        if delay:
+            time.sleep(delay)
+        return self._run()
+
+
+class FakeRpc:
+    def __init__(self, db: FakeDatabase, name: str, params: dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def _run(self) -> FakeResponse:
+        fn = self.db.functions.get(self.name)
+        if fn is None:
+            raise _error("PGRST202", f"Could not find the function public.{self.name} in the schema cache")
+        with self.db.lock:
+            self.db.queries += 1
+            return FakeResponse(fn(self.params))
+
+    def execute(self) -> FakeResponse:
+        delay = self.db.delay()
+        if delay:
+            time.sleep(delay)
+        return self._run()
+
+
+class _AsyncQuery(FakeQuery):
+    async def execute(self) -> FakeResponse:
+        delay = self.db.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._run()
+
+
+class _AsyncRpc(FakeRpc):
+    async def execute(self) -> FakeResponse:
+        delay = self.db.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._run()
+
+
+class FakeClient:
+    """Drop-in for `app.db.supabase_client` (blocking `execute()`)."""
+
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.db, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict = None) -> FakeRpc:
+        return FakeRpc(self.db, name, params or {})
+
+
+class FakeAsyncClient(FakeClient):
+    """Drop-in for the pooled AsyncPostgrestClient returned by `app.db.get_async_client()`."""
+
+    def table(self, name: str) -> _AsyncQuery:
+        return _AsyncQuery(self.db, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict = None) -> _AsyncRpc:
+        return _AsyncRpc(self.db, name, params or {})
+
+    async def aclose(self) -> None:
+        pass
+
+
+# -- Python ports of the functions in sql/supabase_schema.sql --------------------------
+# Each runs under the database lock, like the single transaction the SQL version is.
+
+def _find(db: FakeDatabase, table: str, **match) -> List[dict]:
+    return [r for r in db.rows[table] if all(str(r.get(k)) == str(v) for k, v in match.items())]
+
+
+def _analytics_snapshot(db: FakeDatabase, params: dict) -> dict:
+    txs = db.rows["transactions"]
+    revenue = sum(t.get("price") or 0 for t in txs) if txs else \
+        sum(p.get("amount") or 0 for p in db.rows["purchases"] if p.get("status") == "paid")
+    return {
+        "active_certifications_count": len(db.rows["certifications"]),
+        "attempts_under_review": len(_find(db, "attempts", status="under_review")),
+        "revenue": revenue,
+    }
+
+
+def _bulk_update_attempt_scores(db: FakeDatabase, params: dict) -> int:
+    updated = 0
+    for s in params.get("scores") or []:
+        for row in _find(db, "attempts", id=s["id"]):
+            row["score"] = s["score"]
+            updated += 1
+    return updated
+
+
+def _record_certificate_eligibility(db: FakeDatabase, params: dict) -> int:
+    for p in params.get("passes") or []:
+        rows = _find(db, "certificate_eligibility", user_id=p["user_id"], certification_id=p["certification_id"])
+        if not rows:
+            db.rows["certificate_eligibility"].append(db.new_row("certificate_eligibility", dict(p)))
+        elif float(p["best_score"]) > float(rows[0]["best_score"]):
+            rows[0].update(best_score=p["best_score"], attempt_id=p.get("attempt_id"))
+    return len(params.get("passes") or [])
+
+
+def _mark_purchases_issued(db: FakeDatabase, params: dict) -> int:
+    pairs = {(str(p["user_id"]), str(p["certification_id"])) for p in params.get("pairs") or []}
+    rows = [r for r in db.rows["purchases"] if (str(r.get("user_id")), str(r.get("certification_id"))) in pairs]
+    for r in rows:
+        r["status"] = "issued"
+    return len(rows)
+
+
+def _certification_title(db: FakeDatabase, cert_id) -> Optional[str]:
+    certs = _find(db, "certifications", id=cert_id)
+    return certs[0].get("title") if certs else None
+
+
+def _verify_purchase_payment(db: FakeDatabase, params: dict) -> dict:
+    rows = _find(db, "purchases", id=params["p_purchase_id"])
+    if not rows:
+        return {"error": "not_found"}
+    p = rows[0]
+    if not p.get("razorpay_order_id") or p["razorpay_order_id"] != params["p_order_id"]:
+        return {"error": "order_mismatch"}
+    result = {"status": "paid", "purchase_id": p["id"], "user_id": p["user_id"], "certification_id": p["certification_id"]}
+    if p.get("status") == "paid":
+        if p.get("razorpay_payment_id") == params["p_payment_id"]:
+            return dict(result, replayed=True)
+        return {"error": "already_paid"}
+    p.update(status="paid", razorpay_payment_id=params["p_payment_id"], razorpay_signature=params["p_signature"])
+    db.rows["transactions"].append(db.new_row("transactions", {
+        "mailid": params.get("p_mailid"), "price": params.get("p_price", 1),
+        "course_title": _certification_title(db, p["certification_id"])}))
+    return dict(result, replayed=False)
+
+
+def _reconcile_payment_events(db: FakeDatabase, params: dict) -> list:
+    newly = []
+    for e in {e["order_id"]: e for e in params.get("events") or [] if e.get("order_id")}.values():
+        for p in _find(db, "purchases", razorpay_order_id=e["order_id"]):
+            if (p.get("status") or "") in ("paid", "issued"):
+                continue
+            p.update(status="paid", razorpay_payment_id=e.get("payment_id"))
+            db.rows["transactions"].append(db.new_row("transactions", {
+                "mailid": e.get("email"), "price": 1, "course_title": _certification_title(db, p["certification_id"])}))
+            newly.append({"purchase_id": p["id"], "user_id": p["user_id"], "certification_id": p["certification_id"],
+                          "email": e.get("email")})
+    return newly
+
+
+SQL_FUNCTIONS = {
+    "analytics_snapshot": _analytics_snapshot,
+    "bulk_update_attempt_scores": _bulk_update_attempt_scores,
+    "record_certificate_eligibility": _record_certificate_eligibility,
+    "mark_purchases_issued": _mark_purchases_issued,
+    "verify_purchase_payment": _verify_purchase_payment,
+    "reconcile_payment_events": _reconcile_payment_events,
+}
+
+
+def register_sql_functions(db: FakeDatabase) -> None:
+    """Make the RPCs of sql/supabase_schema.sql available; without this the app takes its fallback paths."""
+    for name, fn in SQL_FUNCTIONS.items():
+        db.register_rpc(name, lambda params, fn=fn: fn(db, params))
+
+
+def install(db: FakeDatabase):
+    """Point every loaded app module at `db`. Call after importing app.main, and again after a
+    lifespan shutdown (which closes and forgets the async client)."""
+    import sys
+
+    import app.db
+    from app.instrumentation import instrument
+    from app.schema import schema
+
+    # wrapped like the real clients, so query counts and timings cover the fake too
+    client = instrument(FakeClient(db))
+    for name, module in list(sys.modules.items()):
+        if (name == "app" or name.startswith("app.")) and hasattr(module, "supabase_client"):
+            module.supabase_client = client
+    app.db._async_client = instrument(FakeAsyncClient(db))
+    schema.reset()
+    return client
+
+
+def seed(db: FakeDatabase, users: int = 200, admins: int = 2, certifications: int = 5, questions: int = 20,
+         courses: int = 8, price: float = 499.0) -> dict:
+    """Fill `db` with a small academy; returns the ids the load generator needs."""
+    user_rows = db.insert_rows("users", (
+        {"email": f"student{i}@load.test", "name": f"Student {i}", "role": "user"} for i in range(users)))
+    admin_rows = db.insert_rows("users", (
+        {"email": f"admin{i}@load.test", "name": f"Admin {i}", "role": "admin"} for i in range(admins)))
+    cert_rows = db.insert_rows("certifications", (
+        {"title": f"Certification {i}", "description": "Load test certification", "duration_minutes": 60,
+         "price_numeric": price, "active": True, "metadata": {}} for i in range(certifications)))
+    db.insert_rows("courses", (
+        {"title": f"Course {i}", "badge": "New", "desc": "Load test course", "img": f"/img/{i}.png", "price": price}
+        for i in range(courses)))
+    answer_key = {}
+    for cert in cert_rows:
+        key = answer_key[cert["id"]] = {}
+        for q in range(questions):
+            question_id = f"q{q}"
+            key[question_id] = str(q % 4)
+            db.insert_rows("questions", [{
+                "exma_id": cert["id"], "question_id": question_id, "text": f"Question {q}?",
+                "options": ["A", "B", "C", "D"], "correct_index": key[question_id], "marks": 1,
+            }])
+    return {
+        "users": [u["id"] for u in user_rows],
+        "admins": [u["id"] for u in admin_rows],
+        "emails": {u["id"]: u["email"] for u in user_rows + admin_rows},
+        "certifications": [c["id"] for c in cert_rows],
+        "answer_key": answer_key,
+    }
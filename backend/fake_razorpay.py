@@ -0,0 +1,90 @@
+"""Local stand-in for the Razorpay Orders API, for tests and load runs.
+
+Implements POST /v1/orders and GET /v1/orders/{id} with Basic auth, returning
+Razorpay-shaped order objects. Start it and point the backend at it:
+
+    python fake_razorpay.py --port 9100 --latency-ms 150
+    RAZORPAY_API_BASE=http://127.0.0.1:9100 uvicorn app.main:app
+
+GET /stats reports how many orders were created, which is how the idempotency of
+/payments/create_order is checked (N double-clicks must create one order).
+"""
+import argparse
+import asyncio
+import base64
+import secrets
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="fake-razorpay")
+app.state.latency = 0.0
+orders = {}
+
+
+def _error(status_code: int, description: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"error": {"code": "BAD_REQUEST_ERROR", "description": description}})
+
+
+def _authenticated(request: Request) -> bool:
+    header = request.headers.get("authorization", "")
+    if not header.startswith("Basic "):
+        return False
+    key_id, _, _ = base64.b64decode(header[6:]).decode().partition(":")
+    return bool(key_id)
+
+
+@app.post("/v1/orders")
+async def create_order(request: Request):
+    if not _authenticated(request):
+        return _error(401, "Authentication failed")
+    body = await request.json()
+    if not isinstance(body.get("amount"), int) or body["amount"] < 100:
+        return _error(400, "The amount must be atleast INR 1.00")
+    if app.state.latency:
+        await asyncio.sleep(app.state.latency)
+    order_id = "order_" + secrets.token_hex(7)
+    orders[order_id] = {
+        "id": order_id,
+        "entity": "order",
+        "amount": body["amount"],
+        "amount_paid": 0,
+        "amount_due": body["amount"],
+        "currency": body.get("currency", "INR"),
+        "receipt": body.get("receipt"),
+        "status": "created",
+        "attempts": 0,
+        "notes": body.get("notes") or [],
+        "created_at": int(time.time()),
+    }
+    return orders[order_id]
+
+
+@app.get("/v1/orders/{order_id}")
+async def fetch_order(order_id: str, request: Request):
+    if not _authenticated(request):
+        return _error(401, "Authentication failed")
+    if order_id not in orders:
+        return _error(400, "The id provided does not exist")
+    return orders[order_id]
+
+
+@app.get("/stats")
+async def stats():
+    return {"orders_created": len(orders)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every order creation")
+    args = parser.parse_args()
+    app.state.latency = args.latency_ms / 1000.0
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
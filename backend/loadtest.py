@@ -0,0 +1,229 @@
+"""Offline load generator for the backend: exam, payment and admin flows against fakes.
+
+The app runs in-process behind httpx's ASGI transport, with the database replaced by
+fake_postgrest (configurable per-query latency) and Razorpay by fake_razorpay, so a
+run needs no network, Supabase project or payment keys. Virtual users loop over a
+weighted mix of flows until the duration is up:
+
+  exam     POST /exams, POST /attempts/start, POST /attempts/{id}/events/batch,
+           POST /attempts/{id}/submit, PUT /exams/{id}, GET availability
+  payment  GET /certifications, POST /payments/create_order, POST /payments/verify
+  admin    GET /admin/analytics, /admin/users, /admin/attempts, /admin/transactions, /courses
+
+and a table of count / errors / throughput / p50 / p95 / p99 per endpoint is printed.
+Client and server share one event loop, so latencies include the client's own
+overhead; compare runs with each other rather than with production numbers.
+
+Usage (from backend/):
+    python loadtest.py --concurrency 50 --duration 20 --latency-ms 15 --mix exam=5,payment=2,admin=1
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import secrets
+import tempfile
+import time
+from collections import defaultdict
+
+# Isolate the run from any real project configured in .env: these win over load_dotenv()
+os.environ["SUPABASE_URL"] = "http://fake-postgrest.invalid"
+os.environ["SUPABASE_KEY"] = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoibG9hZHRlc3QifQ.loadtest"
+os.environ["RAZORPAY_KEY_ID"] = "rzp_test_loadtest"
+os.environ["RAZORPAY_KEY_SECRET"] = "loadtest-secret"
+os.environ["RAZORPAY_API_BASE"] = "http://fake-razorpay.invalid"
+_run_dir = tempfile.mkdtemp(prefix="loadtest-")
+os.environ["OUTBOX_PATH"] = os.path.join(_run_dir, "outbox.sqlite3")
+# used when the run sets CACHE_BACKEND=sqlite
+os.environ["SHARED_CACHE_PATH"] = os.path.join(_run_dir, "cache.sqlite3")
+
+import httpx  # noqa: E402
+
+import fake_razorpay  # noqa: E402
+from app import razorpay_client  # noqa: E402
+from app.auth import create_jwt  # noqa: E402
+from app.main import app  # noqa: E402
+from fake_postgrest import FakeDatabase, install, register_sql_functions, seed  # noqa: E402
+
+FLOWS = ("exam", "payment", "admin")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.samples = {}
+
+    def add(self, label: str, elapsed: float, status: int, detail: str = "") -> None:
+        self.latencies[label].append(elapsed)
+        if status >= 400:
+            self.errors[label] += 1
+            self.samples.setdefault(label, f"{status} {detail[:200]}")
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, ids: dict, rng: random.Random, user_id: str):
+        self.client = client
+        self.recorder = recorder
+        self.ids = ids
+        self.rng = rng
+        admin_id = rng.choice(ids["admins"])
+        self.headers = {"Authorization": "Bearer " + create_jwt({"user_id": user_id, "email": ids["emails"][user_id]})}
+        self.admin_headers = {"Authorization": "Bearer " + create_jwt({"user_id": admin_id, "email": ids["emails"][admin_id]})}
+
+    async def call(self, label: str, method: str, url: str, admin: bool = False, **kwargs):
+        started = time.perf_counter()
+        try:
+            res = await self.client.request(method, url, headers=self.admin_headers if admin else self.headers, **kwargs)
+        except Exception as e:
+            self.recorder.add(label, time.perf_counter() - started, 599, repr(e))
+            return None
+        self.recorder.add(label, time.perf_counter() - started, res.status_code, res.text)
+        return res.json() if res.status_code < 400 and res.headers.get("content-type", "").startswith("application/json") else None
+
+    async def exam(self):
+        cert_id = self.rng.choice(self.ids["certifications"])
+        created = await self.call("POST /exams", "POST", "/exams", json={"title": "Load test exam", "certification_id": cert_id})
+        started = await self.call("POST /attempts/start", "POST", "/attempts/start", json={"certification_id": cert_id})
+        if not started:
+            return
+        attempt_id = started["attempt_id"]
+        events = [{"event_type": "tab_switch", "metadata": {"n": i}} for i in range(3)]
+        await self.call("POST /attempts/{attempt_id}/events/batch", "POST", f"/attempts/{attempt_id}/events/batch",
+                        json={"events": events})
+        key = self.ids["answer_key"][cert_id]
+        answers = [{"question_id": q, "selected_option": c if self.rng.random() < 0.8 else "x"} for q, c in key.items()]
+        graded = await self.call("POST /attempts/{attempt_id}/submit", "POST", f"/attempts/{attempt_id}/submit",
+                                 json={"answers": answers})
+        if created and graded:
+            score = int(graded["score"] * 100 / max(len(key), 1))
+            await self.call("PUT /exams/{exma_id}", "PUT", f"/exams/{created['exma_id']}",
+                            json={"passing_score": score, "pass_status": score >= 75, "title": "Load test exam",
+                                  "questions": len(key), "nameofuser": "Load Tester"})
+        await self.call("GET /exams/certification/{cert_id}/availability", "GET",
+                        f"/exams/certification/{cert_id}/availability")
+
+    async def payment(self):
+        await self.call("GET /certifications", "GET", "/certifications")
+        cert_id = self.rng.choice(self.ids["certifications"])
+        order = await self.call("POST /payments/create_order", "POST", "/payments/create_order", json={"certification_id": cert_id})
+        if not order or not order.get("order_id"):
+            return
+        payment_id = "pay_" + secrets.token_hex(7)
+        signature = hmac.new(os.environ["RAZORPAY_KEY_SECRET"].encode(), f"{order['order_id']}|{payment_id}".encode(),
+                             hashlib.sha256).hexdigest()
+        await self.call("POST /payments/verify", "POST", "/payments/verify",
+                        json={"purchase_id": order["purchase_id"], "razorpay_payment_id": payment_id,
+                              "razorpay_signature": signature})
+
+    async def admin(self):
+        await self.call("GET /admin/analytics", "GET", "/admin/analytics", admin=True)
+        await self.call("GET /admin/users", "GET", "/admin/users", admin=True, params={"limit": 50})
+        await self.call("GET /admin/attempts", "GET", "/admin/attempts", admin=True, params={"limit": 50})
+        await self.call("GET /admin/transactions", "GET", "/admin/transactions", admin=True, params={"limit": 50})
+        await self.call("GET /courses", "GET", "/courses")
+
+    async def run(self, mix, deadline: float):
+        flows, weights = zip(*mix.items())
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(flows, weights)[0])()
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name!r}; choose from {', '.join(FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, len(sorted_values) - 1)
+    return sorted_values[max(index, 0)]
+
+
+def report(recorder: Recorder, elapsed: float) -> None:
+    header = f"{'endpoint':<52}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    total = errors = 0
+    for label in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[label])
+        total += len(values)
+        errors += recorder.errors[label]
+        print(f"{label:<52}{len(values):>8}{recorder.errors[label]:>8}{len(values) / elapsed:>9.1f}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+              f"{percentile(values, 99) * 1000:>9.1f}{values[-1] * 1000:>9.1f}")
+    print("-" * len(header))
+    print(f"{'total':<52}{total:>8}{errors:>8}{total / elapsed:>9.1f}")
+    for label, sample in recorder.samples.items():
+        print(f"  first error on {label}: {sample}")
+
+
+def use_fake_razorpay(latency_ms: float = 0.0) -> None:
+    """Serve the app's Razorpay client from fake_razorpay in-process."""
+    fake_razorpay.app.state.latency = latency_ms / 1000.0
+    rzp = razorpay_client.get_razorpay_client()
+    rzp._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_razorpay.app), base_url=rzp.base_url,
+                                    auth=rzp._auth)
+
+
+async def main_async(args) -> None:
+    db = FakeDatabase(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    ids = seed(db, users=args.users, certifications=args.certifications, questions=args.questions)
+    if not args.no_rpc:
+        register_sql_functions(db)
+    install(db)
+
+    use_fake_razorpay(args.razorpay_latency_ms)
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                     limits=limits, timeout=60) as client:
+            rng = random.Random(args.seed)
+            # distinct students while there are enough: two users paying for one open order is a real 409
+            students = rng.sample(ids["users"], len(ids["users"]))
+            users = [VirtualUser(client, recorder, ids, random.Random(rng.random()), students[i % len(students)])
+                     for i in range(args.concurrency)]
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*(u.run(args.mix, deadline) for u in users))
+            elapsed = time.perf_counter() - started
+        queries = db.queries
+    requests = sum(len(v) for v in recorder.latencies.values())
+    print(f"concurrency={args.concurrency} duration={elapsed:.1f}s db latency={args.latency_ms}ms "
+          f"(+/-{args.jitter_ms}) rpc={'off' if args.no_rpc else 'on'} razorpay latency={args.razorpay_latency_ms}ms mix={args.mix}")
+    report(recorder, elapsed)
+    print(f"db queries: {queries} ({queries / max(requests, 1):.2f} per request, includes outbox/buffer flushes)")
+    print(f"razorpay orders created: {len(fake_razorpay.orders)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="injected latency per DB query")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter on the DB latency")
+    parser.add_argument("--razorpay-latency-ms", type=float, default=50.0, help="injected latency per order creation")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("exam=5,payment=2,admin=1"),
+                        help="flow weights, e.g. exam=5,payment=2,admin=1")
+    parser.add_argument("--no-rpc", action="store_true", help="leave the SQL functions out to load the fallback paths")
+    parser.add_argument("--users", type=int, default=200, help="seeded students")
+    parser.add_argument("--certifications", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=20, help="questions per certification")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -62,3 +62,220 @@ create table if not exists proctor_events (
   metadata jsonb,
   created_at timestamptz default now()
 );
+
+-- Admin dashboard aggregates in one round trip (used by GET /admin/analytics).
+-- plpgsql so the function can be created before the optional `transactions` table exists.
+create or replace function analytics_snapshot()
+returns json
+language plpgsql
+stable
+as $$
+declare
+  tx_count bigint := 0;
+  tx_revenue numeric := 0;
+  result json;
+begin
+  begin
+    select count(*), coalesce(sum(price), 0) into tx_count, tx_revenue from transactions;
+  exception when undefined_table then
+    tx_count := 0;
+  end;
+  select json_build_object(
+    'active_certifications_count', (select count(*) from certifications),
+    'attempts_under_review', (select count(*) from attempts where status = 'under_review'),
+    'revenue', case when tx_count > 0 then tx_revenue
+                    else (select coalesce(sum(amount), 0) from purchases where status = 'paid') end
+  ) into result;
+  return result;
+end;
+$$;
+
+create index if not exists attempts_status_idx on attempts (status);
+create index if not exists purchases_status_idx on purchases (status);
+
+-- At most one open (unpaid) purchase per (user, certification), so /payments/create_order
+-- reuses it from any worker and concurrent first calls cannot both insert. Older duplicates
+-- are set aside as 'superseded'; they stay payable through /payments/verify and the webhook.
+update purchases p
+   set status = 'superseded'
+ where p.status = 'created'
+   and exists (select 1 from purchases q
+                where q.user_id = p.user_id and q.certification_id = p.certification_id and q.status = 'created'
+                  and (q.created_at, q.id::text) > (p.created_at, p.id::text));
+create unique index if not exists purchases_open_order_idx on purchases (user_id, certification_id) where status = 'created';
+
+-- Submitted answers ({question_id: selected_option}) so exams can be regraded.
+alter table attempts add column if not exists answers jsonb;
+
+-- Bulk score write-back for POST /exams/admin/{exma_id}/regrade: [{"id": ..., "score": ...}, ...]
+create or replace function bulk_update_attempt_scores(scores jsonb)
+returns integer
+language sql
+as $$
+  with updated as (
+    update attempts a
+       set score = (s->>'score')::numeric
+      from jsonb_array_elements(scores) s
+     where a.id::text = s->>'id'
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
+
+-- Certificate eligibility index: one row per (user, certification) with a passing
+-- attempt, maintained by PUT /exams/{exma_id}. Ids are text because some clients
+-- store the certification title rather than its uuid on attempts.
+create table if not exists certificate_eligibility (
+  user_id text not null,
+  certification_id text not null,
+  best_score numeric not null,
+  attempt_id text,
+  updated_at timestamptz default now(),
+  primary key (user_id, certification_id)
+);
+
+-- passes = [{"user_id", "certification_id", "best_score", "attempt_id"}, ...]; keeps the best score.
+drop function if exists record_certificate_eligibility(text, text, numeric, text);
+create or replace function record_certificate_eligibility(passes jsonb)
+returns integer
+language sql
+as $$
+  with rows as (
+    insert into certificate_eligibility (user_id, certification_id, best_score, attempt_id)
+    select distinct on (x->>'user_id', x->>'certification_id')
+           x->>'user_id', x->>'certification_id', (x->>'best_score')::numeric, x->>'attempt_id'
+      from jsonb_array_elements(passes) x
+     order by x->>'user_id', x->>'certification_id', (x->>'best_score')::numeric desc
+    on conflict (user_id, certification_id) do update
+       set best_score = greatest(certificate_eligibility.best_score, excluded.best_score),
+           attempt_id = case when excluded.best_score > certificate_eligibility.best_score
+                             then excluded.attempt_id else certificate_eligibility.attempt_id end,
+           updated_at = now()
+    returning 1
+  )
+  select count(*)::integer from rows;
+$$;
+
+-- Purchases of passed (user, certification) pairs become 'issued' in one statement
+-- (outbox handler for completed attempts). pairs = [{"user_id", "certification_id"}, ...];
+-- ids that are not uuids (title-keyed attempts) cannot match a purchase and are skipped.
+create or replace function mark_purchases_issued(pairs jsonb)
+returns integer
+language sql
+as $$
+  with pair as (
+    select distinct (x->>'user_id')::uuid as user_id, (x->>'certification_id')::uuid as certification_id
+      from jsonb_array_elements(pairs) x
+     where x->>'user_id' ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$'
+       and x->>'certification_id' ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$'
+  ), rows as (
+    update purchases p
+       set status = 'issued'
+      from pair
+     where p.user_id = pair.user_id and p.certification_id = pair.certification_id
+    returning 1
+  )
+  select count(*)::integer from rows;
+$$;
+
+-- Backfill from completed attempts that already meet the pass mark (CERT_PASS_SCORE, default 75).
+insert into certificate_eligibility (user_id, certification_id, best_score, attempt_id)
+select distinct on (user_id::text, certification_id::text)
+       user_id::text, certification_id::text, score, id::text
+  from attempts
+ where status = 'completed' and score >= 75 and user_id is not null and certification_id is not null
+ order by user_id::text, certification_id::text, score desc
+on conflict (user_id, certification_id) do update
+   set best_score = greatest(certificate_eligibility.best_score, excluded.best_score);
+
+-- POST /payments/verify in one round trip: checks the purchase belongs to the order,
+-- marks it paid and records the transaction atomically. Replays of an already-paid
+-- purchase with the same payment id are a no-op. Returns {"error": ...} instead of
+-- raising for not_found / order_mismatch / already_paid so the API can map them.
+create or replace function verify_purchase_payment(
+  p_purchase_id text, p_order_id text, p_payment_id text, p_signature text,
+  p_mailid text, p_price integer default 1
+)
+returns json
+language plpgsql
+as $$
+declare
+  p purchases%rowtype;
+  cert_title text;
+begin
+  -- cast the parameter, not the column, so the lookup uses the primary key index
+  select * into p from purchases where id = p_purchase_id::uuid for update;
+  if not found then
+    return json_build_object('error', 'not_found');
+  end if;
+  if coalesce(p.razorpay_order_id, '') = '' or p.razorpay_order_id <> p_order_id then
+    return json_build_object('error', 'order_mismatch');
+  end if;
+  if p.status = 'paid' then
+    if p.razorpay_payment_id = p_payment_id then
+      return json_build_object('status', 'paid', 'purchase_id', p.id, 'user_id', p.user_id,
+                               'certification_id', p.certification_id, 'replayed', true);
+    end if;
+    return json_build_object('error', 'already_paid');
+  end if;
+
+  update purchases
+     set status = 'paid', razorpay_payment_id = p_payment_id, razorpay_signature = p_signature
+   where id = p.id;
+
+  select title into cert_title from certifications where id = p.certification_id;
+  begin
+    execute 'insert into transactions (mailid, price, course_title) values ($1, $2, $3)'
+      using p_mailid, p_price, cert_title;
+  exception when undefined_table then
+    null;
+  end;
+
+  return json_build_object('status', 'paid', 'purchase_id', p.id, 'user_id', p.user_id,
+                           'certification_id', p.certification_id, 'replayed', false);
+end;
+$$;
+
+-- Batched webhook reconciliation (POST /payments/webhook -> app/batching.py):
+-- events = [{"payment_id", "order_id", "email"}, ...]. Purchases not yet paid/issued
+-- for those orders are marked paid and get one transaction row each; already-paid
+-- purchases (e.g. confirmed through /payments/verify) are left alone, so replays
+-- are harmless. Returns the purchases newly marked paid as
+-- [{"purchase_id", "user_id", "certification_id", "email"}, ...] so the API can close their open orders.
+-- returned integer before; the return type cannot be changed in place
+drop function if exists reconcile_payment_events(jsonb);
+create or replace function reconcile_payment_events(events jsonb)
+returns json
+language plpgsql
+as $$
+declare
+  newly json;
+begin
+  with ev as (
+    select distinct on (e->>'order_id') e->>'order_id' as order_id, e->>'payment_id' as payment_id, e->>'email' as email
+      from jsonb_array_elements(events) e
+     where coalesce(e->>'order_id', '') <> ''
+     order by e->>'order_id'
+  ), paid as (
+    update purchases p
+       set status = 'paid', razorpay_payment_id = ev.payment_id
+      from ev
+     where p.razorpay_order_id = ev.order_id and coalesce(p.status, '') not in ('paid', 'issued')
+    returning p.id, p.user_id, p.certification_id, ev.email
+  )
+  select coalesce(json_agg(json_build_object('purchase_id', id, 'user_id', user_id,
+                                             'certification_id', certification_id, 'email', email)), '[]'::json)
+    into newly from paid;
+
+  begin
+    execute 'insert into transactions (mailid, price, course_title)
+             select x->>''email'', 1, c.title
+               from json_array_elements($1) x
+               left join certifications c on c.id::text = x->>''certification_id'''
+      using newly;
+  exception when undefined_table then
+    null;
+  end;
+  return newly;
+end;
+$$;